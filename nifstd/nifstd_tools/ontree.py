@@ -12,6 +12,7 @@ Options:
        --data-api=DAPI      Full url to SciGraph data api endpoint
     -k --key=APIKEY         apikey for SciGraph instance
     -p --port=PORT          port on which to run the server [default: 8000]
+    -c --commit-ttl=SECS    seconds a branch stays resolved to a commit [default: 600]
     -f --input-file=FILE    don't use SciGraph, load an individual file instead
     -o --outgoing           if not specified defaults to incoming
     -b --both               if specified goes in both directions
@@ -22,12 +23,16 @@ Options:
 
 import os
 import asyncio
+import threading
 import subprocess
+from time import monotonic
 from pprint import pformat
 from pathlib import Path
 from datetime import datetime
+from collections import OrderedDict
 from urllib.error import HTTPError
 from urllib.parse import parse_qs
+import requests
 import htmlfn as hfn
 from flask import (Flask,
                    url_for,
@@ -132,6 +137,105 @@ def graphFromGithub(link, verbose=False):
     return g
 
 
+class ResultCache:
+    """ Thread safe lru with an optional ttl in seconds. Concurrent
+        requests for the same key wait for one computation instead of
+        all computing it themselves. """
+
+    def __init__(self, maxsize=256, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        with self._lock:
+            if key in self._data:
+                stamp, value = self._data[key]
+                if self.ttl is None or monotonic() - stamp < self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+
+                del self._data[key]
+
+            event = self._inflight.get(key)
+            owner = event is None
+            if owner:
+                self.misses += 1
+                event = self._inflight[key] = threading.Event()
+
+        if not owner:
+            event.wait()
+            # if the owner failed then this will try again
+            return self.get(key, compute)
+
+        try:
+            value = compute()
+            with self._lock:
+                self._data[key] = monotonic(), value
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key)
+
+            event.set()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def info(self):
+        return dict(hits=self.hits, misses=self.misses,
+                    size=len(self._data), maxsize=self.maxsize, ttl=self.ttl)
+
+
+ontology_repo = 'SciCrunch/NIF-Ontology'
+# branches move so resolved commits expire, parsed graphs are
+# keyed by commit and never go stale, scigraph backed renders expire
+# the github api is unauthenticated and limited to 60 requests an hour
+commit_cache = ResultCache(maxsize=64, ttl=600)
+graph_cache = ResultCache(maxsize=16)
+render_cache = ResultCache(maxsize=512, ttl=3600)
+# {branch: commit} last successful resolution, used when the api fails
+resolved_commits = {}
+
+
+def resolveCommit(branch):
+    resp = requests.get(f'https://api.github.com/repos/{ontology_repo}/commits/{branch}',
+                        headers={'Accept': 'application/vnd.github.sha'},
+                        timeout=10)
+    resp.raise_for_status()
+    commit = resolved_commits[branch] = resp.text.strip()
+    return commit
+
+
+def graphFromGithubCached(branch, local_filepath, verbose=False):
+    """ returns graph, link, commit, if the branch cannot be resolved
+        the last commit it resolved to is used, commit is None if it
+        has never been resolved in which case nothing is cached """
+    try:
+        commit = commit_cache.get(branch, lambda: resolveCommit(branch))
+    except requests.exceptions.RequestException as e:
+        commit = resolved_commits.get(branch)
+        log.error(f'could not resolve {branch} using {commit} {e}')
+
+    ref = branch if commit is None else commit
+    link = f'https://github.com/{ontology_repo}/raw/{ref}/{local_filepath}'
+    if commit is None:
+        return graphFromGithub(link, verbose), link, commit
+
+    graph = graph_cache.get((commit, local_filepath),
+                            lambda: graphFromGithub(link, verbose))
+    return graph, link, commit
+
+
 collapse_apinat = [  # FIXME config?
     ['apinatomy:conveys', 'apinatomy:source'],
     ['apinatomy:conveys', 'apinatomy:target'],
@@ -148,7 +252,8 @@ collapse_apinat = [  # FIXME config?
 ]
 
 
-def sparc_dynamic(data_sgd, data_sgc, path, wgb, process=lambda coll, blob: blob):
+def sparc_dynamic(data_sgd, data_sgc, path, wgb, process=lambda coll, blob: blob,
+                  nocache_sgd=None):
     args = dict(request.args)
     if 'direction' in args:
         direction = args.pop('direction')
@@ -160,10 +265,10 @@ def sparc_dynamic(data_sgd, data_sgc, path, wgb, process=lambda coll, blob: blob
     else:
         format_ = None
 
-    if 'apinat' in path:  # FIXME bad hardcoded hack
-        _old_get = data_sgd._get
+    if 'apinat' in path and nocache_sgd is not None:  # FIXME bad hardcoded hack
+        # a separate client, swapping _get on a shared one races other requests
+        data_sgd = nocache_sgd
         try:
-            data_sgd._get = data_sgd._normal_get
             j = data_sgd.dispatch(path, **args)
         except ValueError as e:
             log.exception(e)
@@ -171,8 +276,6 @@ def sparc_dynamic(data_sgd, data_sgc, path, wgb, process=lambda coll, blob: blob
         except rHTTPError as e:
             log.exception(e)
             abort(e.response.status_code)  # DO NOT PASS ALONG THE MESSAGE
-        finally:
-            data_sgd._get = _old_get
     else:
         try:
             j = data_sgd.dispatch(path, **args)
@@ -237,16 +340,35 @@ def sparc_dynamic(data_sgd, data_sgc, path, wgb, process=lambda coll, blob: blob
 
 def render(pred, root, direction=None, depth=10, local_filepath=None,
            branch='master', restriction=False, wgb='FIXME', local=False,
-           verbose=False, flatten=False,):
+           verbose=False, flatten=False, cache=True):
+    """ cached by query and source version, file backed queries are
+        keyed by commit, scigraph backed queries expire after a ttl """
+    graph = github_link = commit = None
+    if local_filepath is not None:
+        graph, github_link, commit = graphFromGithubCached(branch, local_filepath, verbose)
+
+    def compute():
+        return _render(pred, root, direction, depth, local_filepath,
+                       restriction, wgb, local, verbose, flatten,
+                       graph, github_link)
+
+    if not cache or local_filepath is not None and commit is None:
+        return compute()
+
+    source = 'scigraph' if local_filepath is None else commit
+    key = (pred, root, direction, depth, local_filepath, restriction,
+           wgb, local, flatten, source)
+    return render_cache.get(key, compute)
+
+
+def _render(pred, root, direction, depth, local_filepath, restriction,
+            wgb, local, verbose, flatten, graph, github_link):
 
     kwargs = {'local':local, 'verbose':verbose}
     prov = makeProv(pred, root, wgb)
     if local_filepath is not None:
-        github_link = ('https://github.com/SciCrunch/NIF-Ontology/raw/'
-                       f'{branch}/{local_filepath}')
         prov.append('<link rel="http://www.w3.org/ns/prov#wasDerivedFrom" '
                     f'href="{github_link}">')
-        graph = graphFromGithub(github_link, verbose)
         qname = graph.namespace_manager._qhrm  # FIXME
         labels_index = {qname(s):str(o) for s, o in graph[:rdfs.label:]}
         if pred == 'subClassOf':
@@ -324,11 +446,7 @@ def render(pred, root, direction=None, depth=10, local_filepath=None,
 
             out = set(n for n in flatten_tree(extras.hierarchy))
 
-            try:
-                lrecs = Async()(deferred(safe_find)(n) for n in out)
-            except RuntimeError:
-                asyncio.set_event_loop(current_app.config['loop'])
-                lrecs = Async()(deferred(safe_find)(n) for n in out)
+            lrecs = Async()(deferred(safe_find)(n) for n in out)
 
             rows = sorted(((r['labels'][0] if r['labels'] else '')
                            + ',' + n for r, n in zip(lrecs, out)
@@ -465,10 +583,12 @@ def server(api_key=None, verbose=False, data_endpoint=None):
         from pyontutils import scigraph as scigraphd
 
     data_sgd = scigraphd.Dynamic(cache=True, verbose=True, do_error=True)
+    data_sgd_nocache = scigraphd.Dynamic(cache=False, verbose=True, do_error=True)
     data_sgc = scigraphd.Cypher(cache=True, verbose=True)
 
     if data_endpoint:
         data_sgd._basePath = _dataBP
+        data_sgd_nocache._basePath = _dataBP
         data_sgc._basePath = _dataBP
 
     f = Path(__file__).resolve()
@@ -724,11 +844,11 @@ def server(api_key=None, verbose=False, data_endpoint=None):
         else:
             process = simplify
 
-        return sparc_dynamic(data_sgd, data_sgc, path, wgb, process)
+        return sparc_dynamic(data_sgd, data_sgc, path, wgb, process, data_sgd_nocache)
 
     @app.route(f'/{basename}/sparc/dynamic/<path:path>', methods=['GET'])
     def route_sparc_dynamic(path):
-        return sparc_dynamic(data_sgd, data_sgc, path, wgb)
+        return sparc_dynamic(data_sgd, data_sgc, path, wgb, nocache_sgd=data_sgd_nocache)
 
     @app.route(f'/{basename}/dynamic/<path:path>', methods=['GET'])
     def route_dynamic(path):
@@ -853,17 +973,22 @@ def server(api_key=None, verbose=False, data_endpoint=None):
                 return abort(404)
             journey = journey[tier2]
 
-        hyp_rows = hyperlink_tree(journey)
+        def compute():
+            hyp_rows = hyperlink_tree(journey)
+            return hfn.htmldoc(
+                hfn.render_table(hyp_rows),
+                title = 'Terms for ' + (tier2 if tier2 is not None else tier1),
+                metas = ({'name':'date', 'content':time()},),
+            )
 
-        return hfn.htmldoc(
-            hfn.render_table(hyp_rows),
-            title = 'Terms for ' + (tier2 if tier2 is not None else tier1),
-            metas = ({'name':'date', 'content':time()},),
-        )
+        return render_cache.get(('sparc-view', tier1, tier2), compute)
 
     @app.route(f'/{basename}/sparc/view', methods=['GET'])
     @app.route(f'/{basename}/sparc/view/', methods=['GET'])
     def route_sparc_view():
+        return render_cache.get(('sparc-view',), sparc_view_main)
+
+    def sparc_view_main():
         hyp_rows = []
         spaces = hfn.nbsp * 8
         for tier1, tier2_on in sorted(sparc_view.items()):
@@ -1105,6 +1230,7 @@ def main():
     if verbose:
         log.setLevel('DEBUG')
 
+    commit_cache.ttl = float(args['--commit-ttl'])
     if args['--test']:
         test()
     elif args['server']:
@@ -0,0 +1,78 @@
+import time
+import threading
+import unittest
+import pytest
+import requests
+pytest.importorskip('flask')
+from nifstd_tools import ontree
+from nifstd_tools.ontree import ResultCache
+
+
+class TestResultCache(unittest.TestCase):
+    def test_single_flight(self):
+        cache = ResultCache()
+        calls = []
+        def compute():
+            calls.append(None)
+            time.sleep(0.1)
+            return 'value'
+
+        threads = [threading.Thread(target=cache.get, args=('key', compute))
+                   for _ in range(10)]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+        assert len(calls) == 1, calls
+        assert cache.info()['hits'] == 9, cache.info()
+
+    def test_lru(self):
+        cache = ResultCache(maxsize=2)
+        for key in 'abc':
+            cache.get(key, lambda: key)
+
+        assert list(cache._data) == ['b', 'c']
+
+    def test_ttl(self):
+        cache = ResultCache(ttl=0.05)
+        cache.get('key', lambda: 1)
+        time.sleep(0.1)
+        assert cache.get('key', lambda: 2) == 2
+
+    def test_error_not_cached(self):
+        cache = ResultCache()
+        def fail():
+            raise ValueError('oops')
+
+        try:
+            cache.get('key', fail)
+            raise AssertionError('should have failed')
+        except ValueError:
+            pass
+
+        assert cache.get('key', lambda: 1) == 1
+
+
+class TestResolveCommit(unittest.TestCase):
+    def setUp(self):
+        def fail(branch):
+            raise requests.exceptions.ConnectionError('api down')
+
+        for name, value in (('resolveCommit', fail),
+                            ('graphFromGithub', lambda link, verbose: link)):
+            self.addCleanup(setattr, ontree, name, getattr(ontree, name))
+            setattr(ontree, name, value)
+
+        self.addCleanup(ontree.resolved_commits.pop, 'test-branch', None)
+        ontree.commit_cache.clear()
+        ontree.graph_cache.clear()
+
+    def test_fallback_last_commit(self):
+        ontree.resolved_commits['test-branch'] = 'abc123'
+        graph, link, commit = ontree.graphFromGithubCached('test-branch', 'ttl/x.ttl')
+        assert commit == 'abc123'
+        assert '/raw/abc123/' in link and graph == link
+
+    def test_fallback_branch(self):
+        graph, link, commit = ontree.graphFromGithubCached('test-branch', 'ttl/x.ttl')
+        assert commit is None
+        assert '/raw/test-branch/' in link
+        assert not ontree.graph_cache._data
@@ -1,10 +1,12 @@
 import math
+import queue
 import asyncio
-from time import time, sleep
+import threading
+from time import sleep, perf_counter
 from functools import wraps
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import nest_asyncio
-from .utils_fast import chunk_list, log
+from .utils_fast import log
 
 
 def async_getter(function, listOfArgs):
@@ -35,97 +37,229 @@ def deferred(function):
 
 
 try:
-    nest_asyncio.apply()
+    nest_asyncio.apply()  # async_getter still runs its own loop
 except Exception as e:
     log.exception(e)
 
 
-def Async(rate=None, debug=False, collector=None):  # ah conclib
-
-    # FIXME can't break this with C-c
-    if rate:
-        workers = math.ceil(rate) if rate < 40 else 40
-        # 40 comes from the TPE default 5 * cpu cores, this has not been tuned
-        executor = ThreadPoolExecutor(max_workers=workers)
-    else:
-        executor = ThreadPoolExecutor()
-        workers = executor._max_workers
-
-    if debug:
-        print(rate, workers)
-
-    def inner(generator):
-        #Async(rate=rate/2, debug)(funclist[])
-        #funclist = list(generator)
-        # the real effective throughput I am seeing per os thread is ~350Hz
-        # I can push it to about 400Hz setting it to run at 3000Hz with 3000
-        # entries but this is trivial to double using multiple processes
-        # pushing the set rate higher does seem to max out around 400Hz if
-        # the min time_per_job < our trouble threshold which is ping dependent
-        #Parallel(generator)
-        if rate:
-            funclist = list(generator)
-            if not funclist:
-                return tuple()  # make sure the result is always iterable
-
-            # divide by workers not rate, time_per_job will compensate
-            size = math.ceil(len(funclist) / workers) if rate >= 1 else 1
-            time_est = len(funclist) / rate
-            chunks = chunk_list(funclist, size)
-            lc = len(chunks)
-            log.info(f'Time estimate: {time_est}    rate: {rate}Hz    '
-                     f'func: {funclist[0]}    args: {len(funclist)}    '
-                     f'chunks: {lc}    size: {size}')
-            generator = (lambda _c=chunk, _i=i: list(limited_gen(
-                _c, smooth_offset=(_i % lc)/lc, time_est=time_est,
-                debug=debug, thread=_i))
-                         for i, chunk in enumerate(sorted(chunks, key=len, reverse=True)))
-
-        async def future_loop(future_):
-            loop = asyncio.get_event_loop()
-            futures = []
-            for wrapped_func_or_limgen in generator:
-                future = loop.run_in_executor(executor, wrapped_func_or_limgen)
-                futures.append(future)
-            log.debug('Futures compiled')
-            responses = []
-            for f in futures:
-                if rate:
-                    responses.extend(await f)
-                else:
-                    responses.append(await f)
-            future_.set_result(responses)
-
-        future = asyncio.Future()
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(future_loop(future))
-        return future.result()
-
-    return inner
-
-
-def limited_gen(chunk, smooth_offset=0, time_est=None, debug=True, thread='_'):
-    cumulative_delta = 0
-    time_alloted = 0
-    time_per_job = (time_est - smooth_offset) / len(chunk)
-    if debug: print(f'{thread:0>2}    offset: {smooth_offset:<.4f}    '
-                    f'jobs: {len(chunk)}    s/job: {time_per_job:<.4f}    '
-                    f'total: {time_est:<.4f}s')
-    if smooth_offset:
-        sleep(smooth_offset)
-    real_start = time()
-    for element in chunk:
-        real_stop = time_per_job + real_start
-        real_start += time_per_job
-        yield element()
-        stop = time()
+class TokenBucket:
+    """ Thread safe token bucket, rate tokens per second up to burst. """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = perf_counter()
+        self._lock = threading.Lock()
+
+    def _take(self):
+        """ take a token or return how long to wait for one """
+        with self._lock:
+            now = perf_counter()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, stop=None):
+        while True:
+            delay = self._take()
+            if not delay:
+                return True
+            elif stop is not None:
+                if stop.wait(delay):
+                    return False
+            else:
+                sleep(delay)
+
+
+_pool_size = 40  # 5 * cpu cores, this has not been tuned
+_pools = {}
+_pools_lock = threading.Lock()
+_local = threading.local()
+_loop = None
+
+
+def _pool(depth):
+    """ long lived pools, one per nesting depth so that jobs that call
+        Async themselves can never deadlock waiting on their own pool """
+    with _pools_lock:
+        if depth not in _pools:
+            _pools[depth] = ThreadPoolExecutor(max_workers=_pool_size,
+                                               thread_name_prefix=f'async-{depth}')
+        return _pools[depth]
+
+
+def _event_loop():
+    """ a single background loop that runs all coroutine jobs """
+    global _loop
+    with _pools_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, daemon=True,
+                             name='async-loop').start()
+        return _loop
+
+
+class Async:
+    """ Run zero argument callables or coroutines concurrently.
+
+        Async(rate=10)(deferred(f)(x) for x in xs) returns the results in
+        order, Async(rate=10).stream(jobs, ordered=False) yields them as
+        they complete.
+        rate is enforced with a token bucket, and closing the stream or
+        C-c cancels everything that has not started yet. """
+
+    def __init__(self, rate=None, debug=False, collector=None, burst=1, ordered=True):
+        self.workers = (min(math.ceil(rate), _pool_size) if rate else _pool_size)
+        self.rate = rate
+        self.debug = debug
+        self.collector = collector  # list that receives (thread, job, start, stop)
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.ordered = ordered
+        self._lock = threading.Lock()
+        self._reset()
         if debug:
-            print(f'{thread:<3} {stop:<8f} {real_stop:<10f}     '
-                  f'{stop - real_stop:<10f}')
-        if stop > real_stop:
-            sleep(0)  # give the thread a chance to yield
-            continue
-        else:
-            sleep_time = real_stop - stop
-            #if debug: print(f'{thread:<3} {stop:<8f} {real_stop:<10f} {sleep_time:<10f}')
-            sleep(sleep_time)
+            print(rate, self.workers)
+
+    def _reset(self):
+        self._latency = [0, 0]  # total, count
+        self.stats = dict(submitted=0, completed=0, failed=0, cancelled=0,
+                          elapsed=0, throughput=0, latency_mean=0, latency_max=0)
+
+    def __call__(self, generator):
+        return list(self.stream(generator, ordered=True))
+
+    def _submit(self, job, depth, index):
+        if asyncio.iscoroutine(job) or asyncio.iscoroutinefunction(job):
+            coro = job if asyncio.iscoroutine(job) else job()
+            async def timed():
+                start = perf_counter()
+                try:
+                    return await coro
+                finally:
+                    stop = perf_counter()
+                    self._record(index, start, stop)
+
+            return asyncio.run_coroutine_threadsafe(timed(), _event_loop())
+
+        def timed():
+            _local.depth = depth + 1
+            start = perf_counter()
+            try:
+                return job()
+            finally:
+                stop = perf_counter()
+                self._record(index, start, stop)
+
+        return _pool(depth).submit(timed)
+
+    def _record(self, index, start, stop):
+        latency = stop - start
+        with self._lock:
+            self._latency[0] += latency
+            self._latency[1] += 1
+            self.stats['latency_max'] = max(self.stats['latency_max'], latency)
+            if self.collector is not None:
+                self.collector.append((threading.current_thread().name,
+                                       index, start, stop))
+
+    def stream(self, generator, ordered=None):
+        """ yield results as jobs complete, or in submission order if ordered """
+        ordered = self.ordered if ordered is None else ordered
+        self._reset()  # stats are per stream
+        stop = threading.Event()
+        slots = threading.BoundedSemaphore(self.workers)
+        submitted = queue.Queue()
+        done_feeding = object()
+        depth = getattr(_local, 'depth', 0)  # feed runs in its own thread
+
+        def feed():
+            try:
+                for index, job in enumerate(generator):
+                    while not slots.acquire(timeout=0.1):
+                        if stop.is_set():
+                            return
+
+                    if stop.is_set() or (self.bucket is not None and
+                                         not self.bucket.acquire(stop)):
+                        slots.release()
+                        return
+
+                    future = self._submit(job, depth, index)
+                    future.add_done_callback(lambda f: slots.release())
+                    self.stats['submitted'] += 1
+                    submitted.put((index, future))
+            except BaseException as e:
+                submitted.put(e)
+            finally:
+                submitted.put(done_feeding)
+
+        start = perf_counter()
+        feeder = threading.Thread(target=feed, daemon=True, name='async-feed')
+        feeder.start()
+        pending = {}
+        buffer = {}
+        next_index = 0
+        feeding = True
+        try:
+            while feeding or pending:
+                while True:
+                    try:
+                        item = submitted.get(block=not pending and feeding, timeout=0.1)
+                    except queue.Empty:
+                        break
+
+                    if item is done_feeding:
+                        feeding = False
+                        break
+                    elif isinstance(item, BaseException):
+                        raise item
+
+                    index, future = item
+                    pending[future] = index
+
+                if not pending:
+                    continue
+
+                finished, _ = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    index = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except BaseException:
+                        self.stats['failed'] += 1
+                        raise
+
+                    self.stats['completed'] += 1
+                    if ordered:
+                        buffer[index] = result
+                    else:
+                        yield result
+
+                while next_index in buffer:
+                    yield buffer.pop(next_index)
+                    next_index += 1
+        finally:
+            stop.set()
+            feeder.join(timeout=1)
+            while not submitted.empty():
+                item = submitted.get()
+                if isinstance(item, tuple):
+                    pending[item[1]] = item[0]
+
+            for future in pending:
+                if future.cancel():
+                    self.stats['cancelled'] += 1
+
+            s = self.stats
+            elapsed = perf_counter() - start
+            s['elapsed'] = elapsed
+            s['throughput'] = s['completed'] / elapsed if elapsed else 0
+            total, count = self._latency
+            s['latency_mean'] = total / count if count else 0
+            if self.debug:
+                log.info(f'Async stats {self.stats}')
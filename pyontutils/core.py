@@ -3,7 +3,9 @@ import os
 import re
 import json
 import yaml
+import time
 import types
+import pickle
 import gzip
 import zipfile
 import tempfile
@@ -23,7 +25,7 @@ from rdflib.extras import infixowl
 from ttlser import CustomTurtleSerializer, natsort
 from pyontutils import combinators as cmb
 from pyontutils import closed_namespaces as cnses
-from pyontutils.johnson import simple_cycles
+from pyontutils.johnson import simple_cycles, cyclic_components_iter
 from pyontutils.utils import (refile,
                               TODAY,
                               UTCNOW,
@@ -74,35 +76,148 @@ def standard_checks(graph):
     cardinality(rdfs.label)
 
 
-def build(*onts, fail=False, n_jobs=9, write=True):
-    """ Set n_jobs=1 for debug or embed() will crash. """
-    from joblib import Parallel, delayed  # importing in here saves 150ms
-    tail = lambda:tuple()
+_build_onts = None  # setup onts inherited by forked build workers
+
+
+def _build_make(i, fail, write):
+    """ run make in a worker and ship the graph back as ntriples
+        so that whole rdflib stores never have to be pickled
+
+        the prefixes bound on the graph and any instance attributes
+        that make added or rebound come back along with the triples,
+        attributes that cannot be pickled are logged and dropped """
+    ont = _build_onts[i]
+    before = {k: id(v) for k, v in vars(ont).items()}
+    start = time.perf_counter()
+    ont.make(fail=fail, write=write)
+    elapsed = time.perf_counter() - start
+    data = ont.graph.serialize(format='nt', encoding='utf-8')
+    namespaces = [(p, str(n)) for p, n in ont.graph.namespaces()]
+    state = {}
+    for k, v in vars(ont).items():
+        if k in ('graph', '_graph') or before.get(k) == id(v):
+            continue
+
+        try:
+            pickle.dumps(v)
+        except Exception as e:
+            log.warning(f'{ont.__class__.__name__}.{k} lost in build worker: {e}')
+            continue
+
+        state[k] = v
+
+    return data, namespaces, state, elapsed
+
+
+def _build_depends(onts, depends):
+    """ index the dependency dag, parcBridge depends on everything """
+    index = {ont: i for i, ont in enumerate(onts)}
+    deps = {i: set() for i in range(len(onts))}
+    for i, ont in enumerate(onts):
+        if ont.__name__ == 'parcBridge':
+            deps[i].update(j for j in range(len(onts)) if j != i)
+
+    if depends is not None:
+        for ont, reqs in depends.items():
+            for req in reqs:
+                if req not in index:
+                    raise ValueError(f'{ont} depends on {req} which is not being built')
+                deps[index[ont]].add(index[req])
+
+    # check for cycles before anything is scheduled
+    done, todo = set(), dict(deps)
+    while todo:
+        ready = [i for i, d in todo.items() if d <= done]
+        if not ready:
+            raise ValueError('dependency cycle between '
+                             f'{[onts[i].__name__ for i in todo]}')
+        for i in ready:
+            done.add(i)
+            todo.pop(i)
+
+    return deps
+
+
+def build(*onts, fail=False, n_jobs=9, write=True, depends=None):
+    """ Set n_jobs=1 for debug or embed() will crash.
+
+        depends maps an Ont class to the Ont classes that must be made
+        before it, parcBridge always waits for everything else.
+
+        When n_jobs > 1 each make runs in a worker forked from the
+        setup state, so a dependent only sees what its dependencies
+        wrote to disk, never their in memory graphs. Pass write=True
+        (the default) if dependents read the files their dependencies
+        write. """
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    import multiprocessing
+    global _build_onts
     lonts = len(onts)
     if lonts > 1:
         for i, ont in enumerate(onts):
-            if ont.__name__ == 'parcBridge':
-                onts = onts[:-1]
-                def tail(o=ont):
-                    return o.setup(),
-                if i != lonts - 1:
-                    raise ValueError('parcBridge should be built last to avoid weird errors!')
+            if ont.__name__ == 'parcBridge' and i != lonts - 1:
+                raise ValueError('parcBridge should be built last to avoid weird errors!')
+
+    deps = _build_depends(onts, depends)
     # ont_setup must be run first on all ontologies
     # or we will get weird import errors
-    if n_jobs == 1 or True:
-        return tuple(ont.make(fail=fail, write=write) for ont in
-                     tuple(ont.setup() for ont in onts) + tail())
-
-    # have to use a listcomp so that all calls to setup()
-    # finish before parallel goes to work
-    return Parallel(n_jobs=n_jobs)(delayed(o.make)(fail=fail, write=write)
-                                   for o in
-                                   #[ont_setup(ont) for ont in onts])
-                                   (tuple(Async()(deferred(ont.setup)()
-                                                  for ont in onts)) + tail()
-                                    if n_jobs > 1
-                                    else [ont.setup()
-                                          for ont in onts]))
+    setup = tuple(ont.setup() for ont in onts)
+    if n_jobs < 0:
+        n_jobs = os.cpu_count()
+
+    if (n_jobs == 1 or lonts == 1 or
+        'fork' not in multiprocessing.get_all_start_methods()):
+        out = []
+        for o in setup:
+            start = time.perf_counter()
+            out.append(o.make(fail=fail, write=write))
+            log.info(f'made {o.__class__.__name__} in {time.perf_counter() - start:.2f}s')
+
+        return tuple(out)
+
+    # workers are forked after setup so they inherit the prepared onts
+    _build_onts = setup
+    timings = {}
+    done, running = set(), {}
+    todo = set(deps)
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, lonts),
+                                 mp_context=multiprocessing.get_context('fork')) as exe:
+            while todo or running:
+                for i in sorted(i for i in todo if deps[i] <= done):
+                    todo.discard(i)
+                    running[exe.submit(_build_make, i, fail, write)] = i
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    i = running.pop(fut)
+                    try:
+                        data, namespaces, state, elapsed = fut.result()
+                    except BaseException:
+                        for f in running:
+                            f.cancel()
+
+                        raise
+
+                    o = setup[i]
+                    o.graph.remove((None, None, None))
+                    o.graph.parse(data=data, format='nt')
+                    for prefix, namespace in namespaces:
+                        if prefix not in o._graph.namespaces:
+                            o._graph.add_namespace(prefix, namespace)
+
+                    vars(o).update(state)
+                    timings[o.__class__.__name__] = elapsed
+                    done.add(i)
+                    log.info(f'made {o.__class__.__name__} in {elapsed:.2f}s')
+    finally:
+        _build_onts = None
+
+    total = time.perf_counter() - start
+    log.info(f'built {lonts} ontologies in {total:.2f}s '
+             f'({sum(timings.values()):.2f}s of make) with {n_jobs} jobs')
+    return setup
 
 
 def yield_recursive(s, p, o, source_graph):  # FIXME transitive_closure on rdflib.Graph?
@@ -1371,14 +1486,129 @@ class Edge(tuple):
         return self._blob
 
 
+class NamespaceIndex:
+    """ Bulk contraction of iris and expansion of curies.
+
+        Matches NamespaceManager.compute_qname(iri, generate=False), the
+        bound namespace for an iri is the longest one that is at least as
+        long as where split_uri would split it. Like the rdflib trie the
+        candidates are indexed by split namespace and then by length, so
+        contracting an iri is one split and a few dict lookups. """
+
+    # ascii fast path for rdflib.namespace.split_uri, the leftmost start
+    # of the trailing run of name characters is where split_uri splits
+    _ascii_name = re.compile(r'[A-Za-z0-9_][A-Za-z0-9\-._%()]*$')
+    _invalid = re.compile('[' + re.escape(rdflib.term._invalid_uri_chars) + ']')
+
+    def __init__(self, namespaces, prefixes=None, maxsize=2 ** 20):
+        self.namespaces = dict(namespaces)  # prefix -> namespace
+        if prefixes is None:
+            prefixes = {str(n):p for p, n in self.namespaces.items()}
+
+        self.prefixes = dict(prefixes)  # namespace -> prefix
+        self.maxsize = maxsize
+        self._cache = {}
+        self._candidates = {}  # split namespace -> [(length, {namespace: prefix}), ...]
+
+    def _split(self, iri):
+        if iri.isascii() and not iri.startswith(rdflib.namespace.XMLNS):
+            match = self._ascii_name.search(iri)
+            if match and match.start():
+                return match.start()
+
+        try:
+            namespace, _ = rdflib.namespace.split_uri(iri)
+            return len(namespace)
+        except ValueError:
+            # only the whole iri bound as a namespace can match
+            return len(iri)
+
+    def _contract(self, iri):
+        iri = str(iri)
+        if self._invalid.search(iri):
+            return
+
+        split = iri[:self._split(iri)]
+        try:
+            candidates = self._candidates[split]
+        except KeyError:
+            by_length = defaultdict(dict)
+            for n, p in self.prefixes.items():
+                if n.startswith(split):
+                    by_length[len(n)][n] = p
+
+            candidates = self._candidates[split] = sorted(by_length.items(), reverse=True)
+
+        for length, prefixes in candidates:
+            prefix = prefixes.get(iri[:length])
+            if prefix is not None:
+                name = iri[length:]
+                return ':'.join((prefix, name)) if prefix else name
+
+    def qnames(self, iris):
+        """ list of qnames for iris, None where there is no bound prefix """
+        cache = self._cache
+        out = []
+        for iri in iris:
+            try:
+                out.append(cache[iri])
+            except KeyError:
+                if len(cache) >= self.maxsize:
+                    cache.clear()
+                    self._candidates.clear()
+
+                qname = cache[iri] = self._contract(iri)
+                out.append(qname)
+
+        return out
+
+    def qname(self, iri):
+        qname, = self.qnames((iri,))
+        if qname is None:
+            raise KeyError(f'No known prefix for {iri}')
+
+        return qname
+
+    def expands(self, curies):
+        """ list of iris for curies, None where the prefix is unknown """
+        namespaces = self.namespaces
+        out = []
+        for curie in curies:
+            prefix, colon, suffix = curie.partition(':')
+            namespace = namespaces.get(prefix) if colon else None
+            out.append(None if namespace is None else namespace + suffix)
+
+        return out
+
+
 class BetterNamespaceManager(rdflib.namespace.NamespaceManager):
 
+    _index = None
+
     def __init__(self, *args, bind_namespaces='core', **kwargs):
         try:
             super().__init__(*args, bind_namespaces=bind_namespaces, **kwargs)
         except TypeError as e:
             super().__init__(*args, **kwargs)
 
+    @property
+    def index(self):
+        """ NamespaceIndex for the current bindings, rebuilt after bind """
+        if self._index is None:
+            namespaces = dict(self.namespaces())
+            prefixes = {str(n):self.store.prefix(n) for n in namespaces.values()}
+            self._index = NamespaceIndex(namespaces, prefixes)
+
+        return self._index
+
+    def bind(self, *args, **kwargs):
+        self._index = None
+        return super().bind(*args, **kwargs)
+
+    def reset(self):
+        self._index = None
+        return super().reset()
+
     def __call__(self, **kwargs):
         """ set prefixes """
         raise NotImplementedError
@@ -1393,12 +1623,12 @@ class BetterNamespaceManager(rdflib.namespace.NamespaceManager):
         if ':' not in curie:
             raise ValueError(f'{curie} is not a curie!')
 
-        prefix, suffix = curie.split(':', 1)
-        namespace = self.store.namespace(prefix)
-        if namespace is None:
-            return  # TODO do we want to raise an error here? probably?
+        iri, = self.index.expands((curie,))
+        return iri  # TODO do we want to raise an error on None here? probably?
 
-        return namespace + suffix
+    def expands(self, curies):
+        """ bulk expand, None for unknown prefixes or things that are not curies """
+        return self.index.expands(curies)
 
     def _qhrm(self, node):  # FIXME what the heck is this thing ... asPython????
         """ WARNING experimental """
@@ -1416,11 +1646,11 @@ class BetterNamespaceManager(rdflib.namespace.NamespaceManager):
 
     def qname(self, iri):
         # a version of normalizeUri that fails if no prefix is available
-        prefix, namespace, name = self.compute_qname(iri, generate=False)
-        if prefix == "":
-            return name
-        else:
-            return ":".join((prefix, name))
+        return self.index.qname(iri)
+
+    def qnames(self, iris):
+        """ bulk qname, None where no prefix is available """
+        return self.index.qnames(iris)
 
     def normalizeUri(self, iri):
         # FIXME the core rdflib normalizeUri implementation is incorrect now ...
@@ -1498,6 +1728,20 @@ class OntGraph(rdflib.Graph):
     # NOTE you actually just use it the other way by passing this
     # to OntCuries.populate
 
+    _subject_identities = None  # {idbn_class: {subject: identity}}
+
+    def add(self, triple):
+        self._subject_identities = None
+        return super().add(triple)
+
+    def addN(self, quads):
+        self._subject_identities = None
+        return super().addN(quads)
+
+    def remove(self, triple):
+        self._subject_identities = None
+        return super().remove(triple)
+
     @oq.utils.mimicArgs(rdflib.Graph.parse)
     def parse(self, *args, **kwargs):
         if not args and not kwargs and self.path is not None:
@@ -1782,6 +2026,14 @@ class OntGraph(rdflib.Graph):
         return g, ibn
 
     def subjectIdentity(self, subject, *, idbn_class=None, debug=False):
+        if self._subject_identities and not debug:
+            if idbn_class is None:
+                idbn_class = self.IdentityBNode
+
+            sids = self._subject_identities.get(idbn_class, {})
+            if subject in sids:
+                return sids[subject]
+
         return self.subjectEmbeddedIdentity(subject, idbn_class=idbn_class, debug=debug)
         #raise NotImplementedError('subject identity is ambiguous use subjectCondensedIdentity or subjectEmbeddedIdentity instead')
         # XXX NOTE subjectIdentity and subjectGraphIdentity are NOT the same thing!
@@ -1858,6 +2110,32 @@ class OntGraph(rdflib.Graph):
 
         return ibn
 
+    def subjectIdentities(self, *, idbn_class=None):
+        """ subjectIdentity for all named subjects in one pass over the graph
+            so that bnode closures are only hashed once, the result is cached
+            on the graph until the next add or remove """
+        if idbn_class is None:
+            idbn_class = self.IdentityBNode
+
+        if self._subject_identities is None:
+            self._subject_identities = {}
+        elif idbn_class in self._subject_identities:
+            return self._subject_identities[idbn_class]
+
+        subjects = set(self.named_subjects())
+        try:
+            # the graph as a whole is never cached by identity
+            # so a changed graph is always rehashed
+            sids = idbn_class.embedded_identities(self, subjects)
+        except NotImplementedError:
+            # bnode cycles somewhere in the graph, only the subjects
+            # whose own closures contain the cycles can fail
+            sids = {s: self.subjectEmbeddedIdentity(s, idbn_class=idbn_class)
+                    for s in subjects}
+
+        self._subject_identities[idbn_class] = sids
+        return sids
+
     def subjectEmbeddedGraphIdentity(self, subject, *, idbn_class=None, debug=False):
         g, ibn = self._si_internal(subject, idbn_class=idbn_class, debug=debug)
         return ibn
@@ -2015,8 +2293,8 @@ class OntGraph(rdflib.Graph):
 
         # FIXME cases where we have :a a owl:Class . :b a owl:Class .
         # in a single graph
-        sid = {self.subjectIdentity(s):s for s in set(self.named_subjects())}
-        oid = {other_graph.subjectIdentity(s):s for s in set(other_graph.named_subjects())}
+        sid = {i:s for s, i in self.subjectIdentities().items()}
+        oid = {i:s for s, i in other_graph.subjectIdentities().items()}
         # FIXME triples output vs map?
         mapping = {s:oid[identity] for identity, s in sid.items()
                    if identity in oid and oid[identity] != s}
@@ -2052,8 +2330,8 @@ class OntGraph(rdflib.Graph):
                             #ilxtr.hasTemporaryId,
                             #o) for s, o in self[:ilxtr.hasTemporaryId:]]
 
-        sid = {s:self.subjectIdentity(s) for s in set(self.named_subjects())}
-        osid = {s:other_graph.subjectIdentity(s) for s in set(other_graph.named_subjects())}
+        sid = self.subjectIdentities()
+        osid = other_graph.subjectIdentities()
         ssid = set(sid)
         sosid = set(osid)
         added = not_in_other = ssid - sosid
@@ -2308,28 +2586,38 @@ class OntGraph(rdflib.Graph):
 
         return self
 
-    def _genNodesEdges(self, triples_gen, label_predicate):
-        nodes = []
-        edges = []
-        done = set()
+    def _oboGraphLookups(self, label_predicate):
+        """ labels and deprecation for every subject in one pass each
+            instead of two index lookups per node """
+        labels = {}
+        for s, o in self[:label_predicate:]:
+            if s not in labels:
+                labels[s] = o.toPython()
+
+        deprecated = {s:o.toPython() for s, o in self[:owl.deprecated:]}
+        return labels, deprecated
+
+    def _iterNodesEdges(self, triples_gen, label_predicate):
+        """ yield ('edges', edge) as triples are consumed and then
+            ('nodes', node) for every distinct node in first seen order """
+        labels, deprecated = self._oboGraphLookups(label_predicate)
+        qhrm = self.namespace_manager._qhrm
+        ids = {}  # also the ordered set of nodes
         for t in triples_gen:
-            edge = Edge(t)
-            edges.append(edge.asOboGraph(self.namespace_manager))
-            for e in t:
-                if e in done:
-                    continue
-
-                done.add(e)
+            sub, pred, obj = [ids[e] if e in ids else ids.setdefault(e, qhrm(e))
+                              for e in t]
+            yield 'edges', {'sub': sub, 'pred': pred, 'obj': obj}
 
-                try:
-                    lbl = next(self[e:label_predicate]).toPython()
-                except StopIteration:
-                    lbl = e.toPython()
+        dep = owl.deprecated.toPython()
+        for e, id in ids.items():
+            meta = {dep: deprecated[e]} if e in deprecated else {}
+            yield 'nodes', {'id': id, 'lbl': labels.get(e, e.toPython()), 'meta': meta}
 
-                meta = {owl.deprecated.toPython():o.toPython() for o in self[e:owl.deprecated]}
-                node = {'id': self.namespace_manager._qhrm(e),
-                        'lbl': lbl, 'meta': meta}
-                nodes.append(node)
+    def _genNodesEdges(self, triples_gen, label_predicate):
+        nodes = []
+        edges = []
+        for kind, blob in self._iterNodesEdges(triples_gen, label_predicate):
+            (nodes if kind == 'nodes' else edges).append(blob)
 
         return nodes, edges
 
@@ -2343,39 +2631,70 @@ class OntGraph(rdflib.Graph):
 
         return cycle_participants
 
-    def cycle_check_long(self, btc_node=None):
-        # use jonhson simple cycle detection because doing anything else is stupid
-        # tarjan scc doesn't work by itself in this case
+    def _cycle_candidates(self):
+        """ the node graph over triples that touch a bnode subject, these
+            are the only triples checked, nodes get integer ids and the
+            triples themselves are not copied into any other index """
         atrisk = set(s for s in self.subjects(unique=True) if isinstance(s, rdflib.BNode))
-        objs = defaultdict(list)
-        incoming = defaultdict(list)
-        lu = {}  #  FIXME TODO make a lowmem version
-        sos = set()
-        for i, t in enumerate(self):
-            lu[i] = t
+        ids = {}
+        triples = []
+        graph = {}  # node id -> set of node ids
+        for t in self:
             s, p, o = t
             if s in atrisk or o in atrisk:
-                incoming[o].append(i)
+                si = ids.setdefault(s, len(ids))
+                oi = ids.setdefault(o, len(ids))
+                if si not in graph:
+                    graph[si] = set()
+                if oi not in graph:
+                    graph[oi] = set()
 
-                objs[s].append(i)
-                if s == o:
-                    sos.add(i)
+                graph[si].add(oi)
+                triples.append((t, si, oi))
 
-        g = {}
-        for s, trips_with_s_as_object in incoming.items():
-            # s p o       sao
-            #     o p o2  sas
-            trips_with_s_as_subject = objs[s]
-            for to in trips_with_s_as_object:
-                g[to] = [ts for ts in trips_with_s_as_subject if ts != to or ts in sos]
+        return triples, graph
 
-        _cycles = list(simple_cycles(g))
+    def cycle_check_long_any(self):
+        """ True as soon as any cycle is found, never enumerates them """
+        _, graph = self._cycle_candidates()
+        for scc in cyclic_components_iter(graph):
+            return True
 
-        cycles = [[lu[t] for t in c] for c in _cycles]
-        return cycles
+        return False
 
-    def asOboGraph(self, predicate=None, label_predicate=None, restriction=True):
-        """ supply a predicate to restrict the exported graph """
+    def cycle_check_long_iter(self):
+        """ yield cycles as lists of triples as they are found """
+        # use jonhson simple cycle detection because doing anything else is stupid
+        # tarjan scc doesn't work by itself in this case, but it does
+        # tell us which triples can be in a cycle at all, a triple can
+        # only be in a cycle if its subject and object are in the same scc
+        triples, graph = self._cycle_candidates()
+        component = {}
+        for i, scc in enumerate(cyclic_components_iter(graph)):
+            for v in scc:
+                component[v] = i
+
+        del graph
+        kept = [(t, si, oi) for t, si, oi in triples
+                if si in component and component[si] == component.get(oi)]
+        del triples, component
+        if not kept:
+            return
+
+        # vertices are triples, there is an edge from one triple to
+        # another when the object of the first is the subject of the second
+        by_subject = defaultdict(list)
+        for i, (t, si, oi) in enumerate(kept):
+            by_subject[si].append(i)
+
+        g = {i:by_subject[oi] for i, (t, si, oi) in enumerate(kept)}
+        for cycle in simple_cycles(g):
+            yield [kept[i][0] for i in cycle]
+
+    def cycle_check_long(self, btc_node=None):
+        return list(self.cycle_check_long_iter())
+
+    def _oboGraphTriples(self, predicate=None, label_predicate=None, restriction=True):
         if label_predicate is None:
             label_predicate = rdfs.label
         else:
@@ -2383,7 +2702,7 @@ class OntGraph(rdflib.Graph):
 
         restriction = predicate is not None and restriction
 
-        if isinstance(predicate, rdflib.URIRef):
+        if predicate is None or isinstance(predicate, rdflib.URIRef):
             pass
         elif predicate == 'isDefinedBy':
             predicate = self.namespace_manager.expand('rdfs:isDefinedBy')
@@ -2408,9 +2727,40 @@ class OntGraph(rdflib.Graph):
                    for p in (owl.someValuesFrom,)  # I don't think we would want all values from?
                    for o in self[s_bnode:p])
 
-        nodes, edges = self._genNodesEdges(gen, label_predicate)
+        return gen, label_predicate
+
+    def asOboGraph(self, predicate=None, label_predicate=None, restriction=True):
+        """ supply a predicate to restrict the exported graph """
+        nodes, edges = self._genNodesEdges(*self._oboGraphTriples(
+            predicate, label_predicate, restriction))
         return {'nodes': nodes, 'edges': edges}
 
+    def iterOboGraph(self, predicate=None, label_predicate=None, restriction=True):
+        """ asOboGraph as a stream of ('edges', edge) and then ('nodes', node) """
+        yield from self._iterNodesEdges(*self._oboGraphTriples(
+            predicate, label_predicate, restriction))
+
+    def writeOboGraph(self, file, predicate=None, label_predicate=None, restriction=True):
+        """ write asOboGraph json to a text file object incrementally,
+            edges come first so that only the node set is held in memory """
+        file.write('{"edges": [')
+        current = 'edges'
+        first = True
+        for kind, blob in self.iterOboGraph(predicate, label_predicate, restriction):
+            if kind != current:
+                file.write('],\n"nodes": [')
+                current = kind
+                first = True
+
+            file.write('\n' if first else ',\n')
+            file.write(json.dumps(blob))
+            first = False
+
+        if current == 'edges':
+            file.write('],\n"nodes": [')
+
+        file.write(']}\n')
+
     def fromTabular(self, rows, lifting_rule=None):
         pass
 
@@ -2560,9 +2910,9 @@ class makeGraph:
         if cull:
             cull_prefixes(self).write()
         else:
-            ser = self.g.serialize(format='nifttl', encoding='utf-8')
             with open(self.filename, 'wb') as f:
-                f.write(ser)
+                # stream directly to the file instead of materializing the output
+                self.g.serialize(f, format='nifttl', encoding='utf-8')
                 #print('yes we wrote the first version...', self.name)
 
     def expand(self, curie):
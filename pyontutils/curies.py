@@ -1,14 +1,63 @@
+import os
+import json
 import yaml
 from pathlib import Path
+from pyontutils import __version__
 from pyontutils.config import auth
 from pyontutils.utils_fast import log
 
+# bump if the layout of the compiled curies file changes
+compiled_version = f'{__version__}-1'
+
 
 def interlex_namespace(user):
     return 'http://uri.interlex.org/' + user
 
 
-def getCuries(curies_location):
+def compiledPath():
+    return Path(auth._pathit('{:user-cache-path}/pyontutils/curie_map.json'))
+
+
+def _stat(path):
+    stat = path.stat()
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def loadCompiled(curies_location, compiled_path):
+    """ read the curie map from the json compiled from curies_location
+        if the version matches and the source is unchanged, yaml
+        parsing is the single slowest part of importing namespaces """
+    try:
+        with open(compiled_path, 'rt') as f:
+            compiled = json.load(f)
+
+        if (compiled['version'] == compiled_version and
+            compiled['requested'] == str(curies_location) and
+            compiled['stat'] == _stat(Path(compiled['source']))):
+            return compiled['curies']
+
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+
+def writeCompiled(curies_location, source, curie_map, compiled_path):
+    compiled = {'version': compiled_version,
+                'requested': str(curies_location),
+                'source': str(source),
+                'stat': _stat(Path(source)),
+                'curies': curie_map,}
+    try:
+        compiled_path.parent.mkdir(parents=True, exist_ok=True)
+        temp = compiled_path.with_name(f'.{compiled_path.name}.{os.getpid()}')
+        with open(temp, 'wt') as f:
+            json.dump(compiled, f)
+
+        os.replace(temp, compiled_path)  # atomic so concurrent imports are safe
+    except OSError as e:
+        log.debug(f'could not write compiled curies {e}')
+
+
+def getCuries(curies_location, compiled_path=None):
     # FIXME this will 'fail' silently ...
     # probably need to warn?
     try:
@@ -17,6 +66,14 @@ def getCuries(curies_location):
                             '.config/pyontutils/curie_map.yaml '
                             'what have you done!?')
 
+        if compiled_path is None:
+            compiled_path = compiledPath()
+
+        curie_map = loadCompiled(curies_location, compiled_path)
+        if curie_map is not None:
+            return curie_map
+
+        requested = curies_location
         if not curies_location.exists():
             # windows pip user install madness probably
             log.warning(f'no curies_map.yaml found, searching')
@@ -40,10 +97,10 @@ def getCuries(curies_location):
 
                 _node = _node.parent
 
-        # TODO staleness check
         with open(curies_location, 'rt') as f:
-            curie_map = yaml.safe_load(f)
+            curie_map = yaml.load(f, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
 
+        writeCompiled(requested, curies_location, curie_map, compiled_path)
         return curie_map
 
     except (FileNotFoundError, NotADirectoryError) as e:
@@ -76,7 +133,7 @@ def getCuries(curies_location):
                     f.write(resp.text)
 
                 print(f'Wrote {clp} from {curies_url}')
-                return getCuries(curies_location)
+                return getCuries(curies_location, compiled_path)
 
             else:
                 raise requests.ConnectionError(resp.request, resp)
@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+import io
 import os
 import tempfile
 from copy import deepcopy
@@ -48,9 +49,29 @@ def alphasortkey(keyvalue):
     return natsort(key)
 
 
-def tcsort(item):  # FIXME SUCH WOW SO INEFFICIENT O_O
+def tcsizes(tree, sizes=None):
+    """ len of the transitive closure of every node in tree computed once
+        bottom up, keyed by id because subtrees are shared between parents """
+    if sizes is None:
+        sizes = {}
+
+    stack = [(tree, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if id(node) in sizes:
+            continue
+        elif expanded:
+            sizes[id(node)] = len(node) + sum(sizes[id(v)] for v in node.values())
+        else:
+            stack.append((node, True))
+            stack.extend((v, False) for v in node.values() if id(v) not in sizes)
+
+    return sizes
+
+
+def tcsort(item):
     """ get len of transitive closure assume type items is tree... """
-    return len(item[1]) + sum(tcsort(kv) for kv in item[1].items())
+    return tcsizes(item[1])[id(item[1])]
 
 
 def in_tree(node, tree):  # XXX TODO
@@ -125,7 +146,7 @@ def cycle_check(puta_end, start, graph):  # XXX use the flat_tree trick!
     return inner(start)
 
 
-def dematerialize(parent_name, parent_node):  # FIXME we need to demat more than just leaves!
+def dematerialize(parent_name, parent_node, _sizes=None):  # FIXME we need to demat more than just leaves!
     #FIXME still an issue: Fornix, Striatum, Diagonal Band
     """ Remove nodes higher in the tree that occur further down the
         SAME branch. If they occur down OTHER branchs leave them alone.
@@ -134,6 +155,8 @@ def dematerialize(parent_name, parent_node):  # FIXME we need to demat more than
     """
     lleaves = {}
     children = parent_node[parent_name]
+    if _sizes is None:
+        _sizes = tcsizes(children)
 
     if not children:  # children could be empty ? i think this only happens @ root?
         #print('at bottom', parent_name)
@@ -145,11 +168,11 @@ def dematerialize(parent_name, parent_node):  # FIXME we need to demat more than
                                           key=alphasortkey),
                                           #key=lambda a: f'{a[0]}'.split('>')[1] if '>' in f'{a[0]}' else f'a[0]'),
                                           #key=lambda a: a[0].split('>') if '>' in a[0] else a[0]),
-                                   key=tcsort))  # make sure we hit deepest first
+                                   key=lambda kv: _sizes[id(kv[1])]))  # make sure we hit deepest first
 
     for child_name, _ in children_ord:  # get list so we can go ahead and pop
         #print(child_name)
-        new_lleaves = dematerialize(child_name, children)
+        new_lleaves = dematerialize(child_name, children, _sizes)
         if child_name == 'magnetic resonance imaging':  # debugging failing demat
             pass
             #embed()
@@ -160,7 +183,8 @@ def dematerialize(parent_name, parent_node):  # FIXME we need to demat more than
                 #print('MATERIALIZATION DETECTED! LOWER PARENT:',
                       #lleaves[child_name],'ZAPPING!:', child_name,
                       #'OF PARENT:', parent_name)
-                children.pop(child_name)
+                popped = children.pop(child_name)
+                _sizes[id(children)] -= 1 + _sizes[id(popped)]
                 #print('cn', child_name, 'pn', parent_name, 'BOTTOM')
             #else:  # if it has NOT previously been identified as a leaf, add the parent!
                 #new_lleaves[child_name] = parent_name  # pass it back up to nodes above
@@ -178,123 +202,61 @@ class defaultdict(base_dd):
     __repr__ = dict.__repr__
 
 
+class RenderState:
+    """ mutable state for a single TreeNode.render call """
+
+    def __init__(self, sizes):
+        self.sizes = sizes
+        self.prefix = []
+        self.existing = {}
+        self.current_parent = None
+
+
 class TreeNode(defaultdict):  # FIXME need to factory this to allow separate trees!
 
     pad = '  '
-    #prefix = []
-    #existing = {}  # FIXME CAREFUL WITH THIS
-    #current_parent = None
     html_head = ''
 
     def print_tree(self, level = 0, html=False, hpr=None, tparent=None):
-        output = ''
+        output = io.StringIO()
+        self.render(output, level=level, html=html, hpr=hpr, tparent=tparent)
+        return output.getvalue()
+
+    def render(self, file, level=0, html=False, hpr=None, tparent=None):
+        """ write the tree to file in a single traversal, render state
+            lives on the call not the class so renders can run concurrently """
+        state = RenderState(tcsizes(self))
+        self._render(file.write, state, level, html, hpr, tparent)
 
+    def _render(self, write, state, level, html, hpr, tparent):
         if html:
-            # LOL PYTHON adding keywords to a language to try to fix broken scope?
-            # oops didn't work, can't shadow a global variable in local scope without
-            # also changing the outer scope OOPS, nonlocal doesn't work with globals derp
-            _MID_STEM = '<span title="{predicate}">' + MID_STEM + '</span>'  # LOL PYTHON
-            _BOT_STEM = '<span title="{predicate}">' + BOT_STEM + '</span>'  # LOL PYTHON
+            _MID_STEM = '<span title="{predicate}">' + MID_STEM + '</span>'
+            _BOT_STEM = '<span title="{predicate}">' + BOT_STEM + '</span>'
         else:
-            _MID_STEM = MID_STEM  # LOL PYTHON
-            _BOT_STEM = BOT_STEM  # LOL PYTHON
+            _MID_STEM = MID_STEM
+            _BOT_STEM = BOT_STEM
 
         if level == 0:
-            self.__class__.existing = {}  # clean up any old mess
             if len(self) == 1:
                 item = [k for k in self.keys()][0]
-                output += str(item)
-                self.__class__.current_parent = item
-                output += ''.join([v.print_tree(1, html, hpr, item) for v in self.values()])
-                #self.__class__.prefix.pop()  # FIXME causes errors???
-                self.__class__.existing = {}  # clean up new mess
-                self.__class__.current_parent = None
-                return output
+                write(str(item))
+                state.current_parent = item
+                for v in self.values():
+                    v._render(write, state, 1, html, hpr, item)
+
+                return
             elif len(self) > 1:  # FIXME need a way to pop the last prefix!
                 level = 1
-                output += '\n.'
+                write('\n.')
 
         if not self:
-            return output
-        elif len(self) > 1:  # not sure why we need this... :/
-            output += '\n'
-
-        self.__class__.prefix.append(_MID_STEM)
-
-        items = []
-
-        def switch(symboltype, key, value):
-            itparent = key
-            #if key in self.existing and type(value) == type(self):
-            if False:  # we deal with this by dematerializing the tree
-                #print('WEEEE MULTIPARENT!', items[-1], self.current_parent)
-                if len(value):
-                    parent = self.existing[key]
-                    __t = tree()
-                    #__t['MULTIPARENT, SEE: %s' % parent]
-                    __t['* %s *' % tcsort((None, value))]
-
-                    cend = self.__class__.prefix[-1]
-                    if cend == _MID_STEM:
-                        self.__class__.prefix[-1] = symboltype
-                    self.__class__.current_parent = key
-                    value = __t.print_tree(level, html, hpr, itparent)
-                    items.append((str(key), value))
-                    self.__class__.prefix[-1] = cend
-                else:
-                    items.append((str(key), ' *'))  # wait... how the hell...
-                return
-
-            first_occurance = True
-            if key in self.parent_dict:  # XXX FIXME XXX
-                if len(self.parent_dict[key]) > 1:  # XXX FIXME XXX parents not avail in m cases!
-                    #print('MORE THAN ONE PARENT')
-                    first_occurance = not key in self.existing
-                    self.existing[key] = self.current_parent
-                    key += ' *'  # mark that it will appear elsewhere
-
-            ds = ''
-            if type(value) == type(self):
-                cend = self.__class__.prefix[-1]
-                if cend == _MID_STEM:
-                    self.__class__.prefix[-1] = symboltype
-
-                self.__class__.current_parent = key
-                v = value.print_tree(level + 1, html, hpr, itparent)  # recurse here XXX
-
-                if html and v:
-                    if first_occurance:
-                        ds = '<details open=""><summary>'
-                    else:
-                        ds = '<details><summary>'
-
-                    key += '<span class="hide-when-open"> ... </span><br></summary>'
-                    v += '</details>'
+            return
 
-                self.__class__.prefix[-1] = cend
-
-            else:
-                v = str(value)
-
-            items.append((str(key), v, ds, itparent))
-
-        items_list = sorted(sorted(((f'{k}', v)  # XXX best
-                                    for k, v in self.items()),
-                                   key=alphasortkey),
-                            key=tcsort)
-
-        #items_list = [a for a in reversed(sorted([i for i in self.items()], key=tcsort))]
-        #items_list = [a for a in reversed(sorted([i for i in self.items()], key=lambda a: len(a[1])))]
-        #items_list = sorted([i for i in self.items()], key=lambda a: len(a[1]))
-        #items_list = sorted([i for i in self.items()])
-
-        for key, value in items_list[:-1]:
-            switch(BRANCH, key, value)
-
-        switch(BLANK, *items_list[-1])  # need to put blanks after _BOT_STEM
+        prefix = state.prefix
+        prefix.append(_MID_STEM)
 
         def pp(k):
-            out = ''.join(self.prefix)
+            out = ''.join(prefix)
             if html and hpr is not None and k:
                 if tparent is not None:
                     k1 = tparent.strip('*').strip()
@@ -313,24 +275,54 @@ class TreeNode(defaultdict):  # FIXME need to factory this to allow separate tre
 
             return out
 
-        output += '\n'.join(
-            ['{3}{0}{1}{2}'.format(pp(nk), k, v, ds, nk)
-             for k, v, ds, nk in items[:-1]])
-        self.__class__.prefix[-1] = _BOT_STEM
-        output += '\n' + '{3}{0}{1}{2}'.format(pp(items[-1][-1]), *items[-1])
+        sizes = state.sizes
+        items_list = sorted(sorted(((f'{k}', v)  # XXX best
+                                    for k, v in self.items()),
+                                   key=alphasortkey),
+                            key=lambda kv: sizes[id(kv[1])])
+
+        last = len(items_list) - 1
+        for i, (key, value) in enumerate(items_list):
+            # blanks go after _BOT_STEM
+            symboltype, stem = (BLANK, _BOT_STEM) if i == last else (BRANCH, _MID_STEM)
+            itparent = key
+            first_occurance = True
+            if key in self.parent_dict:  # XXX FIXME XXX
+                if len(self.parent_dict[key]) > 1:  # XXX FIXME XXX parents not avail in m cases!
+                    first_occurance = not key in state.existing
+                    state.existing[key] = state.current_parent
+                    key += ' *'  # mark that it will appear elsewhere
+
+            prefix[-1] = stem
+            line = pp(itparent)
+            if type(value) == type(self):
+                ds = ''
+                state.current_parent = key
+                if html and value:
+                    if first_occurance:
+                        ds = '<details open=""><summary>'
+                    else:
+                        ds = '<details><summary>'
+
+                    key += '<span class="hide-when-open"> ... </span><br></summary>'
 
-        if len(self.__class__.prefix) > 1:
-            self.__class__.prefix.pop()
+                write('\n' + ds + line + key)
+                prefix[-1] = symboltype
+                value._render(write, state, level + 1, html, hpr, itparent)  # recurse here XXX
+                if html and value:
+                    write('</details>')
 
-        return output
+            else:
+                write('\n' + line + key + str(value))
+
+            prefix[-1] = _MID_STEM
+
+        prefix[-1] = _BOT_STEM
+        if len(prefix) > 1:
+            prefix.pop()
 
     def __str__(self, html=False, hpr=None):
-        output = self.print_tree(html=html, hpr=hpr)
-        # FIXME gotta do cleanup here for now :/
-        self.__class__.prefix = []
-        self.__class__.existing = {}  # clean up new mess
-        self.__class__.current_parent = None
-        return output
+        return self.print_tree(html=html, hpr=hpr)
 
     def __repr__(self, level = 0):
         pad = level * self.pad
@@ -409,9 +401,7 @@ def tree():
 
 
 def newTree(name, **kwargs):
-    base_dict = {'prefix':[], 'existing':{}, 'current_parent':None}
-    base_dict.update(kwargs)
-    newTreeNode = type('TreeNode_' + str(hash(name)).replace('-','_'), (TreeNode,), base_dict)
+    newTreeNode = type('TreeNode_' + str(hash(name)).replace('-','_'), (TreeNode,), kwargs)
     def Tree(): return newTreeNode(Tree)
 
     return Tree, newTreeNode
@@ -1,11 +1,18 @@
+import os
 import sys
 import hashlib
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from contextlib import contextmanager
 import rdflib
 from enum import Enum
 
 from .utils_fast import log as _log
 
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
 log = _log.getChild('ibnode')
 
 bnNone = rdflib.BNode()  # BNode to use in cases where subject would be None
@@ -234,6 +241,18 @@ def toposort(adj, unmarked_key=None):
     return out
 
 
+def blake2b_256(data=b''):
+    return hashlib.blake2b(data, digest_size=32)
+
+
+def xxh3_128(data=b''):
+    """ not cryptographic, only for local change detection """
+    if xxhash is None:
+        raise ModuleNotFoundError('xxh3_128 identities need xxhash')
+
+    return xxhash.xxh3_128(data)
+
+
 def split_named_bnode(triple_seq):
     # use graph so that they show up in cache as expected
     named = rdflib.Graph()
@@ -251,6 +270,305 @@ def split_named_bnode(triple_seq):
     return named, bnode
 
 
+class LRUCache:
+    """ dict-like cache that evicts the least recently used entries
+        once it holds more than maxsize, with hit/miss/eviction counts
+
+        if weigh is given entries are also evicted while the sum of
+        weigh(key, value) over all entries is more than maxweight """
+
+    def __init__(self, maxsize, maxweight=None, weigh=None):
+        self.maxsize = maxsize
+        self.maxweight = maxweight
+        self.weigh = weigh
+        self.weight = 0
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    _missing = object()
+
+    def get(self, key, default=None):
+        value = self._data.get(key, self._missing)
+        if value is self._missing:
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __getitem__(self, key):
+        value = self._data[key]
+        self._data.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        data = self._data
+        if self.weigh is not None:
+            old = data.get(key, self._missing)
+            if old is not self._missing:
+                self.weight -= self.weigh(key, old)
+
+            self.weight += self.weigh(key, value)
+
+        data[key] = value
+        data.move_to_end(key)
+        if self.maxsize is not None:
+            while len(data) > self.maxsize:
+                self._evict()
+
+        if self.maxweight is not None:
+            while self.weight > self.maxweight and len(data) > 1:
+                self._evict()
+
+    def _evict(self):
+        key, value = self._data.popitem(last=False)
+        if self.weigh is not None:
+            self.weight -= self.weigh(key, value)
+
+        self.evictions += 1
+
+    def pop(self, key, *default):
+        if key not in self._data:
+            return self._data.pop(key, *default)
+
+        value = self._data.pop(key)
+        if self.weigh is not None:
+            self.weight -= self.weigh(key, value)
+
+        return value
+
+    def __delitem__(self, key):
+        value = self._data.pop(key)
+        if self.weigh is not None:
+            self.weight -= self.weigh(key, value)
+
+    def __iter__(self):
+        # a copy so that lookups while iterating do not reorder under us
+        return iter(list(self._data))
+
+    def keys(self):
+        return list(self._data)
+
+    def values(self):
+        return list(self._data.values())
+
+    def items(self):
+        return list(self._data.items())
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        self._data.clear()
+        self.weight = 0
+
+    def info(self):
+        info = dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                    size=len(self._data), maxsize=self.maxsize)
+        if self.maxweight is not None:
+            info.update(weight=self.weight, maxweight=self.maxweight)
+
+        return info
+
+
+_bytes_overhead = sys.getsizeof(b'')
+
+
+def _oi_weight(key, identity):
+    """ rough bytes held by an ordered_identity cache entry, keys built
+        from sorted subject identities can hold millions of digests so
+        the number of entries says little about the memory used """
+    things, separator = key
+    return (sum(map(len, things)) + _bytes_overhead * (len(things) + 1) +
+            len(identity))
+
+
+class _TripleSnapshot(list):
+    """ triples hashed by identity so that the records computed for
+        them are cached and can be read back with in_graph without
+        hashing every triple on each lookup """
+
+    __hash__ = object.__hash__
+
+
+class IdentityFunctionCache:
+    """ dict-like cache for the identity function
+
+        (thing, method) entries are only memos and live in an LRUCache
+        of maxsize, (graph, thing, method) entries are the records of a
+        graph which later calls read back with in_graph, these are kept
+        together per graph along with any (graph, method) entries and a
+        graph is evicted whole once there are more than maxgraphs so its
+        records are either all present or all absent, never partial
+
+        at least two graphs are always kept since graph-combined needs
+        the records of its named and bnode halves at the same time """
+
+    def __init__(self, maxsize, maxgraphs):
+        self.maxgraphs = maxgraphs
+        self._memo = LRUCache(maxsize)
+        self._graphs = OrderedDict()  # {graph: {key: value}}
+        # (thing, method) memos far outnumber graphs so only look for
+        # a graph when thing is of a type that has been one
+        self._graph_types = set()
+        self.graph_evictions = 0
+
+    @staticmethod
+    def _graph(key):
+        graph = key[0]
+        # graph-combined stores the records of its halves under (graph, 'named')
+        # and (graph, 'bnode') and they must be evicted together
+        if (type(graph) == tuple and len(graph) == 2 and
+            type(graph[1]) == str and graph[1] in ('named', 'bnode')):
+            return graph[0]
+
+        return graph
+
+    def _entries(self, key):
+        """ the entries for the graph of key, or None if key is a memo """
+        if type(key) != tuple:
+            return None
+        elif len(key) == 3:
+            graph = self._graph(key)
+        elif type(key[0]) in self._graph_types:
+            graph = key[0]
+        else:
+            return None
+
+        entries = self._graphs.get(graph)
+        if entries is not None:
+            self._graphs.move_to_end(graph)
+
+        return entries
+
+    def __contains__(self, key):
+        entries = self._entries(key)
+        return key in self._memo if entries is None else key in entries
+
+    def __getitem__(self, key):
+        entries = self._entries(key)
+        return self._memo[key] if entries is None else entries[key]
+
+    def get(self, key, default=None):
+        entries = self._entries(key)
+        return self._memo.get(key, default) if entries is None else entries.get(key, default)
+
+    def __setitem__(self, key, value):
+        entries = self._entries(key)
+        if entries is None:
+            if type(key) != tuple or len(key) != 3:
+                self._memo[key] = value
+                return
+
+            graph = self._graph(key)
+            entries = self._graphs[graph] = {}
+            self._graph_types.add(type(graph))
+            while len(self._graphs) > max(self.maxgraphs, 2):
+                self._graphs.popitem(last=False)
+                self.graph_evictions += 1
+
+        entries[key] = value
+
+    def move_graph(self, graph, new):
+        """ rekey the records of graph from (graph, ...) to (new, ...) """
+        entries = self._graphs.pop(graph, None)
+        if not entries:
+            return
+
+        target = self._graph((new,))
+        if target not in self._graphs:
+            self._graphs[target] = {}
+            self._graph_types.add(type(target))
+
+        self._graphs.move_to_end(target)
+        self._graphs[target].update(((new, *k[1:]), v) for k, v in entries.items())
+
+    def pop(self, key, *default):
+        entries = self._entries(key)
+        return self._memo.pop(key, *default) if entries is None else entries.pop(key, *default)
+
+    def __delitem__(self, key):
+        entries = self._entries(key)
+        if entries is None:
+            del self._memo[key]
+        else:
+            del entries[key]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return [*self._memo.keys(), *(k for es in self._graphs.values() for k in es)]
+
+    def values(self):
+        return [*self._memo.values(), *(v for es in self._graphs.values() for v in es.values())]
+
+    def items(self):
+        return [*self._memo.items(), *(i for es in self._graphs.values() for i in es.items())]
+
+    def __len__(self):
+        return len(self._memo) + sum(map(len, self._graphs.values()))
+
+    def clear(self):
+        self._memo.clear()
+        self._graphs.clear()
+
+    @property
+    def evictions(self):
+        return self._memo.evictions
+
+    def info(self):
+        info = self._memo.info()
+        info.update(graphs=len(self._graphs), maxgraphs=self.maxgraphs,
+                    graph_evictions=self.graph_evictions)
+        return info
+
+
+def connected_records(triple_seq):
+    """ partition triples into groups that share a subject or a bnode
+
+        the subject identities and free bnode heads of one group never
+        depend on triples from any other group, so the groups can be
+        hashed independently and their subject identities pooled """
+    parent = {}
+    def find(n):
+        parent.setdefault(n, n)
+        while parent[n] != n:
+            parent[n] = parent[parent[n]]
+            n = parent[n]
+
+        return n
+
+    for s, p, o in triple_seq:
+        rs = find(s)
+        if isinstance(o, rdflib.BNode):
+            ro = find(o)
+            if rs != ro:
+                parent[ro] = rs
+
+    groups = defaultdict(list)
+    for t in triple_seq:
+        groups[find(t[0])].append(t)
+
+    return list(groups.values())
+
+
+def _record_seids(cls, version, triples, symmetric_predicates=tuple(),
+                  no_reorder_list_predicates=tuple()):
+    # debug so that the seids are retained, a list so the
+    # worker does not hash the whole chunk into its caches
+    ibn = cls(triples, version=version, debug=True,
+              symmetric_predicates=symmetric_predicates,
+              no_reorder_list_predicates=no_reorder_list_predicates)
+    return ibn._alt_debug['seids']
+
+
 class IdentityBNode(rdflib.BNode):
     # FIXME __eq__ needs to warn if types are the same but versions are different
 
@@ -297,56 +615,72 @@ class IdentityBNode(rdflib.BNode):
         not useful as bound identifiers, but only as unbound or pointing identifiers.
     """
     cypher = hashlib.sha256
+    # the fractional part of the version selects the digest, published
+    # identities are always sha256, the others are for local diffing
+    # and never compare equal to identities from other versions
+    cyphers = {
+        3.1: blake2b_256,
+        3.2: xxh3_128,
+    }
     cypher_field_separator = ' '
     encoding = sys.getdefaultencoding()
     sortlast = b'\uf8ff'
     default_version = 3
 
     def __new__(cls, triples_or_pairs_or_thing, *, version=None, debug=False, pot=False,
-                as_type=None, id_method=None, in_graph=None, symmetric_predicates=tuple(), no_reorder_list_predicates=tuple()):
+                as_type=None, id_method=None, in_graph=None, symmetric_predicates=tuple(), no_reorder_list_predicates=tuple(),
+                n_jobs=None):
         self = super().__new__(cls)  # first time without value
         self.version = self.default_version if version is None else version
+        if self.version in self.cyphers:
+            self.cypher = self.cyphers[self.version]
+
         if self.version not in self._reccache_top:
             # FIXME sigh overhead every instance UGH separate classes ...
-            self._reccache_top[self.version] = {}
+            self._reccache_top[self.version] = LRUCache(self.reccache_maxsize)
 
         # FIXME also ... reccache is useless ... it is usually just the bytes conversions :/
         # it is for attempting to emulate old v1 iirc but very broken
         self._reccache = self._reccache_top[self.version]
         if self.version not in self._oi_cache_top:
             # FIXME sigh overhead every instance UGH separate classes ...
-            self._oi_cache_top[self.version] = {}
+            self._oi_cache_top[self.version] = self._new_oi_cache()
 
         self._oi_cache = self._oi_cache_top[self.version]
+        if self.version not in self._if_cache_top:
+            self._if_cache_top[self.version] = self._new_if_caches()
+
+        self._if_cache, self._if_debug_cache, self._if_predicate_cache = self._if_cache_top[self.version]
         self.debug = debug
         self._pot = pot  # pair or triple, use when you explicitly want to get the id for a pair or triple not just a list of 2 or 3 things
         self.id_lookup = {}
         self.symmetric_predicates = symmetric_predicates  # FIXME this is ok, but a bit awkward
+        self.no_reorder_list_predicates = no_reorder_list_predicates
         self._thing = triples_or_pairs_or_thing
 
-        if not hasattr(self, f'_{self.version}_cfs'):
+        ckey = self.version, self.cypher, self.cypher_field_separator
+        if ckey not in self._cypher_constants:
             m = self.cypher()
             m.update(self.to_bytes(self.cypher_field_separator))
             _cfs = m.digest()  # prevent accidents
-
-
-            setattr(self, f'_{self.version}_cfs', _cfs)
-
-        self.cypher_field_separator_hash = getattr(self, f'_{self.version}_cfs')
-
-        if not hasattr(self, f'_{self.version}_ni'):
+            self.cypher_field_separator_hash = _cfs
             self.cypher_check()  # only run this the first time, so stash this in here instead of every time
             m = self.cypher()
             _ni = m.digest()
-            setattr(self, f'_{self.version}_ni', _ni)
+            self._cypher_constants[ckey] = _cfs, _ni
 
-        self.null_identity = getattr(self, f'_{self.version}_ni')
+        self.cypher_field_separator_hash, self.null_identity = self._cypher_constants[ckey]
 
         if self.version > 2:
             treat_as_type = as_type if as_type else self.tat(triples_or_pairs_or_thing, self.version, pot)
             self._idfun_map = idfun_v3
-            self._alt_identity = self._identity_function(
-                triples_or_pairs_or_thing, treat_as_type, id_method=id_method, in_graph=in_graph)
+            if (n_jobs is not None and n_jobs != 1 and not debug and
+                treat_as_type == it['triple-seq'] and
+                id_method is None and in_graph is None):
+                self._alt_identity = self._parallel_identity(triples_or_pairs_or_thing, n_jobs)
+            else:
+                self._alt_identity = self._identity_function(
+                    triples_or_pairs_or_thing, treat_as_type, id_method=id_method, in_graph=in_graph)
             if self.version >= 3:
                 self.identity = self._alt_identity
                 #if debug:
@@ -370,6 +704,9 @@ class IdentityBNode(rdflib.BNode):
         # for backward compat we shuffle these along so that calls to IBN('').identity_function work
         real_self._reccache = self._reccache
         real_self._oi_cache = self._oi_cache
+        real_self._if_cache = self._if_cache
+        real_self._if_debug_cache = self._if_debug_cache
+        real_self._if_predicate_cache = self._if_predicate_cache
 
         real_self.version = self.version
         real_self.debug = debug
@@ -378,7 +715,9 @@ class IdentityBNode(rdflib.BNode):
         real_self.identity = self.identity
         real_self.null_identity = self.null_identity
         real_self.symmetric_predicates = self.symmetric_predicates
+        real_self.no_reorder_list_predicates = self.no_reorder_list_predicates
         real_self.cypher_field_separator_hash = self.cypher_field_separator_hash
+        real_self.cypher = self.cypher
         return real_self
 
     @staticmethod
@@ -422,6 +761,29 @@ class IdentityBNode(rdflib.BNode):
         else:
             raise NotImplementedError(f'{type(thing)} {thing}')
 
+    @classmethod
+    def embedded_identities(cls, triples, subjects=None, *, version=None,
+                            symmetric_predicates=tuple(), no_reorder_list_predicates=tuple()):
+        """ {subject: identity} for subjects in triples computed in a
+            single pass, the same as IdentityBNode(subject, id_method=
+            idf['(s ((p o) ...))'], in_graph=graph) after computing graph,
+            subjects defaults to all named subjects, raises NotImplementedError
+            if there are bnode cycles """
+        snapshot = _TripleSnapshot(triples)
+        if subjects is None:
+            subjects = set(t[0] for t in snapshot if not isinstance(t[0], rdflib.BNode))
+
+        if not snapshot:
+            return {}
+
+        kwargs = dict(version=version,
+                      symmetric_predicates=symmetric_predicates,
+                      no_reorder_list_predicates=no_reorder_list_predicates)
+        cls(snapshot, **kwargs)
+        id_method = idf['(s ((p o) ...))']
+        return {s: cls(s, id_method=id_method, in_graph=snapshot, **kwargs)
+                for s in subjects}
+
     def check(self, other):
         if self.version >= 3:
             oid = self._identity_function(other, self.tat(other, self.version, False))
@@ -463,24 +825,90 @@ class IdentityBNode(rdflib.BNode):
         else:
             return str(thing).encode(self.encoding)
 
-    # FIXME this is get shared betwen versions!
-    _oi_cache_top = {}  # as or more important that caching at recurse
+    # caches are per version and bounded, use cache_scope
+    # to give a single large computation its own caches
+    oi_cache_maxsize = 2 ** 20
+    oi_cache_maxbytes = 2 ** 28
+    reccache_maxsize = 2 ** 18
+    # memo entries, the records of a graph are kept whole per graph
+    # and if_cache_maxgraphs bounds how many graphs are kept
+    if_cache_maxsize = 2 ** 18
+    if_cache_maxgraphs = 2 ** 8
+    if_debug_cache_maxsize = 2 ** 8
+    if_predicate_cache_maxsize = 2 ** 16
+
+    @classmethod
+    def _new_oi_cache(cls, maxsize=None):
+        return LRUCache(cls.oi_cache_maxsize if maxsize is None else maxsize,
+                        maxweight=cls.oi_cache_maxbytes, weigh=_oi_weight)
+
+    @classmethod
+    def _new_if_caches(cls, maxsize=None, maxgraphs=None):
+        return (IdentityFunctionCache(cls.if_cache_maxsize if maxsize is None else maxsize,
+                                      cls.if_cache_maxgraphs if maxgraphs is None else maxgraphs),
+                LRUCache(cls.if_debug_cache_maxsize),
+                LRUCache(cls.if_predicate_cache_maxsize))
+
+    @classmethod
+    def cache_info(cls):
+        info = {name: {version: cache.info() for version, cache in top.items()}
+                for name, top in (('ordered_identity', cls._oi_cache_top),
+                                  ('recurse', cls._reccache_top))}
+        for i, name in enumerate(('identity_function', 'identity_function_debug',
+                                  'identity_function_predicate')):
+            info[name] = {version: caches[i].info()
+                          for version, caches in cls._if_cache_top.items()}
+
+        return info
+
+    @classmethod
+    @contextmanager
+    def cache_scope(cls, version=None, oi_cache_maxsize=None, reccache_maxsize=None,
+                    if_cache_maxsize=None, if_cache_maxgraphs=None):
+        """ use fresh caches for version inside the with block and
+            put the old ones back afterward, everything computed inside
+            the block is dropped at exit, as is the identity function cache """
+        version = cls.default_version if version is None else version
+        scoped = {
+            'ordered_identity': cls._new_oi_cache(oi_cache_maxsize),
+            'recurse': LRUCache(cls.reccache_maxsize if reccache_maxsize is None else reccache_maxsize),
+            'identity_function': cls._new_if_caches(if_cache_maxsize, if_cache_maxgraphs),
+        }
+        swaps = ((cls._oi_cache_top, scoped['ordered_identity']),
+                 (cls._reccache_top, scoped['recurse']),
+                 (cls._if_cache_top, scoped['identity_function']))
+        missing = object()
+        old = [top.get(version, missing) for top, _ in swaps]
+        for top, cache in swaps:
+            top[version] = cache
+
+        try:
+            yield scoped
+        finally:
+            for (top, _), cache in zip(swaps, old):
+                if cache is missing:
+                    top.pop(version, None)
+                else:
+                    top[version] = cache
+
+    _cypher_constants = {}  # {(version, cypher, separator): (separator hash, null identity)}
+    _oi_cache_top = {}  # {version: LRUCache} as or more important that caching at recurse
     def ordered_identity(self, *things, separator=True):
         """ this assumes that the things are ALREADY ordered correctly """
-        if (things, separator) in self._oi_cache:
-            return self._oi_cache[(things, separator)]
+        identity = self._oi_cache.get((things, separator))
+        if identity is not None:
+            return identity
 
-        m = self.cypher()
-        for i, thing in enumerate(things):
-            if separator and i > 0:  # insert field separator
-                m.update(self.cypher_field_separator_hash)
+        for thing in things:
             if thing is None:  # all null are converted to the starting hash
                 raise TypeError("should already have converted None -> b'' at this point")
-                thing = self.null_identity
             if type(thing) != bytes:
                 raise TypeError(f'{type(thing)} is not bytes, did you forget to call to_bytes first?')
-            m.update(thing)
 
+        # a single update on the joined fields gives the same digest as
+        # an update per field and separator at a fraction of the calls
+        m = self.cypher()
+        m.update((self.cypher_field_separator_hash if separator else b'').join(things))
         identity = m.digest()
         if self.debug:
             self.id_lookup[identity] = tuple(self.id_lookup[t] if
@@ -553,7 +981,7 @@ class IdentityBNode(rdflib.BNode):
             if isinstance(s, rdflib.BNode):
                 subgraph_mapping[s] = os
 
-    _reccache_top = {}  # FIXME shared between versions !!!
+    _reccache_top = {}  # {version: LRUCache}
     _cache_hits = 0
     def recurse(self, triples_or_pairs_or_thing, bnodes_ok=False, pot=False):
         """ Absolutely must memoize the results for this otherwise
@@ -564,7 +992,8 @@ class IdentityBNode(rdflib.BNode):
             # FIXME TODO make sure we filter the right types here
             yield from self._recurse(triples_or_pairs_or_thing, bnodes_ok=bnodes_ok, pot=pot)
         else:
-            if triples_or_pairs_or_thing not in self._reccache:
+            cached = self._reccache.get(triples_or_pairs_or_thing)
+            if cached is None:
                 ids = list(self._recurse(triples_or_pairs_or_thing, bnodes_ok=bnodes_ok, pot=pot))
                 if ids:
                     # in version 2 when triples_or_pairs_or_thing = self._thing there
@@ -582,13 +1011,13 @@ class IdentityBNode(rdflib.BNode):
                         yield from ids
                         return
                     else:
-                        self._reccache[triples_or_pairs_or_thing] = ids
+                        self._reccache[triples_or_pairs_or_thing] = cached = ids
                 else:
                     return
             else:
                 self._cache_hits += 1
 
-            yield from self._reccache[triples_or_pairs_or_thing]
+            yield from cached
 
     def _recurse(self, triples_or_pairs_or_thing, bnodes_ok=False, pot=False):
         if triples_or_pairs_or_thing is None or isinstance(triples_or_pairs_or_thing, str):
@@ -1271,9 +1700,53 @@ class IdentityBNode(rdflib.BNode):
         if sigh:
             breakpoint()
 
-    _if_cache = {}  # FIXME version issue
-    _if_debug_cache = {}
-    _if_predicate_cache = {}  # this one usually doesn't need to be reset and is heavily used
+    def _parallel_identity(self, triple_seq, n_jobs):
+        """ same value as record-seq over triple_seq but with the
+            connected records hashed across a process pool """
+        from concurrent.futures import ProcessPoolExecutor
+        if n_jobs < 0:
+            n_jobs = os.cpu_count() or 1
+
+        groups = sorted(connected_records(list(triple_seq)), key=len, reverse=True)
+        # a few chunks per worker, largest groups first, each chunk
+        # goes to whichever is currently the smallest
+        n_chunks = min(len(groups), n_jobs * 4)
+        chunks = [[] for _ in range(n_chunks)]
+        for group in groups:
+            min(chunks, key=len).extend(group)
+
+        args = self.__class__, self.version
+        kwargs = dict(symmetric_predicates=self.symmetric_predicates,
+                      no_reorder_list_predicates=self.no_reorder_list_predicates)
+        seids = []
+        if len(chunks) <= 1 or n_jobs == 1:
+            for chunk in chunks:
+                seids.extend(_record_seids(*args, chunk, **kwargs))
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = [executor.submit(_record_seids, *args, chunk, **kwargs)
+                           for chunk in chunks]
+                for future in futures:
+                    seids.extend(future.result())
+
+        return self.ordered_identity(*sorted(seids), separator=False)
+
+    # {version: (_if_cache, _if_debug_cache, _if_predicate_cache)}
+    # an IdentityFunctionCache and two LRUCaches
+    # the predicate cache usually doesn't need to be reset and is heavily used
+    _if_cache_top = {}
+    def _records_input_type(self, treat_as_type, in_graph):
+        """ the input type in_graph was computed as to make the
+            records read back by treat_as_type """
+        if treat_as_type in (idf['record-named'], idf['record-bnode'], idf['record-combined']):
+            return it['graph-combined']
+        else:
+            return self.tat(in_graph, self.version, False)
+
+    def _records_key(self, in_graph, treat_as_type):
+        input_type = self._records_input_type(treat_as_type, in_graph)
+        return in_graph, self._idfun_map[input_type]
+
     def _identity_function(self, thing, treat_as_type, *, id_method=None, in_graph=None, is_pred=False):
         # FIXME TODO treat_as_type to something other than
         # strings for better performance maybe? probably much later
@@ -1293,6 +1766,21 @@ class IdentityBNode(rdflib.BNode):
             # function for multiple different identity functions
             treat_as_type = self._idfun_map[input_type]
 
+        if in_graph is not None:
+            records_key = self._records_key(in_graph, treat_as_type)
+            try:
+                missing = records_key not in self._if_cache
+            except TypeError:
+                # records are never cached for unhashable graphs
+                missing = False
+
+            if missing:
+                # the records of in_graph were evicted or never computed by
+                # these caches, compute them again instead of reading back
+                # nothing, the graph identity is cached after its records
+                # and with them so it marks them as complete
+                self._identity_function(in_graph, self._records_input_type(treat_as_type, in_graph))
+
         try:
             # we can't/dont't cache unhashable things (e.g. lists)
             if is_pred:
@@ -1316,8 +1804,12 @@ class IdentityBNode(rdflib.BNode):
                 self._if_cache[in_graph, thing, idf['record-bnode']] = out
                 return out
             elif (treat_as_type == idf['record-combined'] and in_graph is not None and
+                  records_key in self._if_cache and
                   (((in_graph, 'named'), thing, idf['record']) in self._if_cache or
                    ((in_graph, 'bnode'), thing, idf['record']) in self._if_cache)):
+                # the records of a graph are evicted whole so with the graph
+                # present a missing half means thing has no records of that
+                # kind, not that they were dropped
                 kn = ((in_graph, 'named'), thing, idf['record'])
                 rn = self._if_cache[kn] if kn in self._if_cache else self.null_identity
                 kb = ((in_graph, 'bnode'), thing, idf['record'])
@@ -1735,13 +2227,8 @@ you will only very rarely be able to determine that two graphs are the same'''
             gn = self._identity_function(named, treat_as_type=it['graph-named'])
             gb = self._identity_function(bnode, treat_as_type=it['graph-bnode'])
             # TODO figure out if there is some more consistent way to deal with this?
-            for nkey in [k for k in list(self._if_cache) if named in k]:
-                new_nkey = (thing, 'named'), *nkey[1:]
-                self._if_cache[new_nkey] = self._if_cache.pop(nkey)
-
-            for bkey in [k for k in list(self._if_cache) if bnode in k]:
-                new_bkey = (thing, 'bnode'), *bkey[1:]
-                self._if_cache[new_bkey] = self._if_cache.pop(bkey)
+            self._if_cache.move_graph(named, (thing, 'named'))
+            self._if_cache.move_graph(bnode, (thing, 'bnode'))
 
             ident = oid(gn, gb, separator=False)
         elif treat_as_type == idf['pair-seq']:
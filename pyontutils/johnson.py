@@ -21,7 +21,7 @@ def simple_cycles(G):
                 stack.update(B[node])
                 B[node].clear()
     G = {v: set(nbrs) for (v,nbrs) in G.items()} # make a copy of the graph
-    sccs = strongly_connected_components(G)
+    sccs = cyclic_components(G)
     while sccs:
         scc = sccs.pop()
         startnode = scc.pop()
@@ -55,13 +55,30 @@ def simple_cycles(G):
                 path.pop()
         remove_node(G, startnode)
         H = subgraph(G, set(scc))
-        sccs.extend(strongly_connected_components(H))
+        sccs.extend(cyclic_components(H))
 
 
 def strongly_connected_components(graph):
     return list(strongly_connected_components_iter(graph))
 
 
+def cyclic_components(graph):
+    return list(cyclic_components_iter(graph))
+
+
+def cyclic_components_iter(graph):
+    # single nodes without a self loop can never be part of a cycle
+    # skipping them avoids a remove_node pass over the whole graph for
+    # every node left in the chain when a long cycle is broken open
+    for scc in strongly_connected_components_iter(graph):
+        if len(scc) > 1:
+            yield scc
+        else:
+            v, = scc
+            if v in graph[v]:
+                yield scc
+
+
 def strongly_connected_components_iter(graph):
 
     identified = set()
@@ -64,11 +64,13 @@ ALWAYS MANUALLY CHECK YOUR OUTPUT THIS SUCKER IS FLAKY
 __title__ = 'obo-io'
 __author__ = 'Tom Gillespie'
 
+import io
 import os
 import ast
 import inspect
 import pathlib
 from types import MethodType
+from functools import lru_cache
 from datetime import datetime
 from getpass import getuser
 from collections import OrderedDict
@@ -113,6 +115,20 @@ obo_tag_to_ttl = {
     #'xref':
 
 }
+
+
+def _curie_iri(curie):
+    """ keyed on the namespace currently bound to the prefix
+        so that curies added or changed at runtime are used """
+    prefix = curie.split(':', 1)[0]
+    return _expand_curie(curie, OntId._namespaces().get(prefix))
+
+
+@lru_cache(maxsize=2**16)
+def _expand_curie(curie, namespace):
+    return OntId(curie).URIRef
+
+
 def id_fix(value):
     """ fix @prefix values for ttl """
     if value.startswith('KSC_M'):
@@ -133,7 +149,7 @@ def id_fix(value):
         else:
             value = ':' + value
 
-    return OntId(value).URIRef
+    return _curie_iri(value)
 
 
 class OboFile:
@@ -148,9 +164,30 @@ class OboFile:
         `t.xref += [TVPair('xref: ASDF:123 ! a new xref')]`.
     """
 
+    _lazy_attributes = 'header', 'Terms', 'Typedefs', 'Instances', 'Headers', 'missing'
+
     def __init__(self, *args, path=None, data=None, header=None, terms=None,
-                 typedefs=None, instances=None, strict=False):
+                 typedefs=None, instances=None, strict=False, lazy=False):
         self.path = path
+        if lazy and (data is not None or path is not None and path.exists()):
+            # nothing is read until one of _lazy_attributes is accessed
+            self._lazy = data, strict
+            return
+
+        self._init(data, header, terms, typedefs, instances, strict)
+
+    def __getattr__(self, attr):
+        # only called for attributes that are missing, so after the
+        # first access this is never hit again for lazy attributes
+        if attr in self._lazy_attributes and '_lazy' in self.__dict__:
+            data, strict = self.__dict__.pop('_lazy')
+            self._init(data, None, None, None, None, strict)
+            return getattr(self, attr)
+
+        raise AttributeError(f'{self.__class__.__name__!r} object has no attribute {attr!r}')
+
+    def _init(self, data, header, terms, typedefs, instances, strict):
+        path = self.path
         self.Terms = od()
         self.Terms.names = {}
         self.Typedefs = od()
@@ -159,30 +196,21 @@ class OboFile:
         self.Instances.names = {}
         self.Headers = od()  #LOL STUPID FIXME
         self.Headers.names = {}  # FIXME do not want? what about imports?
+        lines = None
         if path is not None:  # FIXME could spec path here?
             if path.exists():  # FIXME decouple OboContainer and file via .parse
                 if data is not None:
                     raise TypeError('path= and data= are mutually exclusive')
-                #od_types = {type_.__name__:type_od for type_,type_od in zip((Term, Typedef, Instance),(self.Terms,self.Typedefs,self.Instances))}
-                #LOL GETATTR
-                with open(path, 'rt') as f:
-                    data = f.read()
+
+                lines = open(path, 'rt')
 
         if data is not None:
-            #deal with \<newline> escape
-            data = data.replace(' \n','\n')  # FXIME need for arbitrary whitespace
-            data = data.replace('\<newline>\n',' ')
-            # TODO remove \n!.+\n
-            sections = data.split('\n[')
-            header_block = sections[0]
-            self.header = Header(header_block, self)
-            stanzas = sections[1:]
-            for block in stanzas:
-                block_type, block = block.split(']\n',1)
-                type_ = stanza_types[block_type]
-                #odt = od_type[block_type]
-                t = type_(block, self)  # FIXME :/
-                self.add_tvpair_store(t)
+            lines = io.StringIO(data)
+
+        if lines is not None:
+            with lines:
+                for stanza in iter_stanzas(lines, self):
+                    pass  # stanzas add themselves to self
 
             missing = {k:v for k, v in self.Terms.items() if isinstance(v, list)}
             if missing:
@@ -248,17 +276,16 @@ class OboFile:
             if path == final_path:
                 log.warning(f'path exists, renaming to {path}')
         else:
-            # FIXME streaming output that can use the stream setters from aug
             if format == 'obo':
-                value = self.asObo(stamp=stamp, version=version)
+                with open(path, 'wt', encoding='utf-8') as f:
+                    self.writeObo(f, stamp=stamp, version=version)
             elif format == 'ttl':
                 value = self.__ttl__()
+                with open(path, 'wt', encoding='utf-8') as f:
+                    f.write(value)
             else:
                 raise NotImplementedError(f'No exporter for file type {format}!')
 
-            with open(path, 'wt', encoding='utf-8') as f:
-                f.write(value)
-
         return path
 
     def __ttl__(self):
@@ -284,8 +311,7 @@ class OboFile:
         for prefix, namespace in argh:
             g.bind(prefix, namespace)
 
-        [g.add(t) for t in self.triples()]
-         
+        g.addN((s, p, o, g) for s, p, o in self.triples())
         out = g.serialize(format='nifttl', encoding='utf-8')
         return out.decode()
 
@@ -301,14 +327,22 @@ class OboFile:
         yield ontid, rdf.type, owl.Ontology
 
     def asObo(self, stamp=True, version=OBO_VER_DEFAULT):
-        def oboify(values):
-            return [s.asObo(version=version) for s in values if not isinstance(s, list)]
+        out = io.StringIO()
+        self.writeObo(out, stamp=stamp, version=version)
+        return out.getvalue()
+
+    def writeObo(self, file, stamp=True, version=OBO_VER_DEFAULT):
+        """ stream obo to an open text file one stanza at a time
+            so that the whole file never has to exist as one string """
+        write = file.write
+        write(self.header.asObo(stamp=stamp, version=version))
+        for thing in ('Terms', 'Typedefs', 'Instances'):
+            for s in getattr(self, thing).values():
+                if not isinstance(s, list):
+                    write('\n')
+                    write(s.asObo(version=version))
 
-        stores = [self.header.asObo(stamp=stamp, version=version)]
-        stores += oboify(self.Terms.values())
-        stores += oboify(self.Typedefs.values())
-        stores += oboify(self.Instances.values())
-        return '\n'.join(stores) + '\n'
+        write('\n')
 
     def __repr__(self):
         s = 'OboFile instance with %s Terms, %s Typedefs, and %s Instances' % (
@@ -422,6 +456,9 @@ class TVPair:  #TODO these need to be parented to something!
 
     def _parse_modifiers(self, value):
         # DEAL WITH TRAILING MODIFIERS
+        if '{' not in value:  # nearly every line, skip the char loop
+            return value.strip(), tuple()
+
         stack = [None]
         inmod = False
         instring = False
@@ -567,7 +604,7 @@ class TVPair:  #TODO these need to be parented to something!
 
             elif self.tag == 'is_a':
                 if self._value.target == self._value.DANGLING:  # we dangling
-                    value = self._value.target_id
+                    value = id_fix(self._value.target_id)  # same as if it resolved
                 else:
                     value = id_fix(self._value.target.id_.value)
 
@@ -604,6 +641,7 @@ class TVPair:  #TODO these need to be parented to something!
         return string
 
     @staticmethod
+    @lru_cache(maxsize=1024)  # called for every tag of every stanza
     def esc_(string):
         """ fix strings for use as names in classes """
         if string == 'id':  # dont clobber id
@@ -646,7 +684,7 @@ class TVPairStore:
                 self.__dict__[TVPair.esc_(tag)] = []  # may need a list
 
         if block is not None:
-            lines = block.split('\n')
+            lines = block.split('\n') if isinstance(block, str) else block
             for line in lines:
                 if line:
                     if line[0] != '!':  # we do not parse comments
@@ -981,7 +1019,7 @@ class Stanza(TVPairStore):
         return instance  # we return here so we chain the runonce
 
     def __init__(self, block=None, obofile=None, tvpairs=tuple(), **pairs):
-        if block is not None and obofile is not None:
+        if block is not None:
             super().__init__(block, obofile)
         else:
             super().__init__(tvpairs=tvpairs, **pairs)
@@ -1084,6 +1122,58 @@ class Instance(Stanza):
 
 stanza_types = {type_.__name__:type_ for type_ in (Term, Typedef, Instance)}
 
+
+def iter_blocks(lines):
+    """ yield (stanza type, lines) for each block in an iterable of lines
+        stanza type is None for the header, handles escapes line by line """
+    block_type = None
+    block = []
+    continued = ''
+    for line in lines:
+        line = continued + line.rstrip('\n')
+        continued = ''
+        if line.endswith(' '):  # FIXME need for arbitrary whitespace
+            line = line[:-1]
+
+        if line.endswith('\\<newline>'):
+            continued = line[:-len('\\<newline>')] + ' '
+            continue
+
+        if line.startswith('['):
+            yield block_type, block
+            block_type = line[1:].split(']', 1)[0]
+            block = []
+        else:
+            block.append(line)
+
+    if continued:
+        block.append(continued)
+
+    yield block_type, block
+
+
+def iter_stanzas(lines, obofile=None):
+    """ yield the Header and then each Stanza as it is read from lines,
+        e.g. an open file. Without an obofile nothing is retained so
+
+        for stanza in iter_stanzas(open(path)):
+            if not isinstance(stanza, Header):
+                yield from stanza.triples()
+
+        streams triples, relationships are not resolved to their targets.
+        With an obofile each stanza is added to it as it is read. """
+
+    for block_type, block in iter_blocks(lines):
+        if block_type is None:
+            header = Header(block, obofile)
+            if obofile is not None:
+                obofile.header = header
+
+            yield header
+        else:
+            type_ = stanza_types[block_type]
+            yield type_(block, obofile)  # adds itself to obofile
+
 ###
 #   Special children
 ###
@@ -1148,7 +1238,6 @@ class DynamicValue(Value):
 
         self.target = self.DANGLING
         if tvpair.type_od is None:  # TODO need a way to fill these in on add
-            self.target += ' ' + self.target_id
             return
 
         target = tvpair.type_od.get(self.target_id, None)
@@ -1516,7 +1605,8 @@ def deNone(*args):
             yield arg
 
 
-__all__ = [c.__name__ for c in (OboFile, TVPair, Header, Term, Typedef, Instance)]
+__all__ = [c.__name__ for c in (OboFile, TVPair, Header, Term, Typedef, Instance,
+                                iter_blocks, iter_stanzas)]
 
 
 def main():
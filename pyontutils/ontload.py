@@ -57,6 +57,7 @@ Options:
 """
 import os
 import json
+import time
 import uuid
 import yaml
 import shutil
@@ -69,6 +70,7 @@ from os.path import join as jpth
 from contextlib import contextmanager
 from collections import namedtuple
 import rdflib
+import requests
 from lxml import etree
 from git.repo import Repo
 from docopt import parse_defaults
@@ -575,8 +577,160 @@ def do_patch(patch_config, local_base):
                     print(e.stdout.decode())
                     raise e
 
+def read_until(chunks, marker):
+    """ consume chunks of bytes until marker has been seen
+        returns the bytes read and the index of marker or -1 """
+    buffer = b''
+    start = 0
+    for chunk in chunks:
+        buffer += chunk
+        index = buffer.find(marker, start)
+        if index >= 0:
+            return buffer, index
+
+        start = max(0, len(buffer) - len(marker) + 1)
+
+    return buffer, -1
+
+
+def iter_file(f, chunk_size=65536):
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+
+        yield chunk
+
+
+class ImportHeaders:
+    """ Fetch only the header section of ontology files.
+
+        Remote headers are fetched over a pooled session and cached
+        on disk keyed by url, cached headers are revalidated using
+        the ETag and Last-Modified of the response that produced them. """
+
+    ttl_marker = b'###'
+    xml_marker = b'</owl:Ontology>'
+
+    def __init__(self, cache_dir=None, workers=8, timeout=60):
+        if cache_dir is None:
+            import idlib
+            cache_dir = idlib.config.auth.get_path('cache-path') / 'ontload-headers'
+
+        self.cache_dir = Path(cache_dir)
+        self.workers = workers
+        self.timeout = timeout
+        self.stats = {'local': 0, 'remote': 0, 'cached': 0}
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.workers,
+                                  pool_maxsize=self.workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session = session
+
+        return self._session
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def marker(self, path):
+        return self.ttl_marker if path.endswith('.ttl') else self.xml_marker
+
+    def _cache_path(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return self.cache_dir / key[:2] / key
+
+    def local(self, path):
+        """ header of a local file, do not catch FileNotFoundErrors """
+        self.stats['local'] += 1
+        with open(path, 'rb') as f:
+            return read_until(iter_file(f), self.marker(path))
+
+    def remote(self, url):
+        marker = self.marker(url)
+        cache_path = self._cache_path(url)
+        meta_path = cache_path.with_suffix('.json')
+        request_headers = {}
+        if cache_path.exists() and meta_path.exists():
+            with open(meta_path, 'rt') as f:
+                meta = json.load(f)
+
+            if meta['etag']:
+                request_headers['If-None-Match'] = meta['etag']
+            if meta['last-modified']:
+                request_headers['If-Modified-Since'] = meta['last-modified']
+
+        with self.session.get(url, headers=request_headers, stream=True,
+                              timeout=self.timeout) as resp:
+            if resp.status_code == 304:
+                self.stats['cached'] += 1
+                with open(cache_path, 'rb') as f:
+                    raw = f.read()
+
+                return raw, raw.find(marker)
+
+            resp.raise_for_status()
+            self.stats['remote'] += 1
+            raw, index = read_until(resp.iter_content(chunk_size=65536), marker)
+            etag = resp.headers.get('ETag')
+            last_modified = resp.headers.get('Last-Modified')
+
+        if index >= 0:
+            raw = raw[:index + len(marker)]
+
+        if etag or last_modified:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(cache_path, 'wb') as f:
+                f.write(raw)
+
+            with open(meta_path, 'wt') as f:
+                json.dump({'url': url, 'etag': etag, 'last-modified': last_modified}, f)
+
+        return raw, index
+
+    def get(self, path, remote=False):
+        return self.remote(path) if remote else self.local(path)
+
+    def map(self, function, iterable):
+        """ run function over iterable on the worker pool in order """
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            yield from executor.map(function, iterable)
+
+
+def header_data(raw, index, infmt):
+    """ the part of raw that needs to be parsed to find imports """
+    if infmt == 'turtle':
+        return raw[:index] if index >= 0 else raw.split(b'###', 1)[0]
+
+    if index >= 0:
+        # the ontology element is complete, close the document
+        raw = raw[:index + len(ImportHeaders.xml_marker)] + b'\n</rdf:RDF>\n'
+
+    xml_tree = etree.parse(BytesIO(raw))
+    xml_root = xml_tree.getroot()
+    xml_ontology = xml_tree.xpath("/*[local-name()='RDF']/*[local-name()='Ontology']")
+    xml_root.clear()
+    xml_root.append(xml_ontology[0])
+    return etree.tostring(xml_root)
+
+
 def load_header(filepath, remote=False):
-    import requests
     oo = b'owl:Ontology'
     path = Path(filepath)
     if path.suffix == '.ttl':
@@ -584,25 +738,12 @@ def load_header(filepath, remote=False):
     else:
         infmt = 'xml'  # FIXME assumption
 
-    if remote:
-        resp = requests.get(filepath)  # TODO nonblocking pull these out, fetch, run inner again until done
-        raw = resp.text.encode()
-    else:
-        with open(filepath, 'rb') as f:  # do not catch FileNotFoundErrors
-            raw = f.read()
+    with ImportHeaders() as headers:
+        raw, index = headers.get(filepath, remote=remote)
 
+    scratch = OntGraph()
     if oo in raw:  # we only care if there are imports or an ontology iri
-        scratch = OntGraph()
-        if infmt == 'turtle':
-            data, rest = raw.split(b'###', 1)
-        elif infmt == None:  # assume xml
-            xml_tree = etree.parse(BytesIO(raw))
-            xml_root = xml_tree.getroot()
-            xml_ontology = xml_tree.xpath("/*[local-name()='RDF']/*[local-name()='Ontology']")
-            xml_root.clear()
-            xml_root.append(xml_ontology[0])
-            data = etree.tostring(xml_root)
-        scratch.parse(data=data, format=infmt)
+        scratch.parse(data=header_data(raw, index, infmt), format=infmt)
 
     return scratch
 
@@ -613,103 +754,138 @@ def get_iri(graph):
 def get_imports(graph):
     yield from (p for p in graph[get_iri(graph):owl.imports:])
 
-def local_imports(remote_base, local_base, ontologies, local_versions=tuple(), readonly=False, dobig=False, revert=False):
-    """ Read the import closure and use the local versions of the files. """
-    import requests
+def local_imports(remote_base, local_base, ontologies, local_versions=tuple(), readonly=False, dobig=False, revert=False,
+                  headers=None):
+    """ Read the import closure and use the local versions of the files.
+
+        Each level of the closure is fetched concurrently. When readonly
+        only the headers of files are read. """
+    own_headers = headers is None
+    if own_headers:
+        headers = ImportHeaders()
+
     done = []
     triples = set()
     imported_iri_vs_ontology_iri = {}
     p = owl.imports
     oi = b'owl:imports'
     oo = b'owl:Ontology'
-    def inner(local_filepath, remote=False):
-        if noneMembers(local_filepath, *bigleaves) or dobig:
-            ext = os.path.splitext(local_filepath)[-1]
-            if ext == '.ttl':
-                infmt = 'turtle'
-            else:
-                log.info((ext, local_filepath))
-                infmt = None
-            if remote:
-                resp = requests.get(local_filepath)  # TODO nonblocking pull these out, fetch, run inner again until done
-                raw = resp.text.encode()
+    def fetch(args):
+        # io only, runs on the worker threads
+        local_filepath, remote = args
+        if not (noneMembers(local_filepath, *bigleaves) or dobig):
+            return None
+
+        try:
+            if remote or readonly:
+                raw, index = headers.get(local_filepath, remote=remote)
+                return raw, index, None
+
+            with open(local_filepath, 'rb') as f:
+                raw = f.read()
+
+            if oo in raw and local_filepath.endswith('.ttl'):
+                data, rest = raw.split(b'###', 1)
+                return data, len(data), rest
+
+            return raw, -1, None
+        except requests.HTTPError as e:
+            # dead imports are skipped rather than failing the whole closure
+            log.error(f'could not fetch {local_filepath} {e}')
+            return None
+        except FileNotFoundError as e:
+            if local_filepath.startswith('file://'):
+                log.info(f'local_imports has already been run, skipping {local_filepath}')
+                return None
+                #raise ValueError('local_imports has already been run') from e
             else:
-                try:
-                    with open(local_filepath, 'rb') as f:
-                        raw = f.read()
-                except FileNotFoundError as e:
-                    if local_filepath.startswith('file://'):
-                        log.info(f'local_imports has already been run, skipping {local_filepath}')
-                        return
-                        #raise ValueError('local_imports has already been run') from e
+                log.exception(e)  # TODO raise a warning if the file cannot be matched
+                # seems like good practice to have any imported ontology under
+                # version control so all imports are guaranteed to have good
+                # provenance and not split the prior informaiton between the
+                # scigraph config and the repository, the repository remains
+                # the source of truth, load.yaml files can then pick a subset
+                # of the properly tracked files to load as they see fit, but
+                # not add to them (at least in pyontutils land)
+                return b'', -1, None
+
+    def inner(local_filepath, raw, index, rest):
+        """ record the imports of one file and return the files it imports """
+        todo = []
+        ext = os.path.splitext(local_filepath)[-1]
+        if ext == '.ttl':
+            infmt = 'turtle'
+        else:
+            log.info((ext, local_filepath))
+            infmt = None
+
+        if oo in raw:  # we only care if there are imports or an ontology iri
+            scratch = OntGraph()
+            data = header_data(raw, index, infmt)
+            scratch.parse(data=data, format='xml' if infmt is None else infmt)
+            for s in scratch.subjects(rdf.type, owl.Ontology):
+                triples.add((s, owl.sameAs, rdflib.URIRef(local_filepath)))
+                # somehow this breaks computing the chain
+                #for p in (rdfs.comment, skos.definition, definition, dc.title, rdfs.label):
+                    #for o in scratch[s:p]:
+                        #triples.add((s, p, o))
+            for s, o in sorted(scratch.subject_objects(p)):
+                if revert:
+                    raise NotImplementedError('TODO')
+                nlfp = o.replace(remote_base, local_base)
+                triples.add((s, p, o))
+                if 'http://' in local_filepath or 'external' in local_filepath:  # FIXME what to do about https used inconsistently :/
+                    if 'external' in local_filepath:
+                        imported_iri = rdflib.URIRef(local_filepath.replace(local_base, remote_base))  # inefficient
                     else:
-                        log.exception(e)  # TODO raise a warning if the file cannot be matched
-                        # seems like good practice to have any imported ontology under
-                        # version control so all imports are guaranteed to have good
-                        # provenance and not split the prior informaiton between the
-                        # scigraph config and the repository, the repository remains
-                        # the source of truth, load.yaml files can then pick a subset
-                        # of the properly tracked files to load as they see fit, but
-                        # not add to them (at least in pyontutils land)
-                        raw = b''
-
-            if oo in raw:  # we only care if there are imports or an ontology iri
-                scratch = OntGraph()
-                if infmt == 'turtle':
-                    data, rest = raw.split(b'###', 1)
-                elif infmt == None:  # assume xml
-                    xml_tree = etree.parse(BytesIO(raw))
-                    xml_root = xml_tree.getroot()
-                    xml_ontology = xml_tree.xpath("/*[local-name()='RDF']/*[local-name()='Ontology']")
-                    xml_root.clear()
-                    xml_root.append(xml_ontology[0])
-                    data = etree.tostring(xml_root)
-                scratch.parse(data=data, format=infmt)
-                for s in scratch.subjects(rdf.type, owl.Ontology):
-                    triples.add((s, owl.sameAs, rdflib.URIRef(local_filepath)))
-                    # somehow this breaks computing the chain
-                    #for p in (rdfs.comment, skos.definition, definition, dc.title, rdfs.label):
-                        #for o in scratch[s:p]:
-                            #triples.add((s, p, o))
-                for s, o in sorted(scratch.subject_objects(p)):
-                    if revert:
-                        raise NotImplementedError('TODO')
-                    nlfp = o.replace(remote_base, local_base)
-                    triples.add((s, p, o))
-                    if 'http://' in local_filepath or 'external' in local_filepath:  # FIXME what to do about https used inconsistently :/
-                        if 'external' in local_filepath:
-                            imported_iri = rdflib.URIRef(local_filepath.replace(local_base, remote_base))  # inefficient
+                        imported_iri = rdflib.URIRef(local_filepath)
+                    if s != imported_iri:
+                        imported_iri_vs_ontology_iri[imported_iri] = s  # kept for the record
+                        triples.add((imported_iri, p, s))  # bridge imported != ontology iri
+                if local_base in nlfp and 'file://' not in o:  # FIXME file:// should not be slipping through here...
+                    scratch.add((s, p, rdflib.URIRef('file://' + nlfp)))
+                    scratch.remove((s, p, o))
+                if nlfp not in done:
+                    done.append(nlfp)
+                    if local_base in nlfp and 'external' not in nlfp:  # skip externals TODO
+                        todo.append((nlfp, False))
+                    elif readonly:  # read external imports
+                        if 'external' in nlfp:
+                            todo.append((nlfp, False))
                         else:
-                            imported_iri = rdflib.URIRef(local_filepath)
-                        if s != imported_iri:
-                            imported_iri_vs_ontology_iri[imported_iri] = s  # kept for the record
-                            triples.add((imported_iri, p, s))  # bridge imported != ontology iri
-                    if local_base in nlfp and 'file://' not in o:  # FIXME file:// should not be slipping through here...
-                        scratch.add((s, p, rdflib.URIRef('file://' + nlfp)))
-                        scratch.remove((s, p, o))
-                    if nlfp not in done:
-                        done.append(nlfp)
-                        if local_base in nlfp and 'external' not in nlfp:  # skip externals TODO
-                            inner(nlfp)
-                        elif readonly:  # read external imports
-                            if 'external' in nlfp:
-                                inner(nlfp)
-                            else:
-                                inner(nlfp, remote=True)
-                if not readonly:
-                    _orp = CustomTurtleSerializer.roundtrip_prefixes  # FIXME awful hack :/
-                    CustomTurtleSerializer.roundtrip_prefixes = True
-                    ttl = scratch.serialize(format='nifttl', encoding='utf-8')
-                    CustomTurtleSerializer.roundtrip_prefixes = _orp
-                    ndata, comment = ttl.split(b'###', 1)
-                    out = ndata + b'###' + rest
-                    with open(local_filepath, 'wb') as f:
-                        f.write(out)
-
-    for start in ontologies:
-        log.info(f'START {start}')
-        done.append(start)
-        inner(start)
+                            todo.append((nlfp, True))
+            if not readonly and rest is not None:
+                _orp = CustomTurtleSerializer.roundtrip_prefixes  # FIXME awful hack :/
+                CustomTurtleSerializer.roundtrip_prefixes = True
+                ttl = scratch.serialize(format='nifttl', encoding='utf-8')
+                CustomTurtleSerializer.roundtrip_prefixes = _orp
+                ndata, comment = ttl.split(b'###', 1)
+                out = ndata + b'###' + rest
+                with open(local_filepath, 'wb') as f:
+                    f.write(out)
+
+        return todo
+
+    start_time = time.time()
+    try:
+        for start in ontologies:
+            log.info(f'START {start}')
+            done.append(start)
+
+        todo = [(start, False) for start in ontologies]
+        while todo:
+            next_todo = []
+            for (local_filepath, _), fetched in zip(todo, headers.map(fetch, todo)):
+                if fetched is not None:
+                    next_todo.extend(inner(local_filepath, *fetched))
+
+            todo = next_todo
+    finally:
+        if own_headers:  # callers manage the lifetime of headers they pass in
+            headers.close()
+
+    log.info(f'import closure of {len(done)} files {headers.stats} '
+             f'in {time.time() - start_time:.2f}s')
     return sorted(triples)
 
 def loadall(git_local, repo_name, local=False, dobig=False):
@@ -34,8 +34,12 @@ Options:
     -w --write                      write devconfig file
 """
 import os
+import json
+import sqlite3
+import threading
 from glob import glob
-from time import time, localtime, strftime
+from time import time, sleep, localtime, strftime
+from urllib.parse import urlparse
 from random import shuffle
 from pathlib import Path, PurePath
 import rdflib
@@ -226,10 +230,203 @@ def scigraph_stress(rate, timeout=5, verbose=False, debug=False, scigraph=auth.g
     url_blaster(urls, rate, timeout, verbose, debug)
 
 
-def deadlinks(filenames, rate, timeout=5, verbose=False, debug=False):
+class LinkChecker:
+    """ Check urls over a pooled session with a limit on concurrent
+        requests to any one host and a minimum delay between them.
+        HEAD is tried first and GET is used if HEAD is not ok. Ok
+        results are cached on disk for ttl seconds so unchanged links
+        are not rechecked on every run, failures for fail_ttl. """
+
+    def __init__(self, timeout=5, rate=None, per_host=4, host_delay=0,
+                 cache_path=None, ttl=7 * 24 * 60 * 60, fail_ttl=0):
+        import requests
+        if cache_path is None:
+            import idlib
+            cache_path = idlib.config.auth.get_path('cache-path') / 'deadlinks.sqlite'
+
+        self.timeout = timeout
+        self.rate = rate
+        self.per_host = per_host
+        self.host_delay = host_delay
+        self.ttl = ttl
+        self.fail_ttl = fail_ttl
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=100,
+                                                pool_maxsize=per_host)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._hosts = {}
+        self._lock = threading.Lock()
+        Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(cache_path), check_same_thread=False)
+        with self._conn:
+            self._conn.execute('CREATE TABLE IF NOT EXISTS links '
+                               '(url TEXT PRIMARY KEY, checked REAL, result TEXT)')
+
+    def _host(self, url):
+        """ semaphore and last request time for the host of url """
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = [threading.BoundedSemaphore(self.per_host),
+                                     threading.Lock(), 0]
+            return self._hosts[host]
+
+    def cached(self, url):
+        with self._lock:
+            row = self._conn.execute('SELECT checked, result FROM links WHERE url = ?',
+                                     (url,)).fetchone()
+        if row is not None:
+            checked, result = row
+            result = json.loads(result)
+            ttl = self.ttl if result['ok'] else self.fail_ttl
+            if time() - checked < ttl:
+                result['cached'] = True
+                return result
+
+    def _store(self, result):
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO links VALUES (?, ?, ?)',
+                               (result['url'], result['checked'], json.dumps(result)))
+
+    def _request(self, method, url):
+        import requests
+        semaphore, delay_lock, _ = host = self._host(url)
+        with semaphore:
+            if self.host_delay:
+                with delay_lock:
+                    wait = host[2] + self.host_delay - time()
+                    if wait > 0:
+                        sleep(wait)
+
+                    host[2] = time()
+
+            try:
+                resp = self.session.request(method, url, timeout=self.timeout,
+                                            allow_redirects=True, stream=True)
+                resp.close()
+                return resp.status_code, resp.url, None
+            except requests.exceptions.RequestException as e:
+                return None, None, f'{e.__class__.__name__}: {e}'
+
+    def check(self, url):
+        result = self.cached(url)
+        if result is not None:
+            return result
+
+        start = time()
+        method = 'HEAD'
+        status, final_url, error = self._request(method, url)
+        if status is None or status >= 400:
+            # plenty of servers reject or mishandle HEAD
+            method = 'GET'
+            status, final_url, error = self._request(method, url)
+
+        result = dict(url=url,
+                      ok=status is not None and status < 400,
+                      status=status,
+                      method=method,
+                      final_url=final_url,
+                      error=error,
+                      elapsed=time() - start,
+                      checked=time(),
+                      cached=False)
+        self._store(result)
+        return result
+
+    def check_all(self, urls):
+        """ yield results as they complete, cached urls come first """
+        todo = []
+        for url in urls:
+            result = self.cached(url)
+            if result is None:
+                todo.append(url)
+            else:
+                yield result
+
+        shuffle(todo)  # spread hosts across workers
+        yield from Async(rate=self.rate).stream((deferred(self.check)(url)
+                                                 for url in todo), ordered=False)
+
+    @staticmethod
+    def report(results):
+        results = sorted(results, key=lambda r: r['url'])
+        bad = [r for r in results if not r['ok']]
+        return dict(total=len(results),
+                    ok=len(results) - len(bad),
+                    failed=len(bad),
+                    cached=sum(r['cached'] for r in results),
+                    results=results)
+
+
+def deadlinks(filenames, rate, timeout=5, verbose=False, debug=False, output_file=None):
     from joblib import Parallel, delayed
     urls = list(set(u for r in Parallel(n_jobs=9)(delayed(furls)(f) for f in filenames) for u in r))
-    url_blaster(urls, rate, timeout, verbose, debug)
+    checker = LinkChecker(timeout=timeout, rate=rate if rate else None)
+    s = time()
+    results = []
+    for result in checker.check_all(urls):
+        results.append(result)
+        if verbose:
+            print(result['status'], result['url'])
+
+    report = checker.report(results)
+    d = time() - s
+    print(f'Actual time: {d}    checked: {report["total"] - report["cached"]}    '
+          f'cached: {report["cached"]}')
+    if report['failed']:
+        print('Failed:')
+        for r in report['results']:
+            if not r['ok']:
+                print(r['status'] if r['error'] is None else r['error'], r['url'])
+
+        msg = (f'{report["failed"]} urls out of {report["total"]} '
+               f'({report["failed"] / report["total"] * 100:2.2f}%) are not ok. D:')
+        print(msg)
+
+    if output_file is not None:
+        with open(output_file, 'wt') as f:
+            json.dump(report, f, indent=2)
+
+    if debug:
+        breakpoint()
+
+    return report
+
+
+def async_timeline(collector):
+    """ group the (thread, job, start, stop) records collected by Async
+        per thread as jobs, starts, stops and latencies relative to the
+        first start """
+    by_thread = {}
+    if not collector:
+        return by_thread
+
+    min_ = min(start for thread, job, start, stop in collector)
+    for thread, job, start, stop in sorted(collector, key=lambda r: r[2]):
+        if thread not in by_thread:
+            by_thread[thread] = [], [], [], []
+
+        jobs, starts, stops, latencies = by_thread[thread]
+        jobs.append(job)
+        starts.append(start - min_)
+        stops.append(stop - min_)
+        latencies.append(stop - start)
+
+    return by_thread
+
+
+def asyncVis(collector):
+    from matplotlib.pyplot import plot, figure, show, legend, title
+    for thread, (jobs, starts, stops, latencies) in async_timeline(collector).items():
+        figure()
+        title(str(thread))
+        plot(jobs, starts, '.', label='start')
+        plot(jobs, stops, '.', label='stop')
+        plot(jobs, latencies, label='latency')
+        legend()
+
+    show()
 
 
 def url_blaster(urls, rate, timeout=5, verbose=False, debug=False, method='head',
@@ -277,36 +474,6 @@ def url_blaster(urls, rate, timeout=5, verbose=False, debug=False, method='head'
         print(f'OK. All {len(urls)} urls passed! :D')
 
     if debug:
-        from matplotlib.pyplot import plot, savefig, figure, show, legend, title
-        from collections import defaultdict
-        def asyncVis(collector):
-            by_thread = defaultdict(lambda: [[], [], [], [], [], [], [], []])
-            min_ = 0
-            for thread, job, start, target_stop, stop, time_per_job, p, i, d in sorted(collector):
-                if not min_:
-                    min_ = stop
-                by_thread[thread][0].append(job)
-                #by_thread[thread][1].append(start - min_)
-                by_thread[thread][2].append(target_stop - stop)
-                by_thread[thread][3].append(stop - min_)
-                by_thread[thread][4].append(time_per_job)
-                by_thread[thread][5].append(p)
-                by_thread[thread][6].append(i)
-                by_thread[thread][7].append(d)
-
-            for thread, (job, y1, y2, y3, y4, y5, y6, y7) in by_thread.items():
-                figure()
-                title(str(thread))
-                plot(job, [0] * len(job), 'r-')
-                #plot(job, y1, label=f'stop')
-                plot(job, y2, label=f'early by')
-                #plot(job, y3, label=f'stop')
-                #plot(job, y4, label=f'time per job')  # now constant...
-                plot(job, y5, label='P')
-                plot(job, y6, label='I')
-                plot(job, y7, label='D')
-                legend()
-            show()
         asyncVis(collector)
         breakpoint()
 
@@ -906,7 +1073,8 @@ def main():
     elif args['scigraph-stress']:
         scigraph_stress(int(args['--rate']), int(args['--timeout']), verbose, debug)
     elif args['deadlinks']:
-        deadlinks(filenames, int(args['--rate']), int(args['--timeout']), verbose, debug)
+        deadlinks(filenames, int(args['--rate']), int(args['--timeout']), verbose, debug,
+                  args['--output-file'])
     elif args['spell']:
         spell(filenames, debug)
     elif args['iri-commit']:
@@ -27,7 +27,6 @@ from glob import glob
 import rdflib
 from docopt import docopt
 import ttlser.ttlfmt
-from pyontutils.core import makeGraph, cull_prefixes
 from ttlser.utils import readFromStdIn
 from ttlser.ttlfmt import parse, prepare
 from pyontutils.namespaces import PREFIXES as uPREFIXES
@@ -36,6 +35,17 @@ PREFIXES = {k:v for k, v in uPREFIXES.items() if k != 'NIFTTL'}
 
 exclude = 'generated/swanson_hierarchies.ttl', 'generated/NIF-NIFSTD-mapping.ttl'
 
+
+def __getattr__(name):
+    # other modules import cull_prefixes from here, but core is
+    # slow to import so only pull it in when it is actually used
+    if name == 'cull_prefixes':
+        from pyontutils.core import cull_prefixes
+        return cull_prefixes
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
 def serialize(graph, outpath):
     def prefix_cleanup(ps, graph):
         if 'parcellation/' in outpath:
@@ -62,6 +72,7 @@ def serialize(graph, outpath):
             print('WARNING: special case for NIFRET')
             ps.pop('NIFGA')
 
+    from pyontutils.core import cull_prefixes
     pc = prefix_cleanup if isinstance(outpath, str) else lambda a, b: None
     graph = cull_prefixes(graph, cleanup=pc, prefixes=PREFIXES)
 
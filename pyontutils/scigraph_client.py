@@ -8,10 +8,17 @@ by scigraph.py
 """
 import re
 import copy
+import time
+import asyncio
+import pickle
+import sqlite3
 import inspect
 import builtins
+import threading
 from urllib.parse import parse_qs
 import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from ast import literal_eval
 from json import dumps
 from urllib import parse
@@ -20,10 +27,221 @@ BASEPATH = 'https://scicrunch.org/api/1/sparc-scigraph'
 
 exten_mapping = {'application/graphml+xml': 'graphml+xml', 'application/graphson': 'graphson', 'application/javascript': 'javascript', 'application/json': 'json', 'application/xgmml': 'xgmml', 'application/xml': 'xml', 'image/jpeg': 'jpeg', 'image/png': 'png', 'text/csv': 'csv', 'text/gml': 'gml', 'text/html': 'html', 'text/plain': 'plain', 'text/plain; charset=utf-8': 'plain; charset=utf-8', 'text/tab-separated-values': 'tab-separated-values'}
 
+class MemoryCache:
+    """ Bounded in memory LRU cache for rest responses. """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+
+            self.misses += 1
+            return default
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if self.maxsize is not None:
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def info(self):
+        return dict(hits=self.hits, misses=self.misses,
+                    size=len(self), maxsize=self.maxsize)
+
+
+class SqliteCache:
+    """ On disk cache for rest responses that persists across runs.
+        Entries older than ttl seconds are treated as misses. """
+
+    def __init__(self, path, ttl=None):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        with self._conn:
+            self._conn.execute('CREATE TABLE IF NOT EXISTS cache '
+                               '(key TEXT PRIMARY KEY, time REAL, value BLOB)')
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute('SELECT time, value FROM cache WHERE key = ?',
+                                     (key,)).fetchone()
+            if row is None or self.ttl is not None and time.time() - row[0] > self.ttl:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            return pickle.loads(row[1])
+
+    def __setitem__(self, key, value):
+        blob = pickle.dumps(value)
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?)',
+                               (key, time.time(), blob))
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT count(*) FROM cache').fetchone()[0]
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM cache')
+
+    def expire(self):
+        """ drop entries that are older than ttl """
+        if self.ttl is not None:
+            with self._lock, self._conn:
+                self._conn.execute('DELETE FROM cache WHERE time < ?',
+                                   (time.time() - self.ttl,))
+
+    def info(self):
+        return dict(hits=self.hits, misses=self.misses,
+                    size=len(self), ttl=self.ttl, path=str(self.path))
+
+
+class Batch:
+    """ Run many calls against a rest service concurrently from asyncio.
+
+        with Vocabulary().batch(concurrency=32) as b:
+            records = b.map('findById', ids)
+
+        or inside a coroutine use await b.findById(id). Identical calls
+        that are in flight at the same time are coalesced into a single
+        request, and connection errors, 429 and 5xx are retried with
+        exponential backoff. Calls always raise inside the batch so that
+        they can be retried, once the retries are used up an error status
+        is returned as None unless the service was made with do_error. """
+
+    def __init__(self, service, concurrency=16, retries=3, backoff=0.5):
+        self._service = service
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self._executor = ThreadPoolExecutor(max_workers=concurrency,
+                                            initializer=self._init_worker)
+        self._semaphores = {}
+        self._inflight = {}
+        self.stats = dict(calls=0, requests=0, coalesced=0, retries=0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        async def call(*args, **kwargs):
+            return await self.call(name, *args, **kwargs)
+
+        return call
+
+    @staticmethod
+    def _init_worker():
+        restService._local.do_error = True
+
+    def _retry(self, e):
+        if isinstance(e, requests.exceptions.HTTPError):
+            status = e.response.status_code if e.response is not None else None
+            return status == 429 or status is not None and status >= 500
+
+        return isinstance(e, (ConnectionError,
+                              requests.exceptions.ConnectionError,
+                              requests.exceptions.Timeout))
+
+    async def _request(self, name, args, kwargs):
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+
+        method = getattr(self._service, name)
+        async with self._semaphores[loop]:
+            for attempt in range(self.retries + 1):
+                self.stats['requests'] += 1
+                try:
+                    return await loop.run_in_executor(
+                        self._executor, lambda: method(*args, **kwargs))
+                except Exception as e:
+                    if attempt == self.retries or not self._retry(e):
+                        if (isinstance(e, requests.exceptions.HTTPError) and
+                            not self._service._do_error):
+                            return None
+
+                        raise
+
+                    self.stats['retries'] += 1
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def call(self, name, *args, **kwargs):
+        self.stats['calls'] += 1
+        key = name, repr(args), repr(sorted(kwargs.items()))
+        if key in self._inflight:
+            self.stats['coalesced'] += 1
+        else:
+            task = asyncio.ensure_future(self._request(name, args, kwargs))
+            task.add_done_callback(lambda t, k=key: self._inflight.pop(k, None))
+            self._inflight[key] = task
+
+        return await asyncio.shield(self._inflight[key])
+
+    async def gather(self, name, *iterables):
+        """ await call(name, *args) for args in zip(*iterables) """
+        return await asyncio.gather(*(self.call(name, *args)
+                                      for args in zip(*iterables)))
+
+    def map(self, name, *iterables):
+        """ synchronous gather, results are in the order of the inputs
+
+            this starts its own event loop so it cannot be called from
+            a coroutine, use await gather(name, *iterables) there """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.gather(name, *iterables))
+
+        raise RuntimeError('Batch.map cannot run inside a running event loop, '
+                           'use await Batch.gather instead')
+
+
 class restService:
     """ Base class for SciGraph rest services. """
 
     _api_key = None
+    # do_error is set here for the worker threads of a Batch
+    _local = threading.local()
 
     _hrx = re.compile('^https?://')
 
@@ -31,11 +249,14 @@ class restService:
         self._session = requests.Session()
         adapter = requests.adapters.HTTPAdapter(pool_connections=1000, pool_maxsize=1000)
         self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
         self._do_error = do_error
 
-        if cache:
+        if cache is not False and cache is not None:  # empty caches are falsy
             #print('WARNING: cache enabled, if you mutate the contents of return values you will mutate the cache!')
-            self._cache = dict()
+            # cache=True for an in memory lru, or pass any object that
+            # implements get and __setitem__ e.g. SqliteCache(path, ttl)
+            self._cache = MemoryCache() if cache is True else cache
             if safe_cache:
                 self._get = self._safe_cache_get
             else:
@@ -90,7 +311,7 @@ class restService:
                                   f'Did you set {self.__class__.__name__}.api_key'
                                   ' = my_api_key?')
         elif not resp.ok:
-            if self._do_error:
+            if self._do_error or getattr(self._local, 'do_error', False):
                 resp.raise_for_status()
             else:
                 return None
@@ -101,28 +322,41 @@ class restService:
         else:
             return resp
 
-    def _cache_get(self, method, url, params=None, output=None):
+    def _cache_key(self, method, url, params=None, output=None):
+        """ the api key is never part of the cache key """
         if params:
-            pkey = '?' + '&'.join(['%s=%s' % (k,v) for k,v in sorted(params.items()) if v is not None])
+            pkey = '?' + '&'.join(['%s=%s' % (k,v) for k,v in sorted(params.items())
+                                   if v is not None and k != 'key'])
         else:
             pkey = ''
-        key = url + pkey + ' ' + method + ' ' + str(output)
-        if  key in self._cache:
+        return self._safe_url(url) + pkey + ' ' + method + ' ' + str(output)
+
+    def _cache_get(self, method, url, params=None, output=None):
+        key = self._cache_key(method, url, params, output)
+        hit = self._cache.get(key, None)
+        if hit is not None:
             if self._verbose:
                 print('cache hit', key)
-            self.__last_url, resp = self._cache[key]
+            self.__last_url, resp = hit
         else:
             resp = self._normal_get(method, url, params, output)
-            self._cache[key] = self.__last_url, resp
+            self._cache[key] = self._safe_url(self.__last_url), resp
 
         return resp
 
+    def cache_info(self):
+        return self._cache.info() if hasattr(self, '_cache') else None
+
     def _safe_cache_get(self, *args, **kwargs):
         """ If cached values might be used in a context where they
             could be mutated, then safe_cache = True should be set
             and this wrapper will protect the output """
         return copy.deepcopy(self._cache_get(*args, **kwargs))  # prevent mutation of the cache
 
+    def batch(self, concurrency=16, retries=3, backoff=0.5):
+        """ see Batch """
+        return Batch(self, concurrency=concurrency, retries=retries, backoff=backoff)
+
     def _make_rest(self, default=None, **kwargs):
         kwargs = {k:v for k, v in kwargs.items() if v}
         param_rest = '&'.join(['%s={%s}' % (arg, arg) for arg in kwargs if arg != default])
@@ -493,6 +727,7 @@ class Cypher(CypherBase):
             self._curies = {}
 
         self._inv = {v:k for k, v in self._curies.items()}
+        self._inv_lengths = sorted({len(v) for v in self._inv}, reverse=True)
 
     @property
     def api_key(self):
@@ -514,9 +749,11 @@ class Cypher(CypherBase):
             self._setCuries()
 
     def qname(self, iri):
-        for prefix, curie in self._inv.items():
-            if iri.startswith(prefix):
-                return iri.replace(prefix, curie + ':')
+        # longest matching namespace, one dict lookup per distinct length
+        for length in self._inv_lengths:
+            curie = self._inv.get(iri[:length])
+            if curie is not None:
+                return curie + ':' + iri[length:]
         else:
             return iri
 
@@ -1,5 +1,7 @@
+import os
 import ast
 import copy
+import json
 import pickle
 import itertools
 from pathlib import Path
@@ -25,20 +27,62 @@ __scopes_error_message = (
     'appropriate scope.')
 
 
-def _FakeService():
-    """ use if you need a fake service from build """
+def _FakeService(snapshot=None):
+    """ use if you need a fake service from build
+
+        if a snapshot from Sheet._snapshot_load is provided requests
+        are answered from it so that sheets can be replayed offline """
+
+    if snapshot is None:
+        snapshot = {'meta': {'sheets': []}, 'meta_file': {}, 'sheets': {}}
+
+    stored = snapshot['sheets']
+
+    def title(range):
+        return range.rsplit('!', 1)[0]
 
     class e:
-        execute = lambda : {'sheets':[],}
+        def __init__(self, value):
+            self.value = value
+
+        def execute(self):
+            return copy.deepcopy(self.value)
+
     class v:
-        def get(range=None):
-            return []
+        def get(spreadsheetId=None, range=None, valueRenderOption=None):
+            key = 'formula' if valueRenderOption == 'FORMULA' else 'values'
+            if range is not None and title(range) in stored:
+                return e({'range': range, 'values': stored[title(range)][key]})
+
+            return e({})
+
+        def batchGet(spreadsheetId=None, ranges=tuple(), valueRenderOption=None):
+            return e({'valueRanges': [v.get(range=r, valueRenderOption=valueRenderOption).value
+                                      for r in ranges]})
+
     class g:
-        def get(spreadsheetId=None, includeGridData=None, range=None):
-            return e
-        values = lambda : g
+        def get(spreadsheetId=None, includeGridData=None, range=None, ranges=None):
+            if not includeGridData:
+                return e(snapshot['meta'])
+
+            if isinstance(ranges, str):
+                ranges = ranges,
+
+            grids = [stored[t]['grid'] for t in map(title, ranges or [])
+                     if t in stored and stored[t]['grid']]
+            grid = dict(grids[0]) if grids else {}
+            grid['sheets'] = [sheet for gr in grids for sheet in gr['sheets']]
+            return e(grid)
+
+        values = lambda : v
+
+    class f:
+        def get(fileId=None, supportsAllDrives=None, fields=None):
+            return e(snapshot['meta_file'])
+
     class s:
         spreadsheets = lambda : g
+        files = lambda : f
 
     return s
 
@@ -229,6 +273,20 @@ def num_to_ab(n):
 
 def get_sheet_values(spreadsheet_name, sheet_name, fetch_grid=False, spreadsheet_service=None,
                      filter_cell=default_filter_cell, SPREADSHEET_ID=None):
+    return get_sheets_values(spreadsheet_name, [sheet_name], fetch_grid=fetch_grid,
+                             spreadsheet_service=spreadsheet_service,
+                             filter_cell=filter_cell,
+                             SPREADSHEET_ID=SPREADSHEET_ID)[sheet_name]
+
+
+def get_sheets_values(spreadsheet_name, sheet_names, fetch_grid=False, spreadsheet_service=None,
+                      filter_cell=default_filter_cell, SPREADSHEET_ID=None):
+    """ get_sheet_values for many sheets in a single spreadsheet at once
+
+        batchGet only takes one render option per request, so this is one
+        request for the formatted values of every sheet, one for formulas,
+        and one for the grids, instead of three requests per sheet """
+
     if SPREADSHEET_ID is None:
         SPREADSHEET_ID = auth.user_config.secrets('google', 'sheets', spreadsheet_name)
 
@@ -238,37 +296,47 @@ def get_sheet_values(spreadsheet_name, sheet_name, fetch_grid=False, spreadsheet
     else:
         ss = spreadsheet_service
 
-    result = ss.values().get(spreadsheetId=SPREADSHEET_ID, range=sheet_name).execute()
-    values = result.get('values', [])
+    sheet_names = list(sheet_names)
+    result = ss.values().batchGet(spreadsheetId=SPREADSHEET_ID, ranges=sheet_names).execute()
+    values = [vr.get('values', []) for vr in result.get('valueRanges', [])]
 
-    results_formula = ss.values().get(spreadsheetId=SPREADSHEET_ID, range=sheet_name,
-                                      valueRenderOption='FORMULA').execute()
-    values_formula = results_formula.get('values', [])
+    results_formula = ss.values().batchGet(spreadsheetId=SPREADSHEET_ID, ranges=sheet_names,
+                                           valueRenderOption='FORMULA').execute()
+    values_formula = [vr.get('values', []) for vr in results_formula.get('valueRanges', [])]
 
     if fetch_grid:
-        rm = len(values)
-        cm = max([len(c) for c in values])
-        cml = num_to_ab(cm)
-        ranges = f'{sheet_name}!$A$1:${cml}'
-        #ranges = result['range']  # overshoots, which is bad for the 1000 cell case
-
-        grid = ss.get(spreadsheetId=SPREADSHEET_ID,
-                      ranges=ranges,
-                      includeGridData=True).execute()
-
-        for sheet in grid['sheets']:
+        ranges = []
+        for sheet_name, vs in zip(sheet_names, values):
+            cm = max([len(c) for c in vs], default=1)
+            cml = num_to_ab(cm)
+            ranges.append(f'{sheet_name}!$A$1:${cml}')
+            #ranges = result['range']  # overshoots, which is bad for the 1000 cell case
+
+        grid_all = ss.get(spreadsheetId=SPREADSHEET_ID,
+                          ranges=ranges,
+                          includeGridData=True).execute()
+
+        for sheet in grid_all.get('sheets', []):
             sheet.pop('bandedRanges', None)
             for d in sheet['data']:
-                d.pop('rowMetadata')
-                d.pop('columnMetadata')
+                d.pop('rowMetadata', None)
+                d.pop('columnMetadata', None)
+
+    out = {}
+    for sheet_name, vs, vfs in zip(sheet_names, values, values_formula):
+        if fetch_grid:
+            grid = dict(grid_all)
+            grid['sheets'] = [sheet for sheet in grid_all.get('sheets', [])
+                              if sheet['properties']['title'] == sheet_name]
+            cells = get_cells_from_grid(grid, sheet_name, filter_cell)
+            cells_index = {(i, j):v for i, j, v in cells}
+        else:
+            grid = {}
+            cells_index = {}
 
-        cells = get_cells_from_grid(grid, sheet_name, filter_cell)
-        cells_index = {(i, j):v for i, j, v in cells}
-    else:
-        grid = {}
-        cells_index = {}
+        out[sheet_name] = vs, vfs, grid, cells_index
 
-    return values, values_formula, grid, cells_index
+    return out
 
 
 def get_cells_from_grid(grid, title, filter_cell):
@@ -696,6 +764,8 @@ class Sheet:
     sheet_name = None
     fetch_grid = False
     index_columns = tuple()
+    _snapshot_cache = False  # reuse values stored for the current revision
+    _snapshot_only = False  # replay stored values without network access
 
     def __init__(self, name=None, sheet_name=None,
                  fetch=True, fetch_grid=None,
@@ -759,6 +829,16 @@ class Sheet:
 
     _saf = None  # SIGH
     def _setup(self):
+        if self._snapshot_only:
+            snapshot = self._snapshot_load()
+            if snapshot is None:
+                log.warning(f'no snapshot for {self.name} at {self._snapshot_path()}')
+
+            service = _FakeService(snapshot)
+            self._drive_service = service.files()
+            self._spreadsheet_service = service.spreadsheets()
+            return
+
         if not hasattr(Sheet, '_Sheet__drive_service_ro'):
             service = _get_oauth_service(
                 api='drive', version='v3',
@@ -808,6 +888,74 @@ class Sheet:
         self._meta_file = resp
         return self._meta_file
 
+    @classmethod
+    def _snapshot_path(cls):
+        return (idlib.config.auth.get_path('cache-path') /
+                'sheets-snapshots' / f'{cls._sheet_id()}.json')
+
+    @classmethod
+    def _snapshot_load(cls):
+        path = cls._snapshot_path()
+        try:
+            with open(path, 'rt') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            log.warning(f'ignoring corrupt snapshot {path} {e}')
+            return None
+
+    @classmethod
+    def _snapshot_write(cls, snapshot):
+        path = cls._snapshot_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp, 'wt') as f:
+            json.dump(snapshot, f)
+
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _snapshot_has(snapshot, sheet_name, fetch_grid):
+        return (snapshot is not None and
+                sheet_name in snapshot['sheets'] and
+                (not fetch_grid or bool(snapshot['sheets'][sheet_name]['grid'])))
+
+    def _snapshot_current(self):
+        """ the stored snapshot if it matches the current revision
+            of the spreadsheet, otherwise a new empty one """
+        self.metadata_file()
+        # drive version is monotonic and bumped by any edit to the file
+        revision = self._meta_file.get('version')
+        snapshot = self._snapshot_load()
+        if snapshot is None or revision is None or snapshot['revision'] != revision:
+            snapshot = {'revision': revision,
+                        'meta': None,
+                        'meta_file': self._meta_file,
+                        'sheets': {}}
+
+        return snapshot
+
+    def _fetch_service(self, fetch_grid, fetch_meta, snapshot):
+        """ replay from the snapshot if it has this sheet, otherwise
+            the real service, in which case snapshot is updated in place """
+        if snapshot is None and self._snapshot_cache and not self._snapshot_only:
+            snapshot = self._snapshot_current()
+
+        if self._snapshot_has(snapshot, self.sheet_name, fetch_grid):
+            self._meta = copy.deepcopy(snapshot['meta'])
+            self._meta_file = copy.deepcopy(snapshot['meta_file'])
+            return _FakeService(snapshot).spreadsheets(), None
+
+        if fetch_meta or snapshot is not None:
+            self.metadata()
+            if snapshot is None:
+                self.metadata_file()
+            else:
+                snapshot['meta'] = self._meta
+
+        return self._spreadsheet_service, snapshot
+
     def _fetch_from_other_sheet(self, other):
         """ fix for rate limits when testing """
         self._meta = copy.deepcopy(other._meta)
@@ -820,7 +968,7 @@ class Sheet:
         self.cells_index = copy.deepcopy(other.cells_index)
 
     #fetch_count = 0
-    def fetch(self, fetch_grid=None, filter_cell=None, fetch_meta=True):
+    def fetch(self, fetch_grid=None, filter_cell=None, fetch_meta=True, _snapshot=None):
         """ update remote values (called automatically at __init__) """
         #self.__class__.fetch_count += 1
         #log.debug(f'fetch count: {self.__class__.fetch_count}')
@@ -828,18 +976,22 @@ class Sheet:
         if fetch_grid is None:
             fetch_grid = self.fetch_grid
 
-        if fetch_meta:
-            self.metadata()
-            self.metadata_file()
-
+        service, snapshot = self._fetch_service(fetch_grid, fetch_meta, _snapshot)
         values, values_formula, grid, cells_index = get_sheet_values(
             self.name,
             self.sheet_name,
-            spreadsheet_service=self._spreadsheet_service,
+            spreadsheet_service=service,
             fetch_grid=fetch_grid,
             filter_cell=filter_cell,
             SPREADSHEET_ID=self._sheet_id())
 
+        if snapshot is not None:
+            snapshot['sheets'][self.sheet_name] = {
+                'values': values, 'formula': values_formula, 'grid': grid}
+            if (self._snapshot_cache and not self._snapshot_only and
+                snapshot['revision'] is not None):
+                self._snapshot_write(snapshot)
+
         self.raw_values = values
         self._values = [list(r) for r in
                         zip(*itertools.zip_longest(*self.raw_values,
@@ -1515,3 +1667,48 @@ class Sheet:
                  for c in r] for r in self.values]
         table = AsciiTable(rows, title=self.title)
         return table.table
+
+
+def fetch_sheets(*sheets, fetch_grid=None, filter_cell=default_filter_cell):
+    """ fetch many Sheet instances, e.g. multiple tabs of one workbook,
+        with one batched set of requests per spreadsheet rather than
+        separate requests for every sheet """
+
+    by_id = {}
+    for sheet in sheets:
+        by_id.setdefault(sheet._sheet_id(), []).append(sheet)
+
+    for spreadsheet_id, group in by_id.items():
+        first = group[0]
+        grid = (any(s.fetch_grid for s in group)
+                if fetch_grid is None else fetch_grid)
+        if first._snapshot_cache and not first._snapshot_only:
+            snapshot = first._snapshot_current()
+        else:
+            first.metadata_file()
+            snapshot = {'revision': first._meta_file.get('version'),
+                        'meta': None,
+                        'meta_file': first._meta_file,
+                        'sheets': {}}
+
+        missing = [s.sheet_name for s in group
+                   if not first._snapshot_has(snapshot, s.sheet_name, grid)]
+        if missing:
+            snapshot['meta'] = first.metadata()
+            fetched = get_sheets_values(
+                first.name,
+                list(dict.fromkeys(missing)),
+                spreadsheet_service=first._spreadsheet_service,
+                fetch_grid=grid,
+                filter_cell=filter_cell,
+                SPREADSHEET_ID=spreadsheet_id)
+            for sheet_name, (values, values_formula, _grid, _) in fetched.items():
+                snapshot['sheets'][sheet_name] = {
+                    'values': values, 'formula': values_formula, 'grid': _grid}
+
+            if (first._snapshot_cache and not first._snapshot_only and
+                snapshot['revision'] is not None):
+                first._snapshot_write(snapshot)
+
+        for sheet in group:
+            sheet.fetch(fetch_grid=grid, filter_cell=filter_cell, _snapshot=snapshot)
@@ -8,6 +8,7 @@ import os
 import ast
 import inspect
 import logging
+import itertools
 from types import ModuleType
 from pathlib import Path
 from datetime import datetime, date, timezone
@@ -600,7 +601,69 @@ def _sigh(header, row, orig_row=None):
     return out
 
 
+class _Row(list):
+    """ a row of a byCol, a list of its values with the column names
+        as attributes, setting an item also sets it in the columns
+        and in the raw row """
+
+    def __init__(self, table, index):
+        super().__init__(itertools.chain((c[index] for c in table._columns),
+                                         table._extra.get(index, ())))
+        self._table = table
+        self._index = index
+        for name in table._shadows:
+            # columns named like list methods shadow them as they did
+            # when every column was set on the row as an attribute
+            setattr(self, name, self[table._positions[name]])
+
+    @property
+    def _fields(self):
+        return self._table.header
+
+    @property
+    def _header(self):
+        return self._table.header
+
+    def __getattr__(self, attr):
+        if attr in ('_table', '_index') or attr.startswith('__'):
+            raise AttributeError(attr)  # not yet set e.g. during unpickling
+
+        try:
+            return self[self._table._positions[attr]]
+        except KeyError as e:
+            raise AttributeError(attr) from e
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        table = self._table
+        ncols = len(table._columns)
+        k = key + len(self) if key < 0 else key
+        if 0 <= k < ncols:
+            table._columns[k][self._index] = value
+            name = table.header[k]
+            if name in table._shadows:
+                setattr(self, name, value)
+        else:
+            table._extra[self._index][k - ncols] = value
+
+        self._raw()[key] = value
+
+    def _asdict(self):
+        return {h:v for h, v in zip(self._table.header, self)}
+
+    def _raw(self):
+        return self._table._raw_rows[self._index]
+
+
 class byCol:
+    """ tabular data stored as one list per column
+
+        rows are lists that read through to and write through to the
+        columns, each is only created when it is first asked for, and
+        indexes are built on first search, so a table that is only
+        read by column holds a single copy of its values rather than
+        one per row plus one per column """
+
     # FIXME this class +is+ was unpickleable, lol python
     def __init__(self, rows, header=None, to_index=tuple()):
         # what I think is a pickleable version
@@ -613,24 +676,103 @@ class byCol:
         else:
             orig_header = _sigh(header, header)
 
-        # normalize row lenght  # FIXME account for rows longer than header
-        rows = [_sigh(header, row + [None] * (len(header) - len(row)), row) for row in rows]
-        #setattr(self, name, LOL_PYTHON(header, row))
+        nh = len(header)
+        # transpose and normalize row length in one pass, anything
+        # past the end of the header is kept off to the side per row
+        columns = [list(c) for c in zip(*(
+            row if len(row) == nh else
+            itertools.chain(row[:nh], itertools.repeat(None, nh - len(row)))
+            for row in rows))]
+        if not columns:
+            columns = [[] for _ in header]
 
         # so apparently using namedtuple dynamically breaks pickle LOL PYTHON LOL
         self.orig_header = orig_header
         self.header = _sigh(header, header)
-        self.rows = rows
+        self._raw_rows = rows
+        self._columns = columns
+        self._extra = {i:row[nh:] for i, row in enumerate(rows) if len(row) > nh}
+        self._positions = {name:i for i, name in enumerate(header)}
+        self._shadows = [name for name in header if hasattr(list, name)]
+        self._rows = None
+        self._row_cache = {}
         self.__indexes = {}
         for col_name in to_index:
-            hindex = self.header.index(col_name)
-            ind = {r[hindex]:r for r in self.rows}
-            ind[col_name] = self.header  # the header
-            self.__indexes[col_name] = ind
+            # fail early on a bad column but build the index on first use
+            self._key_positions(col_name)
+
+    def __getattr__(self, attr):
+        # columns are resolved on access instead of copied onto the instance
+        if attr in ('_positions', '_columns', '_row_cache') or attr.startswith('__'):
+            raise AttributeError(attr)  # not yet set e.g. during unpickling
+
+        try:
+            return self._columns[self._positions[attr]]
+        except KeyError as e:
+            raise AttributeError(attr) from e
+
+    def _row(self, index):
+        """ the row at index, created the first time it is asked for """
+        if self._rows is not None:
+            return self._rows[index]
+
+        try:
+            return self._row_cache[index]
+        except KeyError:
+            row = self._row_cache[index] = _Row(self, index)
+            return row
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            self._rows = [self._row(i) for i in range(len(self._raw_rows))]
+            self._row_cache = None  # rows now holds every row
+
+        return self._rows
+
+    def _key_positions(self, index):
+        names = (index,) if isinstance(index, str) else tuple(index)
+        try:
+            return [self._positions[n] for n in names]
+        except KeyError as e:
+            raise ValueError(f'{e.args[0]} is not in header {list(self.header)}') from e
+
+    def _index(self, index):
+        """ index is a column name or a tuple of column names, maps the
+            value or tuple of values to the positions of all rows with it """
+        if index not in self.__indexes:
+            try:
+                positions = self._key_positions(index)
+            except ValueError as e:
+                raise KeyError(index) from e
+
+            if len(positions) == 1:
+                keys = self._columns[positions[0]]
+            else:
+                keys = zip(*(self._columns[i] for i in positions))
+
+            ind = {}
+            for i, key in enumerate(keys):
+                ind.setdefault(key, []).append(i)
+
+            self.__indexes[index] = ind
 
-        for i, name in enumerate(header):
-            # so much for being dynamic!
-            setattr(self, name, [row[i] for row in self.rows])
+        return self.__indexes[index]
+
+    def searchIndex(self, index, value, raw=False):
+        """ the last row where index has value, the header if value is index """
+        if value == index:
+            # the header used to be stored in the index under its own name
+            row = self.header
+        else:
+            row = self._row(self._index(index)[value][-1])
+
+        return row._raw() if raw else row
+
+    def searchIndexAll(self, index, value, raw=False):
+        """ all rows where index has value in the order they appear """
+        return [self._raw_rows[i] if raw else self._row(i)
+                for i in self._index(index).get(value, ())]
 
     def ___new__(cls, rows, header=None, to_index=tuple()):
         """ to_index should be a list of normalized column
@@ -683,10 +825,6 @@ class byCol:
         for col in self.header:
             yield [col, *getattr(self, col)]
 
-    def searchIndex(self, index, value, raw=False):
-        row = self.__indexes[index][value]
-        return row._raw() if raw else row
-
     def __getitem__(self, key):
         return list(getattr(self, key))
 
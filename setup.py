@@ -108,6 +108,7 @@ setup(
     ],
     extras_require={'dev': ['pytest-cov', 'wheel'],
                     'spell': ['hunspell'],
+                    'xxhash': ['xxhash'],
                     'test': tests_require,
                    },
     entry_points={
@@ -1,5 +1,14 @@
+import io
+import os
+import json
+import time
+import shutil
+import tempfile
 import unittest
-from pyontutils.core import ilxtr
+from pathlib import Path
+import rdflib
+from pyontutils.core import ilxtr, Ont, OntGraph, build
+from pyontutils.namespaces import owl, rdf, rdfs
 from pyontutils.combinators import annotation
 
 annotation_ev = """ Axioms
@@ -33,3 +42,198 @@ class TestAnnotation(unittest.TestCase):
             raise AssertionError('should have failed')
         except TypeError:
             pass
+
+
+_temp_base = None
+
+
+def setUpModule():
+    global _temp_base
+    _temp_base = tempfile.mkdtemp()
+    (Path(_temp_base) / 'ttl').mkdir()
+    BuildOnt.local_base = _temp_base
+
+
+def tearDownModule():
+    shutil.rmtree(_temp_base)
+
+
+class BuildOnt(Ont):
+    _repo = False
+    source_file = 'test/test_core.py'  # plain path, skip remote lookup
+    path = 'ttl/'
+
+
+class BuildA(BuildOnt):
+    filename = 'build-a'
+    name = 'Build A'
+
+    def _triples(self):
+        time.sleep(0.5)  # make sure dependents actually wait
+        yield ilxtr.a, ilxtr.b, ilxtr.c
+
+
+class BuildB(BuildOnt):
+    filename = 'build-b'
+    name = 'Build B'
+
+    def _triples(self):
+        # runs in a worker, a exists only if it was made first
+        exists = (Path(_temp_base) / 'ttl/build-a.ttl').exists()
+        yield ilxtr.b, ilxtr.aExists, ilxtr.true if exists else ilxtr.false
+
+
+class BuildC(BuildOnt):
+    filename = 'build-c'
+    name = 'Build C'
+
+    def _triples(self):
+        yield ilxtr.c, ilxtr.d, ilxtr.e
+
+
+class BuildD(BuildOnt):
+    filename = 'build-d'
+    name = 'Build D'
+
+    def make(self, fail=False, write=True):
+        self.graph.bind('buildd', 'http://example.org/build-d/')
+        self.made_pid = os.getpid()
+        return super().make(fail=fail, write=write)
+
+    def _triples(self):
+        yield ilxtr.d, ilxtr.e, rdflib.URIRef('http://example.org/build-d/f')
+
+
+class TestBuild(unittest.TestCase):
+    def test_parallel(self):
+        onts = build(BuildA, BuildB, BuildC, n_jobs=3, depends={BuildB: (BuildA,)})
+        a, b, c = onts
+        assert (ilxtr.a, ilxtr.b, ilxtr.c) in a.graph
+        assert (ilxtr.b, ilxtr.aExists, ilxtr.true) in b.graph, 'dependency not respected'
+        assert (ilxtr.c, ilxtr.d, ilxtr.e) in c.graph
+        for name in ('a', 'b', 'c'):
+            assert (Path(_temp_base) / f'ttl/build-{name}.ttl').exists()
+
+    def test_serial_same(self):
+        pc, pd = build(BuildC, BuildD, n_jobs=3, write=False)
+        sc, sd = build(BuildC, BuildD, n_jobs=1, write=False)
+        assert pd.made_pid != os.getpid(), 'pool was not used'
+        assert sd.made_pid == os.getpid()
+        assert set(pc.graph) == set(sc.graph)
+        assert set(pd.graph) == set(sd.graph)
+        # prefixes bound during make survive the trip back from the worker
+        assert dict(pd.graph.namespaces()) == dict(sd.graph.namespaces())
+        assert pd.graph.namespace_manager.qname(
+            rdflib.URIRef('http://example.org/build-d/f')) == 'buildd:f'
+        assert 'buildd' in pd._graph.namespaces
+
+    def test_cycle(self):
+        try:
+            build(BuildA, BuildB, depends={BuildA: (BuildB,), BuildB: (BuildA,)})
+            raise AssertionError('should have failed')
+        except ValueError:
+            pass
+
+
+class TestNamespaceIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = OntGraph()
+        for prefix, namespace in (('obo', 'http://purl.obolibrary.org/obo/'),
+                                  ('UBERON', 'http://purl.obolibrary.org/obo/UBERON_'),
+                                  ('ex', 'http://example.org/'),
+                                  ('exa', 'http://example.org/a/'),):
+            self.graph.bind(prefix, namespace)
+
+        self.nm = self.graph.namespace_manager
+
+    def compute_qname(self, iri):
+        try:
+            prefix, namespace, name = rdflib.namespace.NamespaceManager.compute_qname(
+                self.nm, iri, generate=False)
+            return ':'.join((prefix, name)) if prefix else name
+        except (KeyError, ValueError):
+            return None
+
+    def test_matches_compute_qname(self):
+        iris = [rdflib.URIRef(i) for i in (
+            'http://purl.obolibrary.org/obo/UBERON_0000955',
+            'http://purl.obolibrary.org/obo/GO_0008150',
+            'http://purl.obolibrary.org/obo/',
+            'http://example.org/a/b',
+            'http://example.org/a/b/c',  # split namespace is not bound
+            'http://example.org/b',
+            'http://example.org/caf\u00e9',
+            'http://example.org/has space',
+            'http://unbound.example.org/a',)]
+        expect = [self.compute_qname(i) for i in iris]
+        assert self.nm.qnames(iris) == expect
+        assert expect[0] == 'UBERON:0000955' and expect[4] is None
+
+    def test_bind(self):
+        iri = rdflib.URIRef('http://example.org/a/b/c')
+        assert self.nm.qnames([iri]) == [None]
+        self.graph.bind('exab', 'http://example.org/a/b/')
+        assert self.graph.qname(iri) == 'exab:c'
+
+    def test_expands(self):
+        assert self.nm.expands(['UBERON:1', 'ex:b', 'nope:c', 'notacurie']) == [
+            rdflib.URIRef('http://purl.obolibrary.org/obo/UBERON_1'),
+            rdflib.URIRef('http://example.org/b'),
+            None,
+            None,]
+        assert self.nm.expand('exa:b') == rdflib.URIRef('http://example.org/a/b')
+
+    def test_bounded(self):
+        self.nm.index.maxsize = 10
+        self.nm.qnames(rdflib.URIRef(f'http://example.org/{i}') for i in range(100))
+        assert len(self.nm.index._cache) <= 10
+
+
+class TestOboGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = g = OntGraph()
+        g.bind('ilxtr', str(ilxtr))
+        g.bind('rdfs', str(rdfs))
+        g.bind('owl', str(owl))
+        for i in range(10):
+            g.add((ilxtr[f'c{i}'], rdf.type, owl.Class))
+            g.add((ilxtr[f'c{i}'], rdfs.label, rdflib.Literal(f'class {i}')))
+            if i:
+                g.add((ilxtr[f'c{i}'], rdfs.subClassOf, ilxtr[f'c{i // 2}']))
+
+        g.add((ilxtr.c3, owl.deprecated, rdflib.Literal(True)))
+        g.add((ilxtr.c9, rdfs.subClassOf, ilxtr.unlabeled))
+        r = rdflib.BNode()
+        g.add((ilxtr.c4, rdfs.subClassOf, r))
+        g.add((r, owl.onProperty, ilxtr.partOf))
+        g.add((r, owl.someValuesFrom, ilxtr.c1))
+
+    def test_as(self):
+        blob = self.graph.asOboGraph('rdfs:subClassOf', restriction=False)
+        assert len(blob['edges']) == 10, blob['edges']
+        nodes = {n['id']:n for n in blob['nodes']}
+        assert len(nodes) == 12, nodes  # c0 - c9, unlabeled, subClassOf
+        assert nodes['ilxtr:c3']['meta'] == {str(owl.deprecated): True}
+        assert nodes['ilxtr:c2']['lbl'] == 'class 2' and nodes['ilxtr:c2']['meta'] == {}
+        assert nodes['ilxtr:unlabeled']['lbl'] == str(ilxtr.unlabeled)
+
+    def test_restriction(self):
+        blob = self.graph.asOboGraph('ilxtr:partOf')
+        assert blob['edges'] == [{'sub': 'ilxtr:c4', 'pred': 'ilxtr:partOf', 'obj': 'ilxtr:c1'}]
+
+    def test_no_predicate(self):
+        blob = self.graph.asOboGraph()
+        assert len(blob['edges']) == len([t for t in self.graph
+                                          if not isinstance(t[-1], rdflib.Literal)])
+
+    def test_write(self):
+        for args in (('rdfs:subClassOf', None, False), ('ilxtr:partOf',), ('ilxtr:nothing',)):
+            file = io.StringIO()
+            self.graph.writeOboGraph(file, *args)
+            assert json.loads(file.getvalue()) == self.graph.asOboGraph(*args), args
+
+    def test_stream(self):
+        kinds = [k for k, _ in self.graph.iterOboGraph('rdfs:subClassOf', restriction=False)]
+        assert kinds == ['edges'] * 10 + ['nodes'] * 12, kinds
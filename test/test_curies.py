@@ -0,0 +1,69 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+from pathlib import Path
+from pyontutils import curies
+
+
+class TestCompiledCuries(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.temp)
+        self.source = self.temp / 'curie_map.yaml'
+        self.source.write_text('a: http://a.example.org/\nb: http://b.example.org/\n')
+        self.compiled = self.temp / 'cache' / 'curie_map.json'
+
+    def test_roundtrip(self):
+        expect = {'a': 'http://a.example.org/', 'b': 'http://b.example.org/'}
+        assert curies.getCuries(self.source, self.compiled) == expect
+        assert self.compiled.exists()
+        assert curies.loadCompiled(self.source, self.compiled) == expect
+
+    def test_stale(self):
+        curies.getCuries(self.source, self.compiled)
+        self.source.write_text('c: http://c.example.org/\n')
+        stat = self.source.stat()
+        os.utime(self.source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        assert curies.loadCompiled(self.source, self.compiled) is None
+        assert curies.getCuries(self.source, self.compiled) == {'c': 'http://c.example.org/'}
+
+    def test_version(self):
+        curies.getCuries(self.source, self.compiled)
+        compiled = json.loads(self.compiled.read_text())
+        compiled['version'] = 'old'
+        self.compiled.write_text(json.dumps(compiled))
+        assert curies.loadCompiled(self.source, self.compiled) is None
+
+    def test_corrupt(self):
+        self.compiled.parent.mkdir()
+        self.compiled.write_text('{"version": ')
+        assert curies.getCuries(self.source, self.compiled)['a'] == 'http://a.example.org/'
+
+
+class TestImportTime(unittest.TestCase):
+    budget = 2.5  # seconds, generous because ci machines are slow
+
+    def test_namespaces(self):
+        code = ('import time; start = time.perf_counter(); '
+                'import pyontutils.namespaces; '
+                'print(time.perf_counter() - start)')
+        env = os.environ.copy()
+        # warm the compiled curies and the bytecode first
+        subprocess.run([sys.executable, '-c', code], check=True, env=env,
+                       stdout=subprocess.DEVNULL)
+        out = subprocess.run([sys.executable, '-c', code], check=True, env=env,
+                             stdout=subprocess.PIPE).stdout
+        elapsed = float(out.decode().strip().rsplit('\n', 1)[-1])
+        assert elapsed < self.budget, f'import pyontutils.namespaces took {elapsed:.3f}s'
+
+    def test_qnamefix_no_core(self):
+        code = ('import sys, pyontutils.qnamefix; '
+                'print("pyontutils.core" in sys.modules)')
+        out = subprocess.run([sys.executable, '-c', code], check=True,
+                             stdout=subprocess.PIPE).stdout
+        assert out.decode().strip().rsplit('\n', 1)[-1] == 'False'
@@ -0,0 +1,41 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pyontutils.hierarchies import newTree, tcsizes, tcsort, dematerialize
+
+
+def make_tree(name, n=50):
+    Tree, _ = newTree(name, parent_dict={'shared': ['a', 'b']})
+    root = Tree()
+    shared = Tree()
+    for i in range(n):
+        shared[f'leaf-{i}']
+
+    root['root']['a']['shared'] = shared
+    root['root']['b']['shared'] = shared
+    root['root']['b']['c']['d']
+    return root
+
+
+class TestTree(unittest.TestCase):
+    def test_tcsizes(self):
+        root = make_tree('sizes')
+        sizes = tcsizes(root)
+        for node in (root, root['root'], root['root']['b']):
+            assert sizes[id(node)] == tcsort((None, node))
+
+        assert sizes[id(root['root']['a'])] == 51
+
+    def test_render(self):
+        root = make_tree('render')
+        dematerialize('root', root)
+        text = str(root)
+        assert text.startswith('root\n'), text
+        assert text.count('shared *') == 2, text
+        assert str(root) == text, 'render state leaked between calls'
+
+    def test_concurrent(self):
+        trees = [make_tree(f'concurrent-{i}', n=i + 10) for i in range(8)]
+        expect = [str(t) for t in trees]
+        with ThreadPoolExecutor(8) as exe:
+            for _ in range(5):
+                assert list(exe.map(str, trees)) == expect
@@ -1,3 +1,5 @@
+import time
+import hashlib
 import pytest
 import unittest
 import subprocess
@@ -7,8 +9,9 @@ from collections import Counter
 import rdflib
 import ttlser
 from pyontutils.core import yield_recursive, OntGraph, bnNone, OntResIri
-from pyontutils.identity_bnode import bnodes, IdentityBNode as IdentityBNodeBase, idf, it as ibn_it
-from pyontutils.namespaces import rdf, ilxtr
+from pyontutils.identity_bnode import bnodes, connected_records, IdentityBNode as IdentityBNodeBase, idf, it as ibn_it
+from pyontutils.identity_bnode import LRUCache
+from pyontutils.namespaces import rdf, rdfs, owl, ilxtr
 from .common import temp_path, ensure_temp_path, log
 
 
@@ -1620,6 +1623,209 @@ class TestIBNodeGraph1(TestIBNodeGraph):
     IdentityBNode = IdentityBNodeBase1
 
 
+class IdentityBNodeSymmetric(IdentityBNodeBase):
+    def __new__(cls, *args, debug=False, symmetric_predicates=tuple(), **kwargs):
+        if debug and symmetric_predicates != (ilxtr.sym,):  # only workers use debug
+            raise ValueError(f'worker got {symmetric_predicates}')
+
+        return super().__new__(cls, *args, debug=debug,
+                               symmetric_predicates=symmetric_predicates, **kwargs)
+
+
+class TestIBNodeParallel(unittest.TestCase):
+
+    IdentityBNode = IdentityBNodeBase
+
+    def test_same(self):
+        for fn in ('good', 'nasty', 'list-nasty', 'scogood'):
+            g = OntGraph().parse(Path(f'ttlser/test/{fn}.ttl'))
+            serial = self.IdentityBNode(g)
+            parallel = self.IdentityBNode(g, n_jobs=2)
+            assert serial.identity == parallel.identity, fn
+
+    def test_records(self):
+        bn = rdflib.BNode()
+        g = OntGraph().populate_from_triples((
+            (ilxtr.a, ilxtr.p, bn),
+            (ilxtr.b, ilxtr.p, bn),
+            (bn, ilxtr.p, ilxtr.c),
+            (ilxtr.c, ilxtr.p, ilxtr.a),
+            (ilxtr.d, ilxtr.p, rdflib.Literal('d')),))
+        groups = sorted(sorted(group) for group in connected_records(list(g)))
+        assert len(groups) == 3, groups
+        assert self.IdentityBNode(g) == self.IdentityBNode(g, n_jobs=2)
+
+    def test_symmetric(self):
+        g = OntGraph().populate_from_triples((
+            (ilxtr.b, ilxtr.sym, ilxtr.a),
+            (ilxtr.c, ilxtr.sym, ilxtr.d),
+            (ilxtr.e, ilxtr.p, ilxtr.f),))
+        kwargs = dict(symmetric_predicates=(ilxtr.sym,))
+        serial = self.IdentityBNode(g, **kwargs)
+        # the workers raise if the predicates do not reach them
+        parallel = IdentityBNodeSymmetric(g, n_jobs=2, **kwargs)
+        assert serial.identity == parallel.identity
+
+    def test_bench(self):
+        g = OntGraph()
+        for i in range(5000):
+            s = ilxtr[f'c{i}']
+            r = rdflib.BNode()
+            g.populate_from_triples((
+                (s, rdf.type, owl.Class),
+                (s, rdfs.label, rdflib.Literal(f'class {i}')),
+                (s, rdfs.subClassOf, r),
+                (r, rdf.type, owl.Restriction),
+                (r, owl.onProperty, ilxtr.hasPart),
+                (r, owl.someValuesFrom, ilxtr[f'c{i // 2}']),))
+
+        with self.IdentityBNode.cache_scope():
+            start = time.perf_counter()
+            serial = self.IdentityBNode(g)
+            t_serial = time.perf_counter() - start
+
+        with self.IdentityBNode.cache_scope():
+            start = time.perf_counter()
+            parallel = self.IdentityBNode(g, n_jobs=-1)
+            t_parallel = time.perf_counter() - start
+
+        log.info(f'{len(g)} triples serial {t_serial:.2f}s parallel {t_parallel:.2f}s')
+        assert serial.identity == parallel.identity
+
+
+class TestIBNodeEmbedded(unittest.TestCase):
+
+    IdentityBNode = IdentityBNodeBase
+
+    def test_embedded_identities(self):
+        g = OntGraph().parse(Path('ttlser/test/nasty.ttl'))
+        eids = self.IdentityBNode.embedded_identities(g)
+        assert set(eids) == set(g.named_subjects())
+        id_method = idf['(s ((p o) ...))']
+        self.IdentityBNode(g)
+        for s, i in eids.items():
+            assert i == self.IdentityBNode(s, id_method=id_method, in_graph=g), s
+
+        s = sorted(eids)[0]
+        assert list(self.IdentityBNode.embedded_identities(g, [s])) == [s]
+        assert self.IdentityBNode.embedded_identities([]) == {}
+
+
+class TestIBNodeCaches(unittest.TestCase):
+
+    def test_lru(self):
+        cache = LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        assert cache.get('a') == 1
+        cache['c'] = 3
+        assert 'a' in cache and 'c' in cache and 'b' not in cache
+        assert cache.get('b') is None
+        assert cache.info() == dict(hits=1, misses=1, evictions=1, size=2, maxsize=2)
+
+    def test_scope(self):
+        g = OntGraph().parse(Path('ttlser/test/nasty.ttl'))
+        version = IdentityBNodeBase.default_version
+        expect = IdentityBNodeBase(g)
+        before = IdentityBNodeBase._oi_cache_top[version]
+        with IdentityBNodeBase.cache_scope(oi_cache_maxsize=100) as caches:
+            assert IdentityBNodeBase._oi_cache_top[version] is caches['ordered_identity']
+            assert IdentityBNodeBase(list(g)) == expect
+            assert len(caches['ordered_identity']) == 100
+            assert caches['ordered_identity'].evictions
+
+        assert IdentityBNodeBase._oi_cache_top[version] is before
+        info = IdentityBNodeBase.cache_info()
+        assert info['ordered_identity'][version] == before.info()
+
+    def test_weight(self):
+        weigh = lambda k, v: len(v)
+        cache = LRUCache(None, maxweight=10, weigh=weigh)
+        cache['a'] = b'12345'
+        cache['b'] = b'12345'
+        assert cache.weight == 10 and len(cache) == 2
+        cache['c'] = b'1'
+        assert 'a' not in cache and cache.weight == 6, cache.info()
+        cache.pop('b')
+        assert cache.weight == 1
+        cache['c'] = b'123'
+        assert cache.weight == 3
+        del cache['c']
+        assert cache.weight == 0 and not len(cache)
+        with self.assertRaises(KeyError):
+            del cache['c']
+
+    def test_identity_function_bounded(self):
+        g = OntGraph().parse(Path('ttlser/test/nasty.ttl'))
+        version = IdentityBNodeBase.default_version
+        id_method = idf['(s ((p o) ...))']
+        subjects = set(g.named_subjects())
+        expect = IdentityBNodeBase(g).identity
+        expect_sids = {s: IdentityBNodeBase(s, id_method=id_method, in_graph=g)
+                       for s in subjects}
+        with IdentityBNodeBase.cache_scope(if_cache_maxsize=10) as caches:
+            if_cache, _, predicate_cache = caches['identity_function']
+            assert IdentityBNodeBase._if_cache_top[version][0] is if_cache
+            assert IdentityBNodeBase(g).identity == expect
+            assert if_cache.evictions
+            assert if_cache.info()['size'] <= 10
+            assert len(predicate_cache)
+            # the records of g are kept whole even though the memos are not
+            sids = {s: IdentityBNodeBase(s, id_method=id_method, in_graph=g)
+                    for s in subjects}
+            assert sids == expect_sids
+            info = IdentityBNodeBase.cache_info()
+            assert info['identity_function'][version] == if_cache.info()
+
+    def test_graph_evicted(self):
+        g = OntGraph().parse(Path('ttlser/test/nasty.ttl'))
+        id_method = idf['(s ((p o) ...))']
+        subjects = set(g.named_subjects())
+        IdentityBNodeBase(g, as_type=ibn_it['graph-combined'])
+        expect_rc = {s: IdentityBNodeBase(s, id_method=idf['record-combined'], in_graph=g)
+                     for s in subjects}
+        IdentityBNodeBase(g)
+        expect_sids = {s: IdentityBNodeBase(s, id_method=id_method, in_graph=g)
+                       for s in subjects}
+        with IdentityBNodeBase.cache_scope(if_cache_maxgraphs=1) as caches:
+            if_cache = caches['identity_function'][0]
+            IdentityBNodeBase(g)
+            for path in ('scogood', 'list-nasty'):
+                IdentityBNodeBase(OntGraph().parse(Path(f'ttlser/test/{path}.ttl')))
+
+            assert if_cache.graph_evictions
+            assert not [k for k in if_cache if k[0] is g]
+            # evicted records are recomputed not read back as missing
+            sids = {s: IdentityBNodeBase(s, id_method=id_method, in_graph=g)
+                    for s in subjects}
+            assert sids == expect_sids
+            IdentityBNodeBase(OntGraph().parse(Path('ttlser/test/scogood.ttl')))
+            rc = {s: IdentityBNodeBase(s, id_method=idf['record-combined'], in_graph=g)
+                  for s in subjects}
+            assert rc == expect_rc
+
+
+class TestIBNodeCyphers(unittest.TestCase):
+
+    def test_blake2b(self):
+        ident = IdentityBNodeBase(b'hello', version=3.1).identity
+        assert ident == hashlib.blake2b(b'hello', digest_size=32).digest()
+
+        g = OntGraph().parse(Path('ttlser/test/nasty.ttl'))
+        a = IdentityBNodeBase(g, version=3.1)
+        assert a.version == 3.1
+        assert a == IdentityBNodeBase(list(g), version=3.1)
+        assert a.identity != IdentityBNodeBase(g).identity
+        assert IdentityBNodeBase(b'hello').identity == hashlib.sha256(b'hello').digest()
+
+    def test_xxh3(self):
+        xxhash = pytest.importorskip('xxhash')
+        ident = IdentityBNodeBase(b'hello', version=3.2).identity
+        assert ident == xxhash.xxh3_128(b'hello').digest()
+        g = OntGraph().parse(Path('ttlser/test/nasty.ttl'))
+        assert IdentityBNodeBase(g, version=3.2) == IdentityBNodeBase(g, version=3.2, n_jobs=2)
+
+
 # test cross version issues
 
 class TextXVersion(unittest.TestCase):
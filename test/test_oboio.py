@@ -1,7 +1,9 @@
 import os
 import shutil
 import unittest
+from unittest import mock
 import pytest
+import rdflib
 from pyontutils import obo_io as oio
 from .common import temp_path, skipif_no_net
 
@@ -147,6 +149,53 @@ class TestOboIo(unittest.TestCase):
         assert obo1 == obo2 == obo3 != obor1
         assert obor1 == obor3
 
+    def test_stream(self):
+        of = oio.OboFile(data=obo_test_string)
+        stanzas = list(oio.iter_stanzas(obo_test_string.split('\n')))
+        assert isinstance(stanzas[0], oio.Header)
+        assert [s.id_.value for s in stanzas[1:]] == [
+            'UBERON:0000003', 'UBERON:0000033', 'UBERON:0000034', 'in_lateral_side_of']
+        assert ''.join(s.asObo() for s in stanzas[1:]) == ''.join(
+            s.asObo() for od in (of.Terms, of.Typedefs) for s in od.values())
+        triples = set(t for s in stanzas[1:] for t in s.triples())
+        assert triples == set(t for s in of.Terms.values() for t in s.triples()) | set(
+            t for s in of.Typedefs.values() for t in s.triples())
+
+    def test_escapes(self):
+        lines = ['format-version: 1.2 ', '', '[Term]', 'id: A:1 ',
+                 'name: split\\<newline>', 'over lines', '[Typedef]', 'id: r']
+        blocks = list(oio.iter_blocks(lines))
+        assert blocks == [(None, ['format-version: 1.2', '']),
+                          ('Term', ['id: A:1', 'name: split over lines']),
+                          ('Typedef', ['id: r'])], blocks
+
+    def test_curie_iri(self):
+        curies = oio.OntCuries.new()
+        with mock.patch.object(oio.OntId, '_namespaces', curies):
+            curies({'TMP': 'http://example.org/a/'})
+            assert oio._curie_iri('TMP:1') == rdflib.URIRef('http://example.org/a/1')
+            curies({'TMP': 'http://example.org/b/'})
+            assert oio._curie_iri('TMP:1') == rdflib.URIRef('http://example.org/b/1')
+
+    def test_lazy(self):
+        of = oio.OboFile(data=obo_test_string, lazy=True)
+        assert 'Terms' not in of.__dict__
+        assert of.asObo(stamp=False) == oio.OboFile(data=obo_test_string).asObo(stamp=False)
+        assert 'Terms' in of.__dict__
+
+    def test_write_obo(self):
+        of = oio.OboFile(data=obo_test_string)
+        expect = of.asObo(stamp=False)
+        path = temp_path / 'write-test.obo'
+        of.write(path, stamp=False, overwrite=True)
+        with open(path, 'rt') as f:
+            assert f.read() == expect
+
+        ttl = oio.OboFile(data=obo_test_string.replace(
+            'ontology:', 'default-namespace: uberon\nontology:'))
+        out = ttl.__ttl__()
+        assert 'UBERON_0000033' in out, out
+
     @skipif_no_net
     @pytest.mark.skipif(not shutil.which('robot'), reason='robot not installed')
     def test_robot_rt(self):
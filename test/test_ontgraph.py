@@ -22,6 +22,31 @@ class TestOntGraph(unittest.TestCase):
         assert ilxtr['evil-2'] not in sg1.subjects(unique=True)
         assert ilxtr['evil-2'] in sg2.subjects(unique=True)
 
+    def test_subjectIdentities(self):
+        g = OntGraph().parse(pathlib.Path('ttlser/test/nasty.ttl'))
+        sids = g.subjectIdentities()
+        assert sids is g.subjectIdentities()
+        assert set(sids) == set(g.named_subjects())
+        for s, i in sids.items():
+            assert i == g.subjectEmbeddedIdentity(s), s
+
+        s = sorted(sids)[0]
+        g.add((s, ilxtr.changed, rdflib.Literal('yes')))
+        nsids = g.subjectIdentities()
+        assert nsids is not sids
+        assert nsids[s] != sids[s]
+        assert nsids[s] == g.subjectEmbeddedIdentity(s)
+
+    def test_subjectIdentities_cycle(self):
+        # a free bnode cycle breaks the single pass but not the subjects
+        b1, b2 = rdflib.BNode(), rdflib.BNode()
+        g = OntGraph().populate_from_triples(((ilxtr.a, ilxtr.b, ilxtr.c),
+                                              (b1, ilxtr.p, b2),
+                                              (b2, ilxtr.p, b1)))
+        sids = g.subjectIdentities()
+        assert list(sids) == [ilxtr.a]
+        assert sids[ilxtr.a] == g.subjectEmbeddedIdentity(ilxtr.a)
+
 
 class TestOntGraphOps(unittest.TestCase):
     ts1 = ((ilxtr.a, ilxtr.b, ilxtr.c),)
@@ -109,6 +134,29 @@ class TestCycleCheckLong(unittest.TestCase):
         test_trips = trips[l:u]
         self._do_cycle(trips, test_trips)
 
+    def test_cycles_any(self):
+        nodes = [rdflib.BNode() for _ in range(100)]
+        trips = [(na, ilxtr.p, nb) for na, nb in zip(nodes[:-1], nodes[1:])]
+        g = OntGraph().populate_from_triples(trips)
+        assert not g.cycle_check_long_any()
+        g.add((nodes[50], ilxtr.c0, nodes[10]))
+        assert g.cycle_check_long_any()
+
+    def test_cycles_iter(self):
+        bn0, bn1, bn2 = [rdflib.BNode() for _ in range(3)]
+        trips = (
+            (bn0, ilxtr.p, bn1),
+            (bn1, ilxtr.p, bn0),
+            (bn1, ilxtr.p, bn2),
+            (bn2, ilxtr.p, bn2),
+            (bn2, ilxtr.p, ilxtr.c0),
+        )
+        g = OntGraph().populate_from_triples(trips)
+        cycles = g.cycle_check_long_iter()
+        assert not isinstance(cycles, list)
+        assert sorted(sorted(c) for c in cycles) == sorted(
+            [sorted(trips[:2]), [trips[3]]])
+
 
 class TestVersionHistory(unittest.TestCase):
     """
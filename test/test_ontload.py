@@ -1,8 +1,15 @@
 import json
+import shutil
+import tempfile
 import unittest
+import functools
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 import yaml
-from pyontutils.ontload import identity_json
+import rdflib
+from pyontutils.namespaces import owl
+from pyontutils.ontload import identity_json, local_imports, read_until, ImportHeaders
 
 
 class TestIdentityJson(unittest.TestCase):
@@ -25,3 +32,90 @@ class TestIdentityJson(unittest.TestCase):
             j = json.loads(json.dumps(y))
             ij = identity_json(j, sort_lists=sl)
             assert iy == ij, 'local determinism failure'
+
+
+class TestImportHeaders(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.temp)
+        self.local_base = self.temp / 'ont'
+        self.local_base.mkdir()
+        self.serve = self.temp / 'serve'
+        self.serve.mkdir()
+
+        handler = functools.partial(SimpleHTTPRequestHandler, directory=self.serve.as_posix())
+        handler.log_message = lambda *args: None
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.remote_ext = f'http://127.0.0.1:{self.server.server_port}/ext.owl'
+        self.remote_other = f'http://127.0.0.1:{self.server.server_port}/other.owl'
+
+        ttl = ('@prefix owl: <http://www.w3.org/2002/07/owl#> .\n'
+               '<http://example.org/ont/{name}.ttl> a owl:Ontology ;\n'
+               '    owl:imports <{imports}> .\n'
+               '### Classes\n{body}')
+        with open(self.local_base / 'a.ttl', 'wt') as f:
+            f.write(ttl.format(name='a', imports='http://example.org/ont/b.ttl',
+                               body='this is not turtle and must never be parsed\n' * 1000))
+        with open(self.local_base / 'b.ttl', 'wt') as f:
+            f.write(ttl.format(name='b', imports=self.remote_ext, body=''))
+        xml = ('<?xml version="1.0"?>\n'
+               '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"\n'
+               '         xmlns:owl="http://www.w3.org/2002/07/owl#">\n'
+               '  {ontology}\n'
+               '  <owl:Class rdf:about="http://example.org/ext.owl#C"/>\n'
+               '</rdf:RDF>\n')
+        with open(self.serve / 'ext.owl', 'wt') as f:
+            f.write(xml.format(ontology=(
+                '<owl:Ontology rdf:about="http://example.org/ext.owl">'
+                f'<owl:imports rdf:resource="{self.remote_other}"/>'
+                '</owl:Ontology>')))
+        with open(self.serve / 'other.owl', 'wt') as f:
+            f.write(xml.format(ontology='<owl:Ontology rdf:about="http://example.org/other.owl"/>'))
+
+    def test_read_until(self):
+        chunks = [b'ab#', b'#', b'#cd', b'ef']
+        raw, index = read_until(iter(chunks), b'###')
+        assert raw == b'ab###cd' and index == 2, (raw, index)
+        raw, index = read_until(iter(chunks), b'zzz')
+        assert raw == b'ab###cdef' and index == -1, (raw, index)
+
+    def _closure(self, headers):
+        start = (self.local_base / 'a.ttl').as_posix()
+        return local_imports('http://example.org/ont', self.local_base.as_posix(),
+                             [start], readonly=True, headers=headers)
+
+    def test_closure(self):
+        headers = ImportHeaders(cache_dir=self.temp / 'cache', workers=2)
+        triples = self._closure(headers)
+        imports = {(s, o) for s, p, o in triples if p == owl.imports}
+        assert imports == {
+            (rdflib.URIRef('http://example.org/ont/a.ttl'), rdflib.URIRef('http://example.org/ont/b.ttl')),
+            (rdflib.URIRef('http://example.org/ont/b.ttl'), rdflib.URIRef(self.remote_ext)),
+            (rdflib.URIRef(self.remote_ext), rdflib.URIRef('http://example.org/ext.owl')),
+            (rdflib.URIRef('http://example.org/ext.owl'), rdflib.URIRef(self.remote_other)),
+        }, imports
+        assert headers.stats == {'local': 2, 'remote': 2, 'cached': 0}, headers.stats
+
+        headers = ImportHeaders(cache_dir=self.temp / 'cache', workers=2)
+        assert self._closure(headers) == triples
+        assert headers.stats == {'local': 2, 'remote': 0, 'cached': 2}, headers.stats
+
+    def test_dead_import(self):
+        with open(self.local_base / 'b.ttl', 'rt') as f:
+            b = f.read()
+
+        with open(self.local_base / 'b.ttl', 'wt') as f:
+            f.write(b.replace(self.remote_ext, self.remote_ext.replace('ext.owl', 'missing.owl')))
+
+        headers = ImportHeaders(cache_dir=self.temp / 'cache', workers=2)
+        with headers:
+            triples = self._closure(headers)
+            assert headers._session is not None, 'caller owned headers were closed'
+
+        imports = {o for s, p, o in triples if p == owl.imports}
+        assert rdflib.URIRef(self.remote_ext.replace('ext.owl', 'missing.owl')) in imports
+        assert headers.stats['remote'] == 0, headers.stats
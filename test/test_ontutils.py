@@ -0,0 +1,112 @@
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pyontutils import ontutils
+from pyontutils.ontutils import LinkChecker, async_timeline
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """ /ok is fine, /nohead rejects HEAD, everything else 404s """
+
+    active = 0
+    max_active = 0
+    requests = []
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self, head):
+        with self.lock:
+            StandIn.active += 1
+            StandIn.max_active = max(StandIn.max_active, StandIn.active)
+            StandIn.requests.append((self.command, self.path))
+
+        time.sleep(0.05)
+        if self.path.startswith('/ok'):
+            status = 200
+        elif self.path.startswith('/nohead'):
+            status = 405 if head else 200
+        else:
+            status = 404
+
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        with self.lock:
+            StandIn.active -= 1
+
+    def do_HEAD(self):
+        self._respond(True)
+
+    def do_GET(self):
+        self._respond(False)
+
+
+class StandInServer(unittest.TestCase):
+
+    def setUp(self):
+        StandIn.requests = []
+        StandIn.max_active = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base = f'http://127.0.0.1:{self.server.server_port}'
+
+
+class TestLinkChecker(StandInServer):
+
+    def setUp(self):
+        super().setUp()
+        self.temp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.temp)
+
+    def checker(self, **kwargs):
+        return LinkChecker(cache_path=self.temp / 'links.sqlite', **kwargs)
+
+    def test_check(self):
+        report = LinkChecker.report(self.checker().check_all(
+            [f'{self.base}/ok', f'{self.base}/nohead', f'{self.base}/missing']))
+        results = {r['url'].rsplit('/', 1)[-1]: r for r in report['results']}
+        assert results['ok']['ok'] and results['ok']['method'] == 'HEAD'
+        assert results['nohead']['ok'] and results['nohead']['method'] == 'GET'
+        assert not results['missing']['ok'] and results['missing']['status'] == 404
+        assert report['failed'] == 1, report
+
+    def test_per_host(self):
+        urls = [f'{self.base}/ok/{i}' for i in range(20)]
+        report = LinkChecker.report(self.checker(per_host=2).check_all(urls))
+        assert report['ok'] == 20, report
+        assert StandIn.max_active <= 2, StandIn.max_active
+
+    def test_cache(self):
+        urls = [f'{self.base}/ok/{i}' for i in range(5)] + [f'{self.base}/missing']
+        list(self.checker().check_all(urls))
+        StandIn.requests = []
+        report = LinkChecker.report(self.checker().check_all(urls))
+        assert report['cached'] == 5, report
+        # failures are always rechecked by default
+        assert StandIn.requests == [('HEAD', '/missing'), ('GET', '/missing')], StandIn.requests
+
+
+class TestUrlBlaster(StandInServer):
+
+    def test_debug(self):
+        urls = [f'{self.base}/ok/{i}' for i in range(10)]
+        with mock.patch.object(ontutils, 'asyncVis') as vis, \
+             mock.patch('builtins.breakpoint'):
+            ontutils.url_blaster(urls, rate=100, debug=True)
+
+        collector, = vis.call_args.args
+        assert sorted(job for thread, job, start, stop in collector) == list(range(10))
+        by_thread = async_timeline(collector)
+        assert sum(len(jobs) for jobs, *_ in by_thread.values()) == 10, by_thread
+        for jobs, starts, stops, latencies in by_thread.values():
+            assert all(0 <= start <= stop for start, stop in zip(starts, stops))
+            assert all(latency >= 0.05 for latency in latencies), latencies
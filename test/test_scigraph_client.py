@@ -0,0 +1,165 @@
+import json
+import time
+import shutil
+import asyncio
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pyontutils.scigraph_client import Vocabulary, MemoryCache, SqliteCache
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """ fake /vocabulary/id/{id} """
+
+    counts = Counter()
+    queries = []
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        id = path.rsplit('/', 1)[-1]
+        with self.lock:
+            self.counts[id] += 1
+            count = self.counts[id]
+            StandIn.queries.append(query)
+
+        time.sleep(0.05)
+        if id.startswith('flaky') and count == 1:
+            self.send_response(503)
+            self.end_headers()
+            return
+        elif id.startswith('missing'):
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        body = json.dumps({'curie': id, 'labels': [id], 'deprecated': False}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StandInCase(unittest.TestCase):
+
+    def setUp(self):
+        StandIn.counts.clear()
+        StandIn.queries = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base = f'http://127.0.0.1:{self.server.server_port}'
+        self.sgv = Vocabulary(basePath=self.base, do_error=True)
+
+
+class TestCache(StandInCase):
+
+    def test_memory_lru(self):
+        cache = MemoryCache(maxsize=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        assert cache.get('a') == 1  # a is now most recent
+        cache['c'] = 3
+        assert 'b' not in cache
+        assert 'a' in cache and 'c' in cache
+        assert len(cache) == 2
+        assert cache.get('b') is None
+        assert cache.info() == dict(hits=1, misses=1, size=2, maxsize=2)
+
+    def test_sqlite_ttl(self):
+        temp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, temp)
+        cache = SqliteCache(temp / 'cache.sqlite', ttl=0.2)
+        cache['a'] = 1
+        assert cache.get('a') == 1
+        # persists across instances
+        assert SqliteCache(temp / 'cache.sqlite').get('a') == 1
+        time.sleep(0.3)
+        assert cache.get('a') is None
+        assert len(cache) == 1
+        cache.expire()
+        assert len(cache) == 0
+        info = cache.info()
+        assert (info['hits'], info['misses']) == (1, 1), info
+
+    def test_cache_info(self):
+        sgv = Vocabulary(basePath=self.base, cache=MemoryCache(maxsize=10))
+        sgv.findById('ILX:1')
+        sgv.findById('ILX:1')
+        sgv.findById('ILX:2')
+        assert StandIn.counts['ILX:1'] == 1, StandIn.counts
+        info = sgv.cache_info()
+        assert (info['hits'], info['misses'], info['size']) == (1, 2, 2), info
+        assert Vocabulary(basePath=self.base).cache_info() is None
+
+    def test_key_not_cached(self):
+        sgv = Vocabulary(basePath=self.base, cache=True)
+        sgv.api_key = 'secret-key'
+        sgv.findById('ILX:1')
+        assert 'key=secret-key' in StandIn.queries[0], StandIn.queries
+        keys = list(sgv._cache._data)
+        assert keys and not any('secret-key' in k for k in keys), keys
+        key = sgv._cache_key('GET', self.base + '/vocabulary/id/ILX:1',
+                             {'key': 'secret-key', 'a': 1})
+        assert 'secret-key' not in key and 'a=1' in key, key
+
+
+class TestBatch(StandInCase):
+
+    def test_map(self):
+        ids = [f'ILX:{i}' for i in range(100)]
+        start = time.time()
+        with self.sgv.batch(concurrency=20) as b:
+            records = b.map('findById', ids)
+
+        elapsed = time.time() - start
+        assert [r['curie'] for r in records] == ids
+        assert elapsed < 100 * 0.05, f'requests were not concurrent {elapsed}'
+
+    def test_coalesce(self):
+        async def main(b):
+            return await asyncio.gather(*(b.findById('ILX:dupe') for _ in range(10)))
+
+        with self.sgv.batch() as b:
+            records = asyncio.run(main(b))
+
+        assert len(records) == 10
+        assert StandIn.counts['ILX:dupe'] == 1, StandIn.counts
+        assert b.stats['coalesced'] == 9, b.stats
+
+    def test_retry(self):
+        with self.sgv.batch(backoff=0.01) as b:
+            record, = b.map('findById', ['flaky:1'])
+
+        assert record['curie'] == 'flaky:1'
+        assert StandIn.counts['flaky:1'] == 2
+        assert b.stats['retries'] == 1, b.stats
+
+    def test_retry_without_do_error(self):
+        sgv = Vocabulary(basePath=self.base)
+        with sgv.batch(backoff=0.01) as b:
+            record, missing = b.map('findById', ['flaky:2', 'missing:1'])
+
+        assert record['curie'] == 'flaky:2'
+        assert StandIn.counts['flaky:2'] == 2
+        assert missing is None
+        assert StandIn.counts['missing:1'] == 1, 'client errors are not retried'
+        assert b.stats['retries'] == 1, b.stats
+        # only the batch worker threads raise
+        assert sgv.findById('missing:2') is None
+
+    def test_map_in_running_loop(self):
+        async def main(b):
+            return b.map('findById', ['ILX:1'])
+
+        with self.sgv.batch() as b:
+            with self.assertRaises(RuntimeError):
+                asyncio.run(main(b))
@@ -1,6 +1,9 @@
 import os
 import pprint
+import shutil
+import tempfile
 import unittest
+from pathlib import Path
 import pytest
 import orthauth as oa
 from pyontutils import sheets
@@ -446,3 +449,125 @@ class TestSheets(unittest.TestCase):
         a = c.cells
         b = [c.row for c in c.cells]
         repr((a, b))
+
+
+class Counter:
+    """ count the requests that reach a service """
+
+    def __init__(self, obj, calls, path=''):
+        self._obj = obj
+        self._calls = calls
+        self._path = path
+
+    def __getattr__(self, attr):
+        return Counter(getattr(self._obj, attr), self._calls, f'{self._path}.{attr}')
+
+    def __call__(self, *args, **kwargs):
+        if self._path.endswith('.execute'):
+            self._calls.append(self._path[:-len('.execute')])
+            return self._obj(*args, **kwargs)
+
+        return Counter(self._obj(*args, **kwargs), self._calls, self._path)
+
+
+def grid(title, note):
+    return {'sheets': [{'properties': {'title': title},
+                        'data': [{'rowData': [{'values': [{'formattedValue': 'id',
+                                                           'note': note}]}]}]}]}
+
+
+class Replay(sheets.Sheet):
+    name = 'replay-test'
+    sheet_name = 'tests'
+    fetch_grid = True
+    _remote = None  # stands in for the google apis
+    _calls = None
+    _path = None
+
+    @classmethod
+    def _sheet_id(cls):
+        return 'replay-test-id'
+
+    @classmethod
+    def _snapshot_path(cls):
+        return cls._path
+
+    def _setup(self):
+        if self._snapshot_only:
+            return super()._setup()
+
+        service = Counter(sheets._FakeService(self._remote), self._calls)
+        self._drive_service = service.files()
+        self._spreadsheet_service = service.spreadsheets()
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        temp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, temp)
+        self.calls = []
+        self.remote = {
+            'revision': None,
+            'meta': {'properties': {'title': 'replay'}, 'sheets': []},
+            'meta_file': {'version': '1'},
+            'sheets': {
+                'tests': {'values': [['id', 'name'], ['a', '=A2']],
+                          'formula': [['id', 'name'], ['a', '=A2']],
+                          'grid': grid('tests', 'hello')},
+                'other': {'values': [['id'], ['b']],
+                          'formula': [['id'], ['b']],
+                          'grid': grid('other', 'there')},}}
+        self.Sheet = type('ReplaySheet', (Replay,), dict(
+            _remote=self.remote, _calls=self.calls,
+            _path=temp / 'replay.json', _snapshot_cache=True))
+
+    def test_batch(self):
+        service = Counter(sheets._FakeService(self.remote), self.calls).spreadsheets()
+        out = sheets.get_sheets_values(None, ['tests', 'other'], fetch_grid=True,
+                                       spreadsheet_service=service,
+                                       SPREADSHEET_ID='replay-test-id')
+        assert len(self.calls) == 3, self.calls
+        assert out['other'][0] == [['id'], ['b']]
+        assert out['tests'][3][0, 0]['note'] == 'hello'
+
+    def test_cache(self):
+        first = self.Sheet()
+        assert '.spreadsheets.values.batchGet' in self.calls, self.calls
+        assert self.Sheet._snapshot_path().exists()
+
+        self.calls.clear()
+        second = self.Sheet()
+        assert self.calls == ['.files.get'], self.calls
+        assert second.values == first.values
+        assert second.get_note(0, 0) == 'hello'
+
+        self.calls.clear()
+        self.remote['meta_file']['version'] = '2'
+        self.remote['sheets']['tests']['values'][1][0] = 'c'
+        third = self.Sheet()
+        assert '.spreadsheets.values.batchGet' in self.calls, self.calls
+        assert third.values[1][0] == 'c'
+
+    def test_offline(self):
+        first = self.Sheet()
+        self.calls.clear()
+        Offline = type('Offline', (self.Sheet,), dict(_snapshot_only=True))
+        offline = Offline()
+        assert not self.calls, self.calls
+        assert offline.values == first.values
+        assert offline.raw_values_formula == first.raw_values_formula
+        assert offline.get_note(0, 0) == 'hello'
+
+    def test_fetch_sheets(self):
+        Other = type('Other', (self.Sheet,), dict(sheet_name='other'))
+        tests, other = self.Sheet(fetch=False), Other(fetch=False)
+        sheets.fetch_sheets(tests, other)
+        assert self.calls.count('.spreadsheets.values.batchGet') == 2, self.calls
+        assert self.calls.count('.spreadsheets.get') == 2, self.calls  # meta and grid
+        assert other.values == [['id'], ['b']]
+        assert other.get_note(0, 0) == 'there'
+
+        self.calls.clear()
+        sheets.fetch_sheets(self.Sheet(fetch=False), Other(fetch=False))
+        assert self.calls == ['.files.get'], self.calls
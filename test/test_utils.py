@@ -1,8 +1,13 @@
 import ast
+import copy
+import json
+import time
+import pickle
+import asyncio
 import unittest
 from datetime import datetime, date
 from pyontutils import utils
-from pyontutils.utils import injective_dict, Async, deferred, listIn, asStr
+from pyontutils.utils import injective_dict, Async, deferred, listIn, asStr, byCol
 
 
 class TestInjectiveDict(unittest.TestCase):
@@ -63,6 +68,53 @@ class TestAsync(unittest.TestCase):
     def test_rate_empty(self):
         out = Async(rate=20)(deferred(lambda a:a)('lol') for _ in range(0))
 
+    def test_rate_limit(self):
+        a = Async(rate=20)
+        out = a(deferred(lambda a:a)(i) for i in range(21))
+        assert out == list(range(21))
+        assert a.stats['elapsed'] > 0.9, a.stats
+
+    def test_stream(self):
+        def slow(i):
+            time.sleep(0.1 * (3 - i))
+            return i
+
+        out = list(Async().stream((deferred(slow)(i) for i in range(3)), ordered=False))
+        assert out == [2, 1, 0], out
+
+    def test_coroutines(self):
+        async def co(i):
+            await asyncio.sleep(0.05)
+            return i
+
+        a = Async()
+        assert a(co(i) for i in range(100)) == list(range(100))
+        assert a.stats['elapsed'] < 1, a.stats
+
+    def test_nested(self):
+        def inner(i):
+            return sum(Async()(deferred(lambda a:a)(j) for j in range(50)))
+
+        out = Async()(deferred(inner)(i) for i in range(100))
+        assert out == [1225] * 100
+
+    def test_cancel(self):
+        a = Async()
+        gen = a.stream((deferred(time.sleep)(0.1) for _ in range(1000)), ordered=False)
+        next(gen)
+        gen.close()
+        assert a.stats['submitted'] < 1000, a.stats
+
+    def test_error(self):
+        def boom():
+            raise ValueError('boom')
+
+        try:
+            Async()([boom])
+            raise AssertionError('should have failed')
+        except ValueError:
+            pass
+
 
 class TestListIn(unittest.TestCase):
     def test(self):
@@ -74,6 +126,72 @@ class TestListIn(unittest.TestCase):
         assert listIn(['skip1>', 'skip1>', 'end', 'end'], ['skip1>', 'end']) == 1
 
 
+class TestByCol(unittest.TestCase):
+    def setUp(self):
+        self.raw = [['id', 'a label', 'kind'],
+                    ['x', 'X', 'a'],
+                    ['y'],
+                    ['z', 'Z', 'b', 'extra'],
+                    ['w', 'W', 'a']]
+        self.bc = byCol(self.raw, to_index=('id',))
+
+    def test_rows(self):
+        bc = self.bc
+        assert list(bc.header) == ['id', 'a_label', 'kind']
+        assert bc.a_label == ['X', None, 'Z', 'W']
+        assert bc['kind'] == ['a', None, 'b', 'a']
+        assert bc.rows[1] == ['y', None, None]
+        assert list(bc.rows[2]) == ['z', 'Z', 'b', 'extra']
+        assert bc.rows[0].a_label == 'X'
+        assert bc.rows[3]._asdict() == {'id': 'w', 'a_label': 'W', 'kind': 'a'}
+        assert bc.rows[1]._raw() is self.raw[2]
+        assert [list(c) for c in bc.cols][0] == ['id', 'x', 'y', 'z', 'w']
+        assert list(next(iter(bc))) == ['id', 'a label', 'kind']
+
+    def test_index(self):
+        bc = self.bc
+        assert bc.searchIndex('id', 'z').a_label == 'Z'
+        assert bc.searchIndex('id', 'z', raw=True) is self.raw[3]
+        assert bc.searchIndex('id', 'id') is bc.header
+        assert bc.searchIndex('kind', 'a').id == 'w'  # built on demand
+        assert [r.id for r in bc.searchIndexAll('kind', 'a')] == ['x', 'w']
+        assert bc.searchIndexAll(('kind', 'a_label'), ('a', 'X')) == [bc.rows[0]]
+        assert bc.searchIndexAll('kind', 'nope') == []
+        with self.assertRaises(KeyError):
+            bc.searchIndex('id', 'nope')
+        with self.assertRaises(KeyError):
+            bc.searchIndex('nope', 'x')
+        with self.assertRaises(ValueError):
+            byCol(self.raw, to_index=('nope',))
+
+    def test_list_method_names(self):
+        bc = byCol([['id', 'count', 'index'], ['a', '3', '7']])
+        row = bc.rows[0]
+        assert (row.count, row.index) == ('3', '7')
+        assert self.bc.rows[0].index('X') == 1
+        assert self.bc.rows[0].count('X') == 1
+
+    def test_set(self):
+        row = self.bc.rows[0]
+        row[1] = 'changed'
+        assert row.a_label == self.bc.a_label[0] == self.raw[1][1] == 'changed'
+
+    def test_list(self):
+        row = self.bc.searchIndex('id', 'z')
+        assert isinstance(row, list)
+        assert row is self.bc.rows[2]
+        assert json.dumps(row) == '["z", "Z", "b", "extra"]'
+        assert json.dumps(self.bc.rows[1]) == '["y", null, null]'
+        row.a_label = 'attr'
+        assert row.a_label == 'attr'
+        assert row[1] == self.bc.a_label[2] == 'Z'
+
+    def test_copy(self):
+        for bc in (pickle.loads(pickle.dumps(self.bc)), copy.deepcopy(self.bc)):
+            assert [list(r) for r in bc.rows] == [list(r) for r in self.bc.rows]
+            assert bc.searchIndex('id', 'x').a_label == 'X'
+
+
 class TestAstString(unittest.TestCase):
     def test_docstring(self):
         asdf = asStr(ast.parse("f'''i am a format docstring {_ddconf}'''"),
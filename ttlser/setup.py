@@ -16,7 +16,6 @@ with open('README.md', 'rt') as f:
     long_description = f.read()
 
 ttlfmt_require = ['docopt',
-                  'joblib',     # FIXME better if this were optional? or just use a PPE?
 ]
 tests_require = ['pytest'] + ttlfmt_require
 setup(
@@ -1,6 +1,14 @@
+import os
+import re
 import sys
+import shutil
+import tempfile
 import unittest
-from ttlser.ttlfmt import main
+from io import BytesIO, TextIOWrapper
+import rdflib
+from ttlser.ttlfmt import main, convert, write_atomic, FormatCache
+from ttlser.ttlfmt import schedule, MEMORY_PER_BYTE
+from ttlser.ttlfmt import parse, sniff, _head, SNIFF_BYTES
 
 f1 = 'test/good.ttl', 'test/f1.ttl'
 f2 = 'test/nasty.ttl', 'test/f2.ttl'
@@ -25,6 +33,61 @@ class TestTtlfmt(unittest.TestCase):
             raise AttributeError('failed with ' + str(self.argv)) from e
 
 
+class TestParallel(TestTtlfmt):
+    argv = ['ttlfmt', f1[1], f2[1]]
+
+
+class TestSchedule(unittest.TestCase):
+    def test_schedule(self):
+        files = f1[0], f2[0], 'test/evil.ttl'
+        ordered, n_jobs = schedule(files, n_jobs=8, memory=None)
+        sizes = [os.path.getsize(f) for f in ordered]
+        assert sizes == sorted(sizes, reverse=True)
+        assert n_jobs == 3
+        _, n_jobs = schedule(files, n_jobs=8, memory=sizes[0] * MEMORY_PER_BYTE)
+        assert n_jobs == 1
+
+
+class TestSniff(unittest.TestCase):
+    formats = {'xml': 'xml',
+               'json-ld': 'json-ld',
+               'nt': 'nt',
+               'nquads': 'nquads',
+               'trix': 'trix',
+               'trig': 'trig',
+               'n3': 'ttl',  # plain graphs serialize to the turtle subset
+               'turtle': 'ttl',
+               'nifttl': 'ttl',}
+
+    def setUp(self):
+        self.graph = rdflib.ConjunctiveGraph()
+        self.graph.parse(f1[0], format='turtle')
+
+    def test_sniff(self):
+        for format, expect in self.formats.items():
+            data = self.graph.serialize(format=format, encoding='utf-8')
+            assert sniff(data[:SNIFF_BYTES]) == expect, format
+            assert sniff(data, complete=True) == expect, format
+
+    def test_sniff_other(self):
+        assert sniff(b'@prefix : <x#> .\n{ :a :b :c } => { :a :b :d } .') == 'n3'
+        assert sniff(b'') is None
+        assert sniff(b'not rdf at all') is None
+
+    def test_stdin(self):
+        for format in self.formats:
+            data = self.graph.serialize(format=format, encoding='utf-8')
+            stdin = TextIOWrapper(BytesIO(data))
+            graph, _ = parse(stdin, 'turtle', None)
+            assert len(graph) == len(self.graph), format
+
+    def test_not_a_file(self):
+        assert _head('http://example.org/missing.ttl') == (None, False)
+        uri = 'file://' + os.path.abspath(f1[0])
+        graph, _ = parse(uri, 'turtle', None)
+        assert len(graph) == len(self.graph)
+
+
 class TestXml(TestTtlfmt):
     argv = ['ttlfmt', f1[0], '--outfmt', 'xml', '--output', 'test/good.owl']
     argv2 = ['ttlfmt', 'test/good.owl', '--outfmt', 'ttl', '--output', 'test/good2.ttl']
@@ -34,3 +97,80 @@ class TestXml(TestTtlfmt):
 
     def test_run_2(self):
         super().test_run()
+
+
+class TestWriteAtomic(unittest.TestCase):
+    path = 'test/f3.ttl'
+    def setUp(self):
+        with open(f1[0], 'rb') as s, open(self.path, 'wb') as d:
+            self.original = s.read()
+            d.write(self.original)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_failure_keeps_original(self):
+        def dump(stream):
+            stream.write(b'@prefix ')
+            raise ValueError('serialization failed part way')
+
+        try:
+            write_atomic(self.path, dump)
+            raise AssertionError('should have failed')
+        except ValueError:
+            pass
+
+        with open(self.path, 'rb') as f:
+            assert f.read() == self.original
+
+        assert not [p for p in os.listdir('test') if p.startswith('.ttlfmt-')]
+
+    def test_symlink(self):
+        link = 'test/f3-link.ttl'
+        os.symlink(os.path.basename(self.path), link)
+        self.addCleanup(os.unlink, link)
+        write_atomic(link, lambda stream: stream.write(b'# replaced\n'))
+        assert os.path.islink(link)
+        with open(self.path, 'rb') as f:
+            assert f.read() == b'# replaced\n'
+
+    def test_hardlink(self):
+        link = 'test/f3-hardlink.ttl'
+        os.link(self.path, link)
+        self.addCleanup(os.unlink, link)
+        write_atomic(link, lambda stream: stream.write(b'# replaced\n'))
+        assert os.path.samefile(link, self.path)
+        with open(self.path, 'rb') as f:
+            assert f.read() == b'# replaced\n'
+
+    def test_stream(self):
+        convert(self.path)
+        with open(self.path, 'rb') as f:
+            # shared bnodes get fresh ids on every parse
+            nobn = lambda b: re.sub(rb'_:\w+', b'_:', b)
+            actual = f.read().rsplit(b'\n', 2)[0]  # drop versioninfo
+            assert nobn(actual) == nobn(self.original)
+
+
+class TestCache(unittest.TestCase):
+    path = 'test/f4.ttl'
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        with open(f2[0], 'rb') as s, open(self.path, 'wb') as d:
+            d.write(s.read())
+
+    def tearDown(self):
+        os.unlink(self.path)
+        shutil.rmtree(self.cache_dir)
+
+    def test_cache(self):
+        cache = FormatCache(self.cache_dir)
+        assert convert(self.path, cache=cache) == 'miss'
+        assert convert(self.path, cache=cache) == 'hit'
+        with open(self.path, 'ab') as f:
+            f.write(b'\n<http://example.org/s> a <http://example.org/C> .\n')
+
+        assert convert(self.path, cache=cache) == 'miss'
+        assert convert(self.path, cache=cache) == 'hit'
+        other = FormatCache(self.cache_dir, outfmt='cmpttl')
+        assert convert(self.path, cache=other) == 'miss'
@@ -317,6 +317,7 @@ class CustomTurtleSerializer(TurtleSerializer):
         super(CustomTurtleSerializer, self).__init__(store)
         self.litsortkey = self.make_litsortkey(self.sortkey)
         self.rank_init = 0
+        self._index()
         #self.terminals = set(s for s in self.store.subjects(RDF.type, None) if isinstance(s, URIRef))
         self.predicate_rank = self._PredRank()
         self.object_rank = self._LitUriRank()
@@ -398,43 +399,97 @@ class CustomTurtleSerializer(TurtleSerializer):
         # hopefully reduce any memory load?
         self.list_rankers = None
         self._list_helpers = None
-
-    def _BNodeRank(self):
-        empty = []
+        self._rank_index = None
+
+    def _index(self):
+        """ Collect everything the rankers need in a single pass over
+            the store so that they do not have to requery it for every
+            node and every fixed point iteration. """
+        predicates = set()
+        literals = []
+        urirefs = set()
         bnodes = {}
         rerank = {}
+        po_index = {}
+        first_subjects = {}
+        rest_objects = set()
         for t in self.store:
+            s, p, o = t
+            predicates.add(p)
+            if s in po_index:
+                po_index[s].append((p, o))
+            elif not isinstance(s, URIRef):  # only bnode ranking needs these
+                po_index[s] = [(p, o)]
+
+            if p == RDF.first:
+                first_subjects[s] = None
+            elif p == RDF.rest:
+                rest_objects.add(o)
+
+            if isinstance(o, Literal):
+                literals.append(o)
+
             for i, v in enumerate(t):
-                if isinstance(v, BNode) or isinstance(v, QuotedGraph):
+                if isinstance(v, URIRef):
+                    urirefs.add(v)
+                elif isinstance(v, BNode) or isinstance(v, QuotedGraph):
                     if v not in bnodes:
-                        bnodes[v] = [[empty for _ in range(self.npreds)],
-                                     [empty for _ in range(self.npreds)],
-                                     [[], []]]
-                    if i == 2:
-                        if isinstance(t[0], URIRef):
-                            if v not in rerank:
-                                rerank[v] = []
-                            rerank[v].append(self.object_rank[t[0]])
+                        bnodes[v] = None
+                    if i == 2 and isinstance(s, URIRef):
+                        if v not in rerank:
+                            rerank[v] = []
+                        rerank[v].append(s)
+
+        list_starts = [s for s in first_subjects if s not in rest_objects]
+        self._rank_index = dict(predicates=predicates,
+                                literals=literals,
+                                urirefs=urirefs,
+                                bnodes=bnodes,
+                                rerank=rerank,
+                                po=po_index,
+                                list_starts=list_starts)
+
+    def _BNodeRank(self):
+        empty = []
+        index = self._rank_index
+        po_index = index['po']
+        bnodes = {v:[[empty for _ in range(self.npreds)],
+                     [empty for _ in range(self.npreds)],
+                     [[], []]]
+                  for v in index['bnodes']}
+        rerank = {v:[self.object_rank[s] for s in subjects]
+                  for v, subjects in index['rerank'].items()}
 
         max_worst_case = len(bnodes) + self.max_or + 2
         mwc = [max_worst_case]
         mwcm1 = [max_worst_case - 1]
         def smwc(l):
             return [_ if _ else mwc for _ in l]
+        # visible ranks are fixed after one_time so only normalize them once
+        vis_norm = {}
         def normalize():
+            out = {}
             for node, (vl, il, (listlists)) in bnodes.items():
-                if node in self.nosort:  # FIXME slow, break out before?
-                    continue
-                for l in vl + il + listlists:  # FIXME SLOW
-                    if not (l is empty or l is mwc):
-                        l.sort()
-            return {k:[smwc(v), smwc(i), smwc(ll)]
-                    for k, (v, i, ll) in bnodes.items()}
-        def rank():
+                nosort = node in self.nosort
+                if node not in vis_norm:
+                    if not nosort:
+                        for l in vl:
+                            if not (l is empty or l is mwc):
+                                l.sort()
+                    vis_norm[node] = smwc(vl)
+                if not nosort:
+                    for l in il + listlists:
+                        if not (l is empty or l is mwc):
+                            l.sort()
+                out[node] = [vis_norm[node], smwc(il), smwc(listlists)]
+            return out
+        def rank(norm=None):
+            if norm is None:
+                norm = normalize()
             old_ls = None
             out = {}
             i = 0  # skip zero so we don't overwrite it
-            for nb, ls in sorted(normalize().items(), key=lambda t: t[1]):
+            for nb, ls in sorted(norm.items(), key=lambda t: t[1]):
                 if ls != old_ls:
                     i += 1
                 old_ls = ls
@@ -459,8 +514,7 @@ class CustomTurtleSerializer(TurtleSerializer):
                 rank_vecs[2][1] = []
                 if n in self.list_rankers:
                     rank_vecs[2][1].extend(self.list_rankers[n].irank_vec(ranks))
-                for p, o in self.store.predicate_objects(n):
-                    # TODO speedup by not looking up from store every time
+                for p, o in po_index.get(n, ()):
                     if o not in self.object_rank:
                         if p == RDF.first or p == RDF.rest:
                             # these are the list ranker head cases
@@ -481,7 +535,7 @@ class CustomTurtleSerializer(TurtleSerializer):
                     continue
                 if n in self.list_rankers and self.list_rankers[n].vis_vals:
                     list_vis_rank.extend(self.list_rankers[n].rank_vec)
-                for p, o in self.store.predicate_objects(n):
+                for p, o in po_index.get(n, ()):
                     if p == RDF.first or p == RDF.rest:
                         # these are the list ranker head cases
                         continue
@@ -511,7 +565,7 @@ class CustomTurtleSerializer(TurtleSerializer):
                 break
             else:
                 old_norm = norm
-                irank = rank()
+                irank = rank(norm)
                 fixedpoint(irank)
 
         pair_rank = {}
@@ -573,7 +627,8 @@ class CustomTurtleSerializer(TurtleSerializer):
         return out
 
     def _PredRank(self):
-        pr = sorted(sorted(set(self.store.predicates(None, None)),
+        predicates = self._rank_index['predicates']
+        pr = sorted(sorted(predicates,
                            key=self.store.qname),
                     key=lambda p: self.sortkey(self.store.qname(p)))
         # predicates in predicateOrder go first but are not guranteed to arrive
@@ -597,27 +652,38 @@ class CustomTurtleSerializer(TurtleSerializer):
         self.npreds = len(self.predicateOrder)
         return {o:i for i, o in
                 enumerate(
-                    sorted(set((_ for _ in self.store.predicates())),
+                    sorted(predicates,
                            key=self.predicateOrder.index))}
 
     def _LitUriRank(self):
+        index = self._rank_index
+        qname = self.store.qname
+        qnames = {u:qname(u) for u in index['urirefs']}
+        literals = index['literals']
+        if all(l.value is None or l.value == str(l) for l in literals):
+            # litsortkey only ties literals with the same datatype and language
+            # and for those Literal.__gt__ compares values, falling back to str,
+            # so when every value is its lexical form skip its slow rich
+            # comparison and tie break on str directly, not so for xsd:token
+            # and friends where the value keeps the whitespace str drops
+            literals = sorted(literals, key=str)
+        else:
+            literals = sorted(literals)
+
         return {o:i  # global rank for all Literals and URIRefs
                 for i, o in
                 enumerate(
                     sorted(  # doublesort needed for stability wrt case for literals
-                           sorted((_ for _ in self.store.objects()
-                                   if isinstance(_, Literal))),
+                           literals,
                            key=self.litsortkey) +
                     sorted(
-                        sorted(set(_ for t in self.store for _ in t
-                                   if isinstance(_, URIRef)),
-                               key=self.store.qname),
-                        key=lambda _: self.sortkey(self.store.qname(_))))}
+                        sorted(index['urirefs'],
+                               key=qnames.__getitem__),
+                        key=lambda _: self.sortkey(qnames[_])))}
 
     def _ListRank(self):
         list_rankers = {}
-        list_starts = (s for s in self.store.subjects(RDF.first, None)
-                       if not tuple(self.store.subjects(RDF.rest, s)))
+        list_starts = self._rank_index['list_starts']
         for s in (*self.store.subjects(RDF.type, RDF.List), *list_starts):
             list_rankers[s] = ListRanker(s, self)
         return list_rankers
@@ -726,6 +792,30 @@ class CustomTurtleSerializer(TurtleSerializer):
         # Make sorted list of properties
         return sorted(properties, key=lambda p: self.predicate_rank[p])
 
+    def preprocess(self):  # modified to bucket predicate object pairs by subject
+        po = self._po = {}
+        for triple in self.store.triples((None, None, None)):
+            self.preprocessTriple(triple)
+            s, p, o = triple
+            if s in po:
+                po[s].append((p, o))
+            else:
+                po[s] = [(p, o)]
+
+    def buildPredicateHash(self, subject):  # modified to reuse buckets from preprocess
+        """
+        Build a hash key by predicate to a list of objects for the given
+        subject
+        """
+        properties = {}
+        for p, o in self._po.get(subject, ()):
+            if p in properties:
+                properties[p].append(o)
+            else:
+                properties[p] = [o]
+
+        return properties
+
     def _buildPredicateHash(self, subject):  # XXX unmodified
         """
         Build a hash key by predicate to a list of objects for the given
@@ -786,7 +876,7 @@ class CustomTurtleSerializer(TurtleSerializer):
             return False
         while l:
             if l != RDF.nil:
-                po = list(self.store.predicate_objects(l))
+                po = self._po.get(l, ())
                 if (RDF.type, RDF.List) in po and len(po) == 3:
                     pass
                 elif len(po) != 2:
@@ -28,13 +28,19 @@ Options:
     --curies-from=F parse using curies from file F
     --noreord       do not reorder lists when serializing
     --id-swap       use consecutive integers for bnode ids
+    --cache-dir=DIR skip files already formatted, as recorded in DIR
 
 """
 import os
+import re
 import sys
-from io import StringIO, TextIOWrapper
+import shutil
+import hashlib
+import tempfile
+from io import BytesIO, StringIO, TextIOWrapper
 from json.decoder import JSONDecodeError
-from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from docopt import docopt, parse_defaults
 import rdflib
 from rdflib.plugins.parsers.notation3 import BadSyntax
@@ -80,6 +86,72 @@ formats = ('ttl', 'json-ld', None, 'xml', 'n3', 'nt', 'nquads', 'trix',
            'trig', 'hturtle', 'rdfa', 'mdata', 'rdfa1.0', 'html')
 
 
+SNIFF_BYTES = 16384
+
+_iri = r'<[^>\s]*>'
+_subject = r'(?:' + _iri + r'|_:\S+)'
+_object = (r'(?:' + _iri + r'|_:\S+|"(?:[^"\\]|\\.)*"'
+           r'(?:@[A-Za-z0-9-]+|\^\^' + _iri + r')?)')
+_nt_line = re.compile(r'^\s*' + _subject + r'\s+' + _iri + r'\s+' + _object +
+                      r'\s*\.\s*(?:#.*)?$')
+_nq_line = re.compile(r'^\s*' + _subject + r'\s+' + _iri + r'\s+' + _object +
+                      r'\s+' + _subject + r'\s*\.\s*(?:#.*)?$')
+_xml_start = re.compile(r'^<(?:\?xml|!--|!DOCTYPE|[A-Za-z_][\w.-]*(?::[\w.-]+)?[\s>/])')
+_json_start = re.compile(r'^(?:\[|\{\s*(?:"|\}|$))')
+_directive = re.compile(r'^\s*(?:@prefix|@base|prefix\s|base\s)', re.IGNORECASE | re.MULTILINE)
+_n3_only = re.compile(r'=>|@forAll|@forSome|@keywords')
+_graph_block = re.compile(r'^\s*(?:GRAPH\s+)?(?:' + _iri + r'|[\w-]*:[\w.-]*|_:\S+)?\s*\{',
+                          re.MULTILINE)
+
+
+def sniff(head, complete=False):
+    """ Guess the rdflib parser for a document from its first few KB.
+        Returns None when the content does not clearly identify a format.
+        If complete is False the last line of head may be cut short. """
+    if isinstance(head, bytes):
+        head = head.decode('utf-8', errors='replace')
+
+    text = head.lstrip('\ufeff \t\r\n')
+    if not text:
+        return None
+
+    lines = text.splitlines()
+    if not complete and len(lines) > 1:
+        lines = lines[:-1]
+
+    content = [l for l in lines if l.strip() and not l.lstrip().startswith('#')]
+    if content:
+        if all(_nt_line.match(l) for l in content):
+            return 'nt'
+        elif all(_nt_line.match(l) or _nq_line.match(l) for l in content):
+            return 'nquads'
+
+    if _xml_start.match(text):
+        return 'trix' if '<TriX' in text else 'xml'
+    elif _json_start.match(text):
+        return 'json-ld'
+    elif _n3_only.search(text):
+        return 'n3'
+    elif _graph_block.search(text):
+        return 'trig'
+    elif _directive.search(text):
+        return 'ttl'
+
+
+def _head(source):
+    """ the first SNIFF_BYTES of a local source and whether that is all
+        of it, anything else such as a url is left to rdflib """
+    if isinstance(source, BytesIO):
+        with source.getbuffer() as view:
+            return view[:SNIFF_BYTES].tobytes(), len(view) <= SNIFF_BYTES
+    elif isinstance(source, str) and os.path.isfile(source):
+        with open(source, 'rb') as f:
+            head = f.read(SNIFF_BYTES + 1)
+            return head[:SNIFF_BYTES], len(head) <= SNIFF_BYTES
+    else:
+        return None, False
+
+
 def bind_curies(g, namespace_manager):
     for prefix, namespace in namespace_manager.namespaces():
         g.bind(prefix, namespace)
@@ -91,14 +163,19 @@ def parse(source, format_guess, outpath, graph=None, infmt=None, graph_class=GRA
         bind_curies(graph, use_nsm)
 
     errors = []
+    if type(source) == TextIOWrapper:  # stdin can't reset so read it exactly once
+        source = BytesIO(source.buffer.read())
+
     if infmt:
         format_guess = infmt
+    else:
+        head, complete = _head(source)
+        if head is not None:
+            sniffed = sniff(head, complete)
+            if sniffed is not None:
+                format_guess = sniffed
 
     for format in (format_guess, *(f for f in formats if f != format_guess)):
-        # TODO we don't need to reset just saved parsed streams to the point where they fail?
-        if type(source) == TextIOWrapper:  # stdin can't reset
-            src = source.read()
-            source = StringIO(src)
         try:
             graph.parse(source=source, format=format)
             a = next(iter(graph))
@@ -112,7 +189,7 @@ def parse(source, format_guess, outpath, graph=None, infmt=None, graph_class=GRA
             if infmt:  # or format_guess != None:
                 raise e
             errors.append(e)
-            if type(source) == StringIO:
+            if isinstance(source, (StringIO, BytesIO)):
                 source.seek(0)
     raise BadSyntax(str(errors)) from errors[0]
 
@@ -134,7 +211,14 @@ def serialize(graph, outpath, outfmt=defaults['--outfmt'],
     else:
         kwargs = {}
 
-    out = graph.serialize(format=outfmt, encoding='utf-8', **kwargs)
+    def dump(stream):
+        # the serializers write each block to the stream as it is
+        # emitted so the full output is never held in memory
+        graph.serialize(stream, format=outfmt, encoding='utf-8', **kwargs)
+
+    if nowrite or profile:
+        with open(os.devnull, 'wb') as f:
+            dump(f)
 
     if nowrite:
         sys.stderr.write('FILE NOT WRITTEN {}\n'.format(outpath))
@@ -143,20 +227,130 @@ def serialize(graph, outpath, outfmt=defaults['--outfmt'],
     if profile:
         sys.stderr.write('PARSING Success {}\n'.format(outpath))
     elif not isinstance(outpath, str):  # FIXME not a good test that it is stdout
-        outpath.buffer.write(out)
+        dump(outpath.buffer)
+        outpath.buffer.flush()
     else:
+        write_atomic(outpath, dump)
+
+
+def write_atomic(outpath, dump):
+    """ stream into a temporary file next to outpath and then replace
+        outpath so that a failure part way through serialization never
+        leaves a truncated file behind, outpath is usually also the input
+
+        a symlinked outpath replaces the file it points to, a file with
+        other hardlinks is written in place since replacing it would
+        split it off from its other links """
+    outpath = os.path.realpath(outpath)
+    if os.path.exists(outpath) and os.stat(outpath).st_nlink > 1:
         with open(outpath, 'wb') as f:
-            f.write(out)
+            dump(f)
+
+        return
+
+    outdir = os.path.dirname(outpath)
+    fd, temppath = tempfile.mkstemp(dir=outdir, prefix='.ttlfmt-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            dump(f)
+
+        if os.path.exists(outpath):
+            shutil.copymode(outpath, temppath)
+        else:
+            os.chmod(temppath, 0o666 & ~_umask())
+
+        os.replace(temppath, outpath)
+    except BaseException:
+        if os.path.exists(temppath):
+            os.unlink(temppath)
+
+        raise
+
+
+def _umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+class FormatCache:
+    """ On disk record of file contents that are already formatted.
+
+        Entries are keyed by the sha256 of the file contents together with
+        the ttlser and rdflib versions, the serializer, and any flags that
+        change the output. An entry is only recorded for the bytes that
+        ttlfmt itself wrote, so a hit means the file is unchanged since it
+        was last formatted and parsing and serializing can be skipped. """
+
+    def __init__(self, cache_dir, outfmt=defaults['--outfmt'], infmt=None, flags=tuple()):
+        from ttlser import __version__
+        self.cache_dir = os.path.expanduser(cache_dir)
+        serializer = rdflib.plugin.get(outfmt, rdflib.serializer.Serializer)
+        self.context = '\n'.join((
+            __version__,
+            rdflib.__version__,
+            outfmt,
+            serializer.__module__ + '.' + serializer.__qualname__,
+            getattr(serializer, '_CustomTurtleSerializer__version', ''),
+            str(infmt),
+            *sorted(flags),)).encode()
+
+    def key(self, data):
+        m = hashlib.sha256()
+        m.update(self.context)
+        m.update(b'\0')
+        m.update(data)
+        return m.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def check(self, data):
+        return os.path.exists(self._path(self.key(data)))
+
+    def record(self, data):
+        path = self._path(self.key(data))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb'):
+            pass
 
 
 def convert(file_or_list_or_stream, outpath=None, stream=False,
             infmt=None, outfmt=defaults['--outfmt'],
-            debug=False, profile=False, nowrite=False, graph_class=GRAPHCLASS, use_nsm=None):
+            debug=False, profile=False, nowrite=False, graph_class=GRAPHCLASS, use_nsm=None,
+            cache=None, timings=None):
+    """ when a cache is used and files are formatted in place
+        returns 'hit' or 'miss' for single files or a list of them
+        if timings is a dict the parse and serialize times for a single
+        file are recorded in it """
     if stream or type(file_or_list_or_stream) == str:
         file_or_stream = file_or_list_or_stream
-        serialize(*parse(**prepare(file_or_stream, outpath, stream),
-                         infmt=infmt, use_nsm=use_nsm),
+        # only files formatted in place can be skipped
+        use_cache = (cache is not None and not stream and outpath is None and
+                     not (debug or profile or nowrite))
+        if use_cache:
+            path = os.path.expanduser(file_or_stream)
+            with open(path, 'rb') as f:
+                data = f.read()
+
+            if cache.check(data):
+                return 'hit'
+
+        start = perf_counter()
+        graph, outpath = parse(**prepare(file_or_stream, outpath, stream),
+                               infmt=infmt, use_nsm=use_nsm)
+        parsed = perf_counter()
+        serialize(graph, outpath,
                   outfmt=outfmt, debug=debug, profile=profile, nowrite=nowrite)
+        if timings is not None:
+            timings['parse'] = parsed - start
+            timings['serialize'] = perf_counter() - parsed
+
+        if use_cache:
+            with open(path, 'rb') as f:
+                cache.record(f.read())
+
+            return 'miss'
     else:
         # file list is used here because this allows is to merge files
         # without any additional code if we pass it more than one file
@@ -169,9 +363,107 @@ def convert(file_or_list_or_stream, outpath=None, stream=False,
             serialize(graph, outpath, outfmt=outfmt,
                       debug=debug, profile=profile, nowrite=nowrite)
         else:
-            [convert(file, infmt=infmt, outfmt=outfmt,
-                     debug=debug, profile=profile,
-                     graph_class=graph_class, use_nsm=use_nsm) for file in file_list]
+            return [convert(file, infmt=infmt, outfmt=outfmt,
+                            debug=debug, profile=profile,
+                            graph_class=graph_class, use_nsm=use_nsm,
+                            cache=cache) for file in file_list]
+
+
+# rough peak memory for parsing and serializing a file, in multiples of its size
+MEMORY_PER_BYTE = 40
+
+
+def available_memory():
+    """ bytes of memory available for new work or None if unknown """
+    try:
+        with open('/proc/meminfo', 'rt') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def schedule(files, n_jobs=None, memory=None):
+    """ order files largest first so that the biggest files start
+        immediately instead of being the last stragglers, and pick a
+        pool size that fits the cores and the memory needed to hold
+        the largest files in flight at the same time """
+    sizes = {f:os.path.getsize(os.path.expanduser(f)) for f in files}
+    ordered = sorted(files, key=lambda f: sizes[f], reverse=True)
+    if n_jobs is None:
+        n_jobs = available_cpus()
+
+    n_jobs = max(1, min(n_jobs, len(ordered)))
+    if memory is None:
+        memory = available_memory()
+
+    if memory is not None:
+        need = 0
+        for i, f in enumerate(ordered[:n_jobs]):
+            need += sizes[f] * MEMORY_PER_BYTE
+            if need > memory:
+                n_jobs = max(1, i)
+                break
+
+    return ordered, n_jobs
+
+
+def _convert_job(file, kwargs):
+    timings = {}
+    result = convert(file, timings=timings, **kwargs)
+    return result, timings
+
+
+def convert_parallel(files, n_jobs=None, **kwargs):
+    """ convert files in place across a process pool reporting each
+        file as it completes, errors do not stop the other files and
+        the first one is raised once everything else has finished """
+    ordered, n_jobs = schedule(files, n_jobs)
+    results = []
+    errors = []
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = {executor.submit(_convert_job, file, kwargs):file for file in ordered}
+        for future in as_completed(futures):
+            file = futures[future]
+            try:
+                result, timings = future.result()
+            except Exception as e:
+                sys.stderr.write('FAILED {} {!r}\n'.format(file, e))
+                errors.append(e)
+                continue
+
+            results.append(result)
+            if timings:
+                msg = '{} parse {:.2f}s serialize {:.2f}s\n'.format(
+                    file, timings['parse'], timings['serialize'])
+            else:
+                msg = '{} {}\n'.format(file, result)
+
+            sys.stderr.write(msg)
+
+    if errors:
+        raise errors[0]
+
+    return results
+
+
+def report_cache(results):
+    hits = sum(1 for r in results if r == 'hit')
+    misses = sum(1 for r in results if r == 'miss')
+    sys.stderr.write('cache hits {} misses {}\n'.format(hits, misses))
 
 
 def pipe_debug(*args, source=None, graph=None, outpath=None, **kwargs):
@@ -240,6 +532,16 @@ def main():
     if args['--id-swap']:
         CustomTurtleSerializer._do_id_swap = True
 
+    if args['--cache-dir']:
+        flags = tuple(f for f in ('--noreord', '--id-swap') if args[f])
+        if args['--curies-from']:
+            with open(args['--curies-from'], 'rb') as f:
+                flags += ('--curies-from=' + hashlib.sha256(f.read()).hexdigest(),)
+
+        cache = FormatCache(args['--cache-dir'], outfmt=outfmt, infmt=infmt, flags=flags)
+    else:
+        cache = None
+
     if not files:
         from ttlser.utils import readFromStdIn
         stdin = readFromStdIn(sys.stdin)
@@ -256,22 +558,22 @@ def main():
             if lenfiles == 1:
                 files,  = files
 
-            convert(files, outpath=outpath,
-                    infmt=infmt, outfmt=outfmt,
-                    debug=debug, profile=profile,
-                    nowrite=nowrite, use_nsm=use_nsm)
+            results = convert(files, outpath=outpath,
+                              infmt=infmt, outfmt=outfmt,
+                              debug=debug, profile=profile,
+                              nowrite=nowrite, use_nsm=use_nsm,
+                              cache=cache)
+            if isinstance(results, str):
+                results = results,
         else:
-            from joblib import Parallel, delayed
-            nj = 9
-            if lenfiles < nj:
-                nj = lenfiles
-
-            Parallel(n_jobs=nj, verbose=10)(delayed(convert)
-                                            (file,
-                                             infmt=infmt, outfmt=outfmt,
-                                             debug=debug, profile=profile,
-                                             nowrite=nowrite)
-                                            for file in files)
+            results = convert_parallel(files,
+                                       infmt=infmt, outfmt=outfmt,
+                                       debug=debug, profile=profile,
+                                       nowrite=nowrite,
+                                       cache=cache)
+
+        if cache is not None:
+            report_cache(results or tuple())
 
 
 if __name__ == '__main__':